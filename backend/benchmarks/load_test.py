@@ -0,0 +1,419 @@
+"""
+Load test - simulated pair-programming rooms against the real Flask-SocketIO app
+
+Starts the mock OpenAI server (services/mock_openai_server.py) in this process and the backend
+in a subprocess pointed at it (LLM_PROVIDER=mock, MOCK_LLM_URL), then connects rooms x users Socket.IO clients. Each user fires events
+as a Poisson process at the configured per-user rates:
+  update / cursor          keystroke code deltas and cursor moves
+  chat_message             chat, a share of it addressed to Bob ("@bob ...")
+  voice_activity_detected  speech start events
+  run_code / analysis      POST /api/run-code and /api/analyze-code-block
+
+Socket events are sent with an ack, so their latency is the server round trip including the
+handler. Clients also time AI replies to @bob messages (ai_reply) and the first audio chunk
+after an AI message (tts_first_chunk), and report playback complete like the frontend.
+The server's RSS and thread count are sampled from /proc while the test runs.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --rooms 10 --users-per-room 2 --duration 30
+    python benchmarks/load_test.py --mongo memory --llm-latency-ms 800 --json results.json
+    python benchmarks/load_test.py --mock-script script.json --seed 7
+    python benchmarks/load_test.py --url http://localhost:5000   # already running server, no mock
+
+Needs python-socketio's client extras (pip install "python-socketio[client]"). Without
+websocket-client the clients fall back to long-polling, which can drop under audio traffic.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+import socketio
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, SRC_DIR)
+
+from services.mock_openai_server import MockScript, default_script, start_mock_server  # noqa: E402
+NAMESPACE = '/ws'
+
+# Runs the backend in the subprocess; MONGO_MODE=memory swaps MongoDB for mongomock
+SERVER_LAUNCHER = """
+import os, sys
+sys.path.insert(0, os.getcwd())
+if os.environ.get('LOAD_TEST_MONGO') == 'memory':
+    import mongomock
+    from mongoengine import connect, disconnect
+    import database.db as db
+    def init_db():
+        disconnect()
+        connect('load_test', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+        db._mongodb_enabled = True
+        print("✅ Using in-memory MongoDB (mongomock)")
+    db.init_db = init_db
+import app
+app.socketio.run(app.app, host='127.0.0.1', port=int(os.environ['LOAD_TEST_PORT']), allow_unsafe_werkzeug=True)
+"""
+
+SNIPPETS = (
+    "def two_sum(nums, target):\n    seen = {}\n",
+    "    for i, n in enumerate(nums):\n",
+    "        if target - n in seen:\n            return [seen[target - n], i]\n",
+    "        seen[n] = i\n    return []\n",
+)
+CHAT_LINES = ("I think we need a loop here", "what about the empty case?", "let me try running it",
+              "that looks right to me", "should we use a dict?")
+MENTION_LINES = ("@bob can you check our approach?", "@bob why does this fail?", "@bob any hint?")
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latency samples and error counts per event type"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, event: str, seconds: float):
+        with self._lock:
+            self.samples[event].append(seconds * 1000)
+
+    def error(self, event: str):
+        with self._lock:
+            self.errors[event] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        with self._lock:
+            events = sorted(set(self.samples) | set(self.errors))
+            result = {}
+            for event in events:
+                values = sorted(self.samples[event])
+                result[event] = {
+                    'count': len(values),
+                    'errors': self.errors[event],
+                    'throughput_per_s': round(len(values) / elapsed, 2) if elapsed else 0,
+                    'p50_ms': round(percentile(values, 50), 2),
+                    'p95_ms': round(percentile(values, 95), 2),
+                    'p99_ms': round(percentile(values, 99), 2),
+                    'max_ms': round(values[-1], 2) if values else 0,
+                }
+            return result
+
+
+class ProcessSampler:
+    """Samples a process's RSS and thread count from /proc/<pid>/status"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (rss_mb, threads)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="process-sampler", daemon=True)
+
+    def read(self):
+        rss_kb = threads = None
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb = int(line.split()[1])
+                    elif line.startswith('Threads:'):
+                        threads = int(line.split()[1])
+        except OSError:
+            return None
+        return (round(rss_kb / 1024, 1) if rss_kb else None, threads)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sample = self.read()
+            if sample:
+                self.samples.append(sample)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        if not self.samples:
+            return {}
+        rss = [s[0] for s in self.samples if s[0] is not None]
+        threads = [s[1] for s in self.samples if s[1] is not None]
+        return {
+            'rss_mb_start': rss[0] if rss else None,
+            'rss_mb_peak': max(rss) if rss else None,
+            'rss_mb_end': rss[-1] if rss else None,
+            'threads_peak': max(threads) if threads else None,
+            'threads_end': threads[-1] if threads else None,
+        }
+
+
+class SimulatedUser:
+    """One Socket.IO client in a room, firing events at the configured rates"""
+
+    def __init__(self, url: str, room: str, index: int, rates: dict, mention_ratio: float,
+                 recorder: Recorder, seed: int, listen: bool):
+        self.url = url
+        self.room = room
+        self.user_id = f"load-{room}-u{index}"
+        self.rates = {event: rate for event, rate in rates.items() if rate > 0}
+        self.mention_ratio = mention_ratio
+        self.recorder = recorder
+        self.random = random.Random(seed)
+        self.http = requests.Session()
+        self.client = socketio.Client(reconnection=False)
+        self.code = ""
+        self.pending_mentions = []  # send times of @bob messages awaiting a reply
+        self.ai_messages = {}  # AI message id -> time the chat message arrived
+        self._lock = threading.Lock()
+        if listen:
+            self.client.on('chat_message', self._on_chat_message, namespace=NAMESPACE)
+            self.client.on('ai_audio_chunk', self._on_audio_chunk, namespace=NAMESPACE)
+
+    # Server -> client
+    def _on_chat_message(self, message):
+        if not message.get('isAI'):
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self.ai_messages[message.get('id')] = now
+            sent = self.pending_mentions.pop(0) if self.pending_mentions else None
+        if sent is not None:
+            self.recorder.record('ai_reply', now - sent)
+
+    def _on_audio_chunk(self, chunk):
+        message_id = chunk.get('messageId')
+        with self._lock:
+            arrived = self.ai_messages.get(message_id)
+            if chunk.get('chunkNumber') == 1 and arrived and not chunk.get('isComplete'):
+                self.recorder.record('tts_first_chunk', time.perf_counter() - arrived)
+            if not chunk.get('isComplete'):
+                return
+            self.ai_messages.pop(message_id, None)
+        self.client.emit('ai_audio_playback_complete', {'room': self.room, 'messageId': message_id}, namespace=NAMESPACE)
+
+    # Client -> server
+    def _call(self, event: str, data: dict):
+        started = time.perf_counter()
+        try:
+            self.client.call(event, data, namespace=NAMESPACE, timeout=30)
+            self.recorder.record(event, time.perf_counter() - started)
+        except Exception:
+            self.recorder.error(event)
+
+    def _post(self, name: str, path: str, body: dict):
+        started = time.perf_counter()
+        try:
+            response = self.http.post(self.url + path, json=body, timeout=60)
+            if response.status_code >= 500:
+                raise RuntimeError(response.status_code)
+            self.recorder.record(name, time.perf_counter() - started)
+        except Exception:
+            self.recorder.error(name)
+
+    def connect(self):
+        started = time.perf_counter()
+        self.client.connect(self.url, namespaces=[NAMESPACE], wait_timeout=30)
+        self._call('join', {'room': self.room, 'username': self.user_id})
+        self.recorder.record('connect', time.perf_counter() - started)
+
+    def fire(self, event: str):
+        if event == 'update':
+            self.code = (self.code + self.random.choice(SNIPPETS))[-4000:]
+            self._call('update', {'room': self.room, 'delta': self.code, 'sourceId': self.user_id})
+        elif event == 'cursor':
+            self._call('cursor', {'room': self.room, 'userId': self.user_id,
+                                  'position': {'lineNumber': self.random.randint(1, 40), 'column': self.random.randint(1, 60)}})
+        elif event == 'chat_message':
+            mention = self.random.random() < self.mention_ratio
+            content = self.random.choice(MENTION_LINES if mention else CHAT_LINES)
+            if mention:
+                with self._lock:
+                    self.pending_mentions.append(time.perf_counter())
+            self._call('chat_message', {
+                'room': self.room, 'content': content, 'username': self.user_id, 'userId': self.user_id,
+                'id': f"{self.user_id}-{time.time_ns()}", 'timestamp': time.time()
+            })
+        elif event == 'voice_activity':
+            self._call('voice_activity_detected', {'room': self.room, 'userId': self.user_id, 'event': 'speechstart'})
+        elif event == 'run_code':
+            self._post('run_code', '/api/run-code', {'code': self.code or 'print(1)', 'language': 'python', 'room_id': self.room})
+        elif event == 'analysis':
+            self._post('analysis', '/api/analyze-code-block', {
+                'code': self.code or 'print(1)', 'language': 'python', 'roomId': self.room,
+                'aiMode': 'shared', 'userId': self.user_id, 'context': {}
+            })
+
+    def run(self, deadline: float):
+        events = list(self.rates)
+        weights = [self.rates[event] for event in events]
+        total_rate = sum(weights)
+        while total_rate and time.perf_counter() < deadline:
+            time.sleep(min(self.random.expovariate(total_rate), max(0.0, deadline - time.perf_counter())))
+            if time.perf_counter() >= deadline:
+                break
+            self.fire(self.random.choices(events, weights)[0])
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_backend(port: int, mock_url: str, mongo: str, log_path: str):
+    env = dict(os.environ)
+    env.update({
+        'LLM_PROVIDER': 'mock',
+        'MOCK_LLM_URL': mock_url,
+        'LOAD_TEST_PORT': str(port),
+        'LOAD_TEST_MONGO': mongo,
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'WARNING'),
+    })
+    if mongo != 'uri':
+        env.pop('MONGODB_URI', None)
+    log_file = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, '-c', SERVER_LAUNCHER], cwd=SRC_DIR, env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(150):
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} (see --server-log)")
+        try:
+            if requests.get(url + '/', timeout=1).ok:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Backend did not start within 30s")
+
+
+def run(args) -> dict:
+    mock = process = sampler = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        if args.mock_script:
+            script = MockScript.from_file(args.mock_script, args.seed)
+        else:
+            script = MockScript(default_script(args.llm_latency_ms, args.tts_latency_ms, args.respond_ratio), args.seed)
+        mock = start_mock_server(0, script)
+        process, url = start_backend(free_port(), f"http://127.0.0.1:{mock.server_port}/v1", args.mongo, args.server_log)
+        sampler = ProcessSampler(process.pid).start()
+
+    rates = {
+        'update': args.update_rate, 'cursor': args.cursor_rate, 'chat_message': args.chat_rate,
+        'voice_activity': args.voice_rate, 'run_code': args.run_code_rate, 'analysis': args.analysis_rate,
+    }
+    recorder = Recorder()
+    users = [
+        SimulatedUser(url, f"load-room-{room}", index, rates, args.mention_ratio, recorder,
+                      seed=args.seed * 10007 + room * 101 + index, listen=(index == 0))
+        for room in range(args.rooms) for index in range(args.users_per_room)
+    ]
+
+    try:
+        for user in users:
+            user.connect()
+            time.sleep(args.ramp / max(1, len(users)))
+        started = time.perf_counter()
+        workers = [threading.Thread(target=user.run, args=(started + args.duration,), daemon=True) for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        time.sleep(args.drain)  # let in-flight AI replies and audio arrive
+    finally:
+        for user in users:
+            user.close()
+        server_stats = sampler.stop() if sampler else {}
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        if mock:
+            mock.shutdown()
+
+    return {
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'server_log')},
+        'elapsed_s': round(elapsed, 2),
+        'events': recorder.summary(elapsed),
+        'server': server_stats,
+        'mock_requests': mock.RequestHandlerClass.script.snapshot_stats() if mock else {},
+    }
+
+
+def print_report(result: dict):
+    print(f"\n{'event':<26}{'count':>8}{'err':>6}{'per s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for event, stats in result['events'].items():
+        print(f"{event:<26}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_per_s']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    server = result['server']
+    if server:
+        print(f"\nserver RSS MB  : start {server['rss_mb_start']}  peak {server['rss_mb_peak']}  end {server['rss_mb_end']}")
+        print(f"server threads : peak {server['threads_peak']}  end {server['threads_end']}")
+    if result['mock_requests']:
+        print(f"mock requests  : {result['mock_requests']}")
+    print(f"elapsed        : {result['elapsed_s']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--users-per-room', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load after all users joined")
+    parser.add_argument('--ramp', type=float, default=2, help="seconds over which users connect")
+    parser.add_argument('--drain', type=float, default=3, help="seconds to wait for replies after the load stops")
+    parser.add_argument('--seed', type=int, default=1)
+    rates = parser.add_argument_group('per-user event rates (events/s)')
+    rates.add_argument('--update-rate', type=float, default=2.0)
+    rates.add_argument('--cursor-rate', type=float, default=3.0)
+    rates.add_argument('--chat-rate', type=float, default=0.1)
+    rates.add_argument('--mention-ratio', type=float, default=0.3, help="share of chat messages addressed to @bob")
+    rates.add_argument('--voice-rate', type=float, default=0.05)
+    rates.add_argument('--run-code-rate', type=float, default=0.02)
+    rates.add_argument('--analysis-rate', type=float, default=0.05)
+    mock = parser.add_argument_group('mock OpenAI server')
+    mock.add_argument('--llm-latency-ms', type=float, default=400, help="median chat completion latency")
+    mock.add_argument('--tts-latency-ms', type=float, default=250, help="mean time to the first audio byte")
+    mock.add_argument('--respond-ratio', type=float, default=0.3, help="share of LLM decisions that intervene")
+    mock.add_argument('--mock-script', help="JSON script for the mock server (overrides the three options above)")
+    parser.add_argument('--mongo', choices=('none', 'memory', 'uri'), default='none',
+                        help="no database, in-memory mongomock, or MONGODB_URI from the environment")
+    parser.add_argument('--url', help="target an already running backend (skips the mock and the subprocess)")
+    parser.add_argument('--server-log', help="write the backend's output to this file")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"📄 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
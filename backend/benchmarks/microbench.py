@@ -0,0 +1,354 @@
+"""
+Micro-benchmarks - per-message CPU hot paths (prompt construction, keyword scans, parsing)
+
+Each case times one call of a function that runs on every chat message, timer tick or
+analysis request, with realistic inputs: 1k/5k-line files and 50-message conversations.
+Per case the number of calls per sample is calibrated to about 20 ms; the median and minimum
+per-call time over the samples are reported.
+
+Results are compared against a committed baseline (baselines/microbench.json); a case is a
+regression when its median is more than --threshold times the baseline median. Baselines are
+machine specific - regenerate on the machine that compares (run --save) before relying on it.
+
+Usage (from backend/):
+    python benchmarks/microbench.py run [--filter mention] [--save results.json]
+    python benchmarks/microbench.py compare [--baseline benchmarks/baselines/microbench.json] [--threshold 1.25]
+    python benchmarks/microbench.py compare --current results.json   # compare two saved runs
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.pop('OPENAI_API_KEY', None)
+os.environ.pop('LLM_PROVIDER', None)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import services.ai_agent_core as core  # noqa: E402
+    from services.ai_code_analysis import AICodeAnalysisService  # noqa: E402
+    from services.ai_models import ConversationContext, Message  # noqa: E402
+    from services.todo_reveal_service import TodoRevealService  # noqa: E402
+    from services.code_context import select_code_context  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'microbench.json')
+ROOM_ID = "bench-room"
+TARGET_SAMPLE_SECONDS = 0.02
+
+CASES = {}
+
+
+def case(name: str):
+    """Register a benchmark; the decorated setup function returns the zero-argument callable to time"""
+    def decorator(setup):
+        CASES[name] = setup
+        return setup
+    return decorator
+
+
+# Realistic inputs
+
+def python_file(lines: int) -> str:
+    """Deterministic Python source of roughly the given number of lines"""
+    blocks = []
+    index = 0
+    while sum(block.count('\n') for block in blocks) < lines:
+        blocks.append(
+            f"def helper_{index}(items, target):\n"
+            f"    # Find pairs that add up to the target ({index})\n"
+            f"    seen = {{}}\n"
+            f"    result = []\n"
+            f"    for i, value in enumerate(items):\n"
+            f"        complement = target - value\n"
+            f"        if complement in seen:\n"
+            f"            result.append((seen[complement], i))\n"
+            f"        seen[value] = i\n"
+            f"    # TODO: handle duplicates in block {index}\n"
+            f"    return result\n\n"
+        )
+        index += 1
+    return ''.join(blocks)
+
+
+CHAT_LINES = (
+    "hmm not sure why the second test case is failing",
+    "maybe the index is off by one somewhere",
+    "what does the problem say about negative numbers",
+    "I think the dictionary part is fine",
+    "can you scroll down a bit",
+    "wait let me look at the output again",
+)
+
+
+def conversation(count: int, ai_every: int = 5) -> list:
+    base = time.time() - count * 10
+    messages = []
+    for i in range(count):
+        if ai_every and i % ai_every == ai_every - 1:
+            messages.append(Message(f"ai_{i}", f"Have you checked what happens when the list is empty? ({i})",
+                                    "Bob", "ai_agent_bob", base + i * 10, ROOM_ID, isAutoGenerated=True))
+        else:
+            user = f"user{i % 2}"
+            messages.append(Message(f"m{i}", CHAT_LINES[i % len(CHAT_LINES)], user, user, base + i * 10, ROOM_ID))
+    return messages
+
+
+def room_context(code_lines: int = 1000, messages: int = 50) -> ConversationContext:
+    context = ConversationContext(messages=conversation(messages), room_id=ROOM_ID)
+    context.code_context = python_file(code_lines)
+    context.problem_title = "Two Sum"
+    context.problem_description = "Given an array of integers and a target, return indices of two numbers adding up to target."
+    context.last_execution_success = False
+    context.last_execution_time = datetime.now() - timedelta(minutes=10)
+    context.last_ai_response = datetime.now() - timedelta(minutes=1)
+    for i in range(10):
+        context.ai_message_history.append(f"Try thinking about which values you have already seen ({i})")
+    return context
+
+
+class FakeSocketIO:
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class InstantClient:
+    """Chat completions answered immediately, so only prompt construction and parsing are timed"""
+
+    def __init__(self, content: str = "NO_RESPONSE"):
+        message = type('Message', (), {'content': content})()
+        response = type('Response', (), {'choices': [type('Choice', (), {'message': message})()], 'usage': None})()
+        self.chat = type('Chat', (), {'completions': type('Completions', (), {'create': lambda _, **kwargs: response})()})()
+
+
+_agent = None
+
+def agent() -> core.AIAgent:
+    global _agent
+    if _agent is None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _agent = core.AIAgent(FakeSocketIO())
+        _agent.client = InstantClient()
+    return _agent
+
+
+# Cases
+
+@case("mention/short")
+def bench_mention_short():
+    text = "hey bob can you take a look at our loop"
+    return lambda: agent()._is_direct_ai_mention(text)
+
+
+@case("mention/long_no_match")
+def bench_mention_long():
+    text = " ".join(CHAT_LINES) * 8
+    return lambda: agent()._is_direct_ai_mention(text)
+
+
+@case("progress/no_match")
+def bench_progress_no_match():
+    context = room_context(messages=50)
+    return lambda: agent()._detect_user_progress(context)
+
+
+@case("progress/late_match")
+def bench_progress_late_match():
+    context = room_context(messages=50)
+    context.messages.append(Message("last", "ok nice, that looks solved now", "user1", "user1", time.time(), ROOM_ID))
+    return lambda: agent()._detect_user_progress(context)
+
+
+@case("ai_history_context")
+def bench_ai_history_context():
+    snapshot = room_context().snapshot()
+    return lambda: agent()._build_ai_history_context(snapshot)
+
+
+def fresh_decision(room_id: str):
+    """Full AI decision: the unchanged room would otherwise reuse its memoized first decision"""
+    agent().decision_memo.forget(room_id)
+    return agent()._centralized_ai_decision(room_id)
+
+
+@case("ai_decision/1k_lines")
+def bench_ai_decision_1k():
+    agent().conversation_history[ROOM_ID + "-1k"] = room_context(code_lines=1000)
+    return lambda: fresh_decision(ROOM_ID + "-1k")
+
+
+@case("ai_decision/5k_lines")
+def bench_ai_decision_5k():
+    agent().conversation_history[ROOM_ID + "-5k"] = room_context(code_lines=5000)
+    return lambda: fresh_decision(ROOM_ID + "-5k")
+
+
+@case("code_context/5k_lines")
+def bench_code_context_5k():
+    code = python_file(5000)
+    cursor_line = code.count('\n') // 2
+    return lambda: select_code_context(code, "python", [cursor_line], "why does helper_3 return early")
+
+
+@case("analysis_prompt/1k_lines")
+def bench_analysis_prompt_1k():
+    service = AICodeAnalysisService(None, FakeSocketIO())
+    code = python_file(1000)
+    return lambda: service._create_code_analysis_prompt(code, "python", {}, {'title': 'Two Sum'})
+
+
+@case("analysis_prompt/5k_lines")
+def bench_analysis_prompt_5k():
+    service = AICodeAnalysisService(None, FakeSocketIO())
+    code = python_file(5000)
+    return lambda: service._create_code_analysis_prompt(code, "python", {}, {'title': 'Two Sum'})
+
+
+@case("parse_code_analysis")
+def bench_parse_code_analysis():
+    service = AICodeAnalysisService(None, FakeSocketIO())
+    code = python_file(1000)
+    response = '```json\n' + json.dumps({"issue": {
+        "title": "Nested loop", "description": "The inner loop makes this O(n^2).",
+        "hint": "Store values you have seen in a dictionary."}}) + '\n```'
+    return lambda: service._parse_code_analysis(response, code, {}, {'title': 'Two Sum'})
+
+
+@case("todo_valid_code/code")
+def bench_todo_valid_code():
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = TodoRevealService()
+    return lambda: service._is_valid_code_response("result.append((seen[complement], i))", "python")
+
+
+@case("todo_valid_code/explanation")
+def bench_todo_valid_explanation():
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = TodoRevealService()
+    text = "To complete this you would append the pair of indices to the result list once found."
+    return lambda: service._is_valid_code_response(text, "python")
+
+
+# Runner
+
+def measure(fn, repeat: int) -> dict:
+    """Per-call seconds: calibrate calls per sample to TARGET_SAMPLE_SECONDS, then take repeat samples"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= TARGET_SAMPLE_SECONDS or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(TARGET_SAMPLE_SECONDS / elapsed) + 1))
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return {
+        'median_us': round(statistics.median(samples) * 1e6, 3),
+        'min_us': round(min(samples) * 1e6, 3),
+        'calls_per_sample': number,
+        'samples': repeat,
+    }
+
+
+def run_suite(pattern: str = None, repeat: int = 7) -> dict:
+    results = {}
+    for name, setup in CASES.items():
+        if pattern and not fnmatch.fnmatch(name, f"*{pattern}*"):
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn = setup()
+            results[name] = measure(fn, repeat)
+        print(f"  {name:<32} median {results[name]['median_us']:>12.3f} µs   min {results[name]['min_us']:>12.3f} µs")
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, pattern: str = None) -> bool:
+    """Print a comparison table; False when any case regressed beyond the threshold"""
+    ok = True
+    print(f"\n{'case':<32}{'baseline µs':>14}{'current µs':>14}{'ratio':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"{name:<32}{'-':>14}{result['median_us']:>14.3f}{'new':>8}")
+            continue
+        ratio = result['median_us'] / base['median_us'] if base['median_us'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag, ok = '  ❌ regression', False
+        elif ratio < 1 / threshold:
+            flag = '  ✅ faster'
+        print(f"{name:<32}{base['median_us']:>14.3f}{result['median_us']:>14.3f}{ratio:>8.2f}{flag}")
+    for name in baseline['results']:
+        if name not in current['results'] and not (pattern and not fnmatch.fnmatch(name, f"*{pattern}*")):
+            print(f"{name:<32}{baseline['results'][name]['median_us']:>14.3f}{'-':>14}{'gone':>8}")
+    if baseline.get('machine') != current.get('machine'):
+        print("⚠️  Baseline was recorded on a different machine/Python - ratios are only indicative")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the suite")
+    run_parser.add_argument('--filter', help="only cases whose name contains this")
+    run_parser.add_argument('--repeat', type=int, default=7)
+    run_parser.add_argument('--save', help="write results to this file (e.g. the baseline)")
+
+    compare_parser = commands.add_parser('compare', help="run the suite (or load --current) and compare to a baseline")
+    compare_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    compare_parser.add_argument('--current', help="saved results to compare instead of running the suite")
+    compare_parser.add_argument('--filter')
+    compare_parser.add_argument('--repeat', type=int, default=7)
+    compare_parser.add_argument('--threshold', type=float, default=1.25, help="max allowed median ratio")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        result = run_suite(args.filter, args.repeat)
+        if args.save:
+            os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+            with open(args.save, 'w') as f:
+                json.dump(result, f, indent=2)
+                f.write('\n')
+            print(f"📄 Results written to {args.save}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.filter, args.repeat)
+    ok = compare(baseline, current, args.threshold, args.filter)
+    print("✅ No regressions" if ok else f"❌ Regressions above {args.threshold:.2f}x")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
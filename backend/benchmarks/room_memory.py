@@ -0,0 +1,130 @@
+"""
+Room memory benchmark - bytes per active room for the conversation models
+
+Compares the original plain-dataclass models (per-instance __dict__, ISO timestamp strings,
+list histories trimmed by slicing) with the current slotted/interned/ring-buffer models in
+services/ai_models.py, for the same simulated traffic.
+
+Usage (from backend/):
+    python benchmarks/room_memory.py --rooms 2000 --messages 40
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from services.ai_models import Message, ConversationContext  # noqa: E402
+
+
+@dataclass
+class LegacyMessage:
+    id: str
+    content: str
+    username: str
+    userId: str
+    timestamp: str
+    room: str
+    isAutoGenerated: bool = False
+    ai_trigger_type: Optional[str] = None
+    is_reflection: bool = False
+
+
+@dataclass
+class LegacyConversationContext:
+    messages: List[LegacyMessage]
+    room_id: str
+    last_ai_response: Optional[datetime] = None
+    code_context: str = ""
+    programming_language: str = "python"
+    problem_description: str = ""
+    problem_title: str = ""
+    session_id: str = ""
+    message_counter: int = 0
+    last_execution_code: str = ""
+    last_execution_output: str = ""
+    last_execution_error: str = ""
+    last_execution_success: bool = True
+    last_execution_time: Optional[datetime] = None
+    last_message_time: Optional[datetime] = None
+    planning_check_done: bool = False
+    ai_message_history: List[str] = field(default_factory=list)
+
+
+def _payloads(room_index: int, message_count: int):
+    """Socket payloads as they arrive: every string is a fresh object decoded from JSON"""
+    start = datetime(2025, 1, 1) + timedelta(minutes=room_index)
+    for i in range(message_count):
+        is_ai = i % 3 == 2
+        yield json.loads(json.dumps({
+            'id': f"msg_{room_index}_{i}",
+            'content': f"message {i} in room {room_index}: let's try a hash map for the lookup",
+            'username': 'Bob (AI Assistant)' if is_ai else f"user{i % 2}",
+            'userId': 'ai_agent_bob' if is_ai else f"student_{room_index}_{i % 2}",
+            'timestamp': (start + timedelta(seconds=i)).isoformat() + 'Z',
+            'room': f"cohort-a-room-{room_index}",
+        }))
+
+
+def build_legacy(rooms: int, messages: int):
+    contexts = {}
+    for r in range(rooms):
+        context = LegacyConversationContext(messages=[], room_id=f"cohort-a-room-{r}")
+        for payload in _payloads(r, messages):
+            context.messages.append(LegacyMessage(**payload))
+            if payload['userId'] == 'ai_agent_bob':
+                context.ai_message_history.append(payload['content'])
+                if len(context.ai_message_history) > 10:
+                    context.ai_message_history = context.ai_message_history[-10:]
+            if len(context.messages) > 10:
+                context.messages = context.messages[-10:]
+        contexts[context.room_id] = context
+    return contexts
+
+
+def build_compact(rooms: int, messages: int):
+    contexts = {}
+    for r in range(rooms):
+        context = ConversationContext(messages=[], room_id=f"cohort-a-room-{r}")
+        for payload in _payloads(r, messages):
+            context.messages.append(Message(**payload))
+            if payload['userId'] == 'ai_agent_bob':
+                context.ai_message_history.append(payload['content'])
+        contexts[context.room_id] = context
+    return contexts
+
+
+def measure(builder, rooms: int, messages: int) -> int:
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    contexts = builder(rooms, messages)
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in snapshot.compare_to(baseline, 'filename'))
+    del contexts
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=40, help="messages received per room")
+    args = parser.parse_args()
+
+    legacy = measure(build_legacy, args.rooms, args.messages)
+    compact = measure(build_compact, args.rooms, args.messages)
+
+    print(f"rooms={args.rooms} messages/room={args.messages}")
+    print(f"  legacy  : {legacy / args.rooms:10.0f} bytes/room  ({legacy / 1e6:.1f} MB total)")
+    print(f"  compact : {compact / args.rooms:10.0f} bytes/room  ({compact / 1e6:.1f} MB total)")
+    print(f"  saving  : {(1 - compact / legacy) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
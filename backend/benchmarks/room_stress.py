@@ -0,0 +1,275 @@
+"""
+Room stress harness - hammers one room's AI state from many threads
+
+Chat senders, code updates, execution results, tracking saves, snapshot readers and the
+intervention timers (shortened to milliseconds, answered by a fake LLM) all run against a
+single room at once. The MongoDB writer is replaced by an in-memory recorder so message
+sequencing can be checked. Afterwards the harness verifies:
+  - no worker raised and no service logged an error
+  - message numbers are unique and contiguous, and each sender's messages keep their order
+  - every snapshot was internally consistent (code and language written together stay together)
+  - ring buffers never exceeded their capacity
+
+Usage (from backend/):
+    python benchmarks/room_stress.py --threads 16 --iterations 300
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.pop('OPENAI_API_KEY', None)  # the fake LLM below is installed explicitly
+
+import services.ai_agent_core as core  # noqa: E402
+from services.ai_models import MAX_AI_MESSAGE_HISTORY, MAX_CONTEXT_MESSAGES  # noqa: E402
+
+ROOM_ID = "stress-room"
+LANGUAGES = ("python", "javascript", "java", "cpp")
+
+
+class FakeSocketIO:
+    def emit(self, *args, **kwargs):
+        pass
+
+    def start_background_task(self, target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeCompletions:
+    """Answers like the LLM after a short delay; alternates interventions and NO_RESPONSE"""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, messages, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(0.002)
+        prompt = messages[-1]['content'] if messages else ''
+        if prompt.startswith('You are Bob') and 'PROGRESS CHECK' in prompt:
+            content = f"YES|HINT|Try a hash map for lookups ({call})"
+        else:
+            content = "NO_RESPONSE" if call % 2 else f"Consider the edge cases first ({call})"
+        if stream:
+            # Calls made under a cancellation token are streamed (services/cancellation.py)
+            return FakeStream(content)
+        message = type('Message', (), {'content': content})()
+        choice = type('Choice', (), {'message': message})()
+        return type('Response', (), {'choices': [choice]})()
+
+
+class FakeStream:
+    """A streamed completion: one chunk per word, closable like the SDK's Stream"""
+
+    def __init__(self, content):
+        self.words = content.split(' ')
+        self.closed = False
+
+    def __iter__(self):
+        for index, word in enumerate(self.words):
+            if self.closed:
+                return
+            last = index == len(self.words) - 1
+            delta = type('Delta', (), {'content': word if last else word + ' '})()
+            choice = type('Choice', (), {'delta': delta, 'finish_reason': 'stop' if last else None})()
+            yield type('Chunk', (), {'choices': [choice], 'usage': None})()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.completions = FakeCompletions()
+        self.chat = type('Chat', (), {'completions': self.completions})()
+
+
+class RecordingWriter:
+    """Stands in for the batched MongoDB writer and records what would be inserted"""
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, message, snapshots=None):
+        with self._lock:
+            self.messages.append(message)
+
+
+class ErrorCounter(io.TextIOBase):
+    """stdout sink counting the services' error lines instead of printing them"""
+
+    def __init__(self):
+        self.error_lines = []
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        if text.startswith('❌'):
+            with self._lock:
+                self.error_lines.append(text.strip())
+        return len(text)
+
+
+class ErrorLogHandler(logging.Handler):
+    """Collects ERROR records logged by the services into the same counter"""
+
+    def __init__(self, counter: ErrorCounter):
+        super().__init__(logging.ERROR)
+        self.counter = counter
+
+    def emit(self, record):
+        with self.counter._lock:
+            self.counter.error_lines.append(record.getMessage())
+
+
+def build_agent(writer: RecordingWriter):
+    core.is_mongodb_enabled = lambda: True
+    core.get_message_writer = lambda: writer
+    agent = core.AIAgent(FakeSocketIO())
+    agent.client = FakeClient()
+    agent.set_room_ai_mode(ROOM_ID, 'shared_no_voice')
+    agent.intervention_service.response_cooldown = 0
+    agent.intervention_service.update_intervention_settings({
+        'idle_intervention_enabled': True,
+        'idle_intervention_delay': 0.005,
+        'progress_check_enabled': True,
+        'progress_check_interval': 0.01,
+    })
+    agent.join_room(ROOM_ID)
+    return agent
+
+
+def run(threads: int, iterations: int):
+    writer = RecordingWriter()
+    agent = build_agent(writer)
+    failures = []
+    violations = []
+    snapshots_checked = [0]
+
+    def guarded(worker):
+        def wrapper(index):
+            try:
+                worker(index)
+            except Exception as e:
+                failures.append(f"{worker.__name__}[{index}]: {e!r}")
+        return wrapper
+
+    @guarded
+    def chat(index):
+        for i in range(iterations):
+            agent.process_message_sync({
+                'id': f"chat{index}-{i}", 'content': f"step {i} from sender {index}",
+                'username': f"user{index}", 'userId': f"user{index}",
+                'timestamp': time.time(), 'room': ROOM_ID
+            })
+
+    @guarded
+    def code(index):
+        for i in range(iterations):
+            language = LANGUAGES[(index + i) % len(LANGUAGES)]
+            agent.update_code_context(ROOM_ID, f"// {language} v{index}.{i}\nsolve()", language, user_id=f"user{index}")
+            agent.update_problem_context(ROOM_ID, f"Problem {i}", f"Description {i}")
+
+    @guarded
+    def execution(index):
+        for i in range(iterations):
+            success = i % 3 != 0
+            agent.update_execution_results(ROOM_ID, f"print({i})", str(i), "" if success else "Error", success)
+
+    @guarded
+    def tracking(index):
+        for i in range(iterations):
+            agent.track_enter_event(ROOM_ID, f"x = {i}", i, 'python', user_id=f"user{index}", full_code=f"x = {i}\n")
+
+    @guarded
+    def reader(index):
+        for _ in range(iterations):
+            context = agent.conversation_history.get(ROOM_ID)
+            if context is None:
+                continue
+            snapshot = context.snapshot()
+            snapshots_checked[0] += 1
+            if len(snapshot.messages) > MAX_CONTEXT_MESSAGES:
+                violations.append(f"snapshot holds {len(snapshot.messages)} messages")
+            if len(snapshot.ai_message_history) > MAX_AI_MESSAGE_HISTORY:
+                violations.append(f"snapshot holds {len(snapshot.ai_message_history)} AI messages")
+            if snapshot.code_context and not snapshot.code_context.startswith(f"// {snapshot.programming_language} "):
+                violations.append(f"torn code update: {snapshot.programming_language!r} vs {snapshot.code_context[:20]!r}")
+            if snapshot.problem_title and snapshot.problem_title.split()[-1] != snapshot.problem_description.split()[-1]:
+                violations.append(f"torn problem update: {snapshot.problem_title!r} vs {snapshot.problem_description!r}")
+
+    roles = [chat, code, execution, tracking, reader]
+    workers = [
+        threading.Thread(target=roles[i % len(roles)], args=(i,), name=f"stress-{i}")
+        for i in range(threads)
+    ]
+
+    sink = ErrorCounter()
+    logging.getLogger().handlers = [ErrorLogHandler(sink)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        time.sleep(0.2)  # let in-flight timers finish
+        agent.intervention_service.cleanup_room(ROOM_ID)
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    context = agent.conversation_history[ROOM_ID]
+    numbers = [message.message_number for message in writer.messages]
+    if sorted(numbers) != list(range(1, len(numbers) + 1)):
+        duplicates = len(numbers) - len(set(numbers))
+        violations.append(f"message numbers not contiguous ({len(numbers)} saved, {duplicates} duplicates)")
+    if context.message_counter != len(numbers):
+        violations.append(f"message_counter {context.message_counter} != {len(numbers)} saved messages")
+
+    by_sender = defaultdict(list)
+    for message in writer.messages:
+        if message.message_id.startswith('chat'):
+            by_sender[message.user_id].append((message.message_number, int(message.message_id.split('-')[1])))
+    for sender, entries in by_sender.items():
+        order = [i for _, i in sorted(entries)]
+        if order != sorted(order):
+            violations.append(f"messages from {sender} were reordered")
+
+    if len(context.messages) > MAX_CONTEXT_MESSAGES or len(context.ai_message_history) > MAX_AI_MESSAGE_HISTORY:
+        violations.append("ring buffer exceeded its capacity")
+
+    print(f"threads={threads} iterations={iterations} elapsed={elapsed:.2f}s")
+    print(f"  saved messages : {len(numbers)} (counter {context.message_counter})")
+    print(f"  LLM calls      : {agent.client.completions.calls}")
+    print(f"  snapshots read : {snapshots_checked[0]}")
+    print(f"  worker errors  : {len(failures)}")
+    print(f"  logged errors  : {len(sink.error_lines)}")
+    print(f"  violations     : {len(violations)}")
+    for problem in (failures + sink.error_lines + violations)[:20]:
+        print(f"    - {problem}")
+    return not (failures or sink.error_lines or violations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=300, help="operations per thread")
+    args = parser.parse_args()
+
+    ok = run(args.threads, args.iterations)
+    print("✅ PASS" if ok else "❌ FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,13 +21,24 @@ from flask_jwt_extended import JWTManager, create_access_token, jwt_required
 from services.ai_agent import init_ai_agent, get_ai_agent
 from services.scaffolding_service import ScaffoldingService
 from services.individual_ai_service import init_individual_ai_service, get_individual_ai_service
+from services.room_lifecycle import get_room_lifecycle
+from services.tracing import get_tracer, propagate
+from services.metrics import (
+    get_metrics_registry, timed_socket_handler,
+    EXECUTION_SECONDS, EXECUTIONS_IN_FLIGHT, ACTIVE_ROOMS, PENDING_TIMERS
+)
 from database.db import init_db, close_db, is_mongodb_enabled
+from config.logging_config import init_logging, get_logger, get_event_logger
 
 load_dotenv()
+init_logging()
+log = get_logger("app")
+event_log = get_event_logger("app")  # sampled: per-keystroke/cursor events
 
 # Conditionally import database models (only if mongoengine is available)
 try:
     from database.models import CodeExecution
+    from database.snapshot_store import get_snapshot_store
     _models_available = True
 except ImportError:
     _models_available = False
@@ -52,15 +63,24 @@ socketio = SocketIO(
 )
 jwt = JWTManager(app)
 
+def socket_event(event: str, namespace: str = "/ws"):
+    """Register a Socket.IO handler that is counted and timed in /metrics"""
+    def decorator(handler):
+        return socketio.on(event, namespace=namespace)(timed_socket_handler(event)(handler))
+    return decorator
+
 class ConnectionManager:
     """Track who's in which Socket.IO room and store room state."""
-    def __init__(self):
+    def __init__(self, lifecycle=None):
         self.rooms = {}      # room_id -> set(sid)
         self.room_state = {} # room_id -> { code: str, language: str }
         self.user_names = {} # sid -> username mapping
         self.session_states = {} # room_id -> { started: bool, ai_mode: str, locked: bool }
+        self.lifecycle = lifecycle  # notified when a room gains its first user or loses its last
 
     def join(self, sid: str, room: str, username: str = None):
+        if room not in self.rooms and self.lifecycle:
+            self.lifecycle.room_joined(room)
         self.rooms.setdefault(room, set()).add(sid)
         if username:
             self.user_names[sid] = username
@@ -78,6 +98,8 @@ class ConnectionManager:
             self.rooms.pop(room, None)
             self.room_state.pop(room, None)
             self.session_states.pop(room, None)
+            if self.lifecycle:
+                self.lifecycle.room_emptied(room)
         # Clean up username when user leaves
         self.user_names.pop(sid, None)
 
@@ -124,19 +146,28 @@ class ConnectionManager:
     def set_room_state(self, room: str, code: str, language: str = "python"):
         self.room_state[room] = {"code": code, "language": language}
 
-manager = ConnectionManager()
+manager = ConnectionManager(lifecycle=get_room_lifecycle())
 
 # Initialize AI Agent, Scaffolding Service, Individual AI Service, and Reflection Service
 ai_agent = init_ai_agent(socketio)
 scaffolding_service = ScaffoldingService()
 individual_ai_service = init_individual_ai_service(socketio)
 
+# Room/timer gauges are read at scrape time
+ACTIVE_ROOMS.set_function(lambda: len(manager.rooms))
+PENDING_TIMERS.set_function(
+    lambda: len(ai_agent.intervention_service.pending_timers) + len(ai_agent.intervention_service.get_active_progress_rooms())
+)
+
 # Initialize TODO Reveal Service
 from services.todo_reveal_service import TodoRevealService
 todo_reveal_service = TodoRevealService()
 
 # Initialize Database (optional - will gracefully continue without MongoDB)
 init_db()
+if is_mongodb_enabled():
+    from database.message_queries import start_room_id_lc_backfill
+    start_room_id_lc_backfill()
 
 # Initialize Reflection Service
 from services.ai_reflection import init_reflection_service
@@ -175,11 +206,11 @@ def create_comment_id(comment_line, cursor_line, language):
     return f"{language}:{cursor_line}:{comment_line.strip()}"
 
 # WebSocket handlers
-@socketio.on("connect", namespace="/ws")
+@socket_event("connect")
 def ws_connect():
     print(f"WS client {request.sid} connected")
 
-@socketio.on("join", namespace="/ws")
+@socket_event("join")
 def ws_join(data):
     room = data["room"]
     username = data.get("username", "Guest")  # Get username from client
@@ -221,7 +252,7 @@ def ws_join(data):
     
     return {"code": room_state["code"]}
 
-@socketio.on("leave", namespace="/ws") 
+@socket_event("leave")
 def ws_leave(data):
     room = data["room"]
     username = manager.get_username(request.sid)  # Get stored username
@@ -243,12 +274,12 @@ def ws_leave(data):
         "userCount": current_user_count
     }, room=room, include_self=False)
 
-@socketio.on("update", namespace="/ws")
+@socket_event("update")
 def ws_update(data):
     """
     Forward code updates to everyone else in the room.
     """
-    print(f"WS update from {request.sid} in room {data['room']}")
+    event_log.info("WS update from %s in room %s", request.sid, data['room'])
     room = data["room"]
     delta = data["delta"]
     source_id = data.get("sourceId", request.sid)
@@ -262,95 +293,101 @@ def ws_update(data):
     # Broadcast to all other clients in the room
     emit("update", {"delta": delta, "sourceId": source_id}, room=room, include_self=False)
 
-@socketio.on("cursor", namespace="/ws")
+@socket_event("cursor")
 def ws_cursor(data):
     """
     Forward cursor position/selection to everyone else in the room.
     """
-    print(f"WS cursor from {request.sid} in room {data['room']}")
+    event_log.info("WS cursor from %s in room %s", request.sid, data['room'])
     room = data["room"]
     
+    # The AI focuses code in its prompts on where users are working
+    if isinstance(data.get("from"), int):
+        ai_agent.handle_cursor_update(room, data["from"], user_id=request.sid)
+    
     # Broadcast cursor position to all other clients in the room
     emit("cursor", data, room=room, include_self=False)
 
-@socketio.on("selection", namespace="/ws")
+@socket_event("selection")
 def ws_selection(data):
     """
     Forward text selection/highlighting to everyone else in the room.
     """
-    print(f"WS selection from {request.sid} in room {data['room']}")
+    event_log.info("WS selection from %s in room %s", request.sid, data['room'])
     room = data["room"]
     
     # Broadcast selection to all other clients in the room
     emit("selection", data, room=room, include_self=False)
 
-@socketio.on("chat_message", namespace="/ws")
+@socket_event("chat_message")
 def ws_chat_message(data):
     """
     Forward chat messages to everyone else in the room and process with AI agent.
     """
-    print(f"WS chat message from {request.sid} in room {data['room']}")
+    log.info("WS chat message from %s in room %s", request.sid, data['room'])
     room = data["room"]
     user_id = data.get("userId", request.sid)
     is_individual_mode = data.get("isIndividualMode", False)
     
-    if is_individual_mode:
-        print(f"🤖 Individual mode message detected from user {user_id}")
-        # For individual mode, create a personal room for AI processing
-        # Avoid double suffixes if room is already personal
-        if "_personal_" in room:
-            personal_room = room  # Already a personal room, don't add another suffix
-            print(f"🤖 Using existing personal room: {personal_room}")
-        else:
-            personal_room = f"{room}_personal_{user_id}"
-            print(f"🤖 Created new personal room: {personal_room}")
-        
-        # Update the message to use the personal room for AI processing
-        personal_message = data.copy()
-        personal_message["room"] = personal_room
-        
-        # Don't broadcast individual mode messages to other users - keep them private
-        print(f"🤖 Processing individual message in personal room: {personal_room}")
-        
-        # For individual mode, always process with AI (user explicitly chose individual AI mode)
-        # Copy context from original room to personal room if needed
-        individual_ai_service.copy_room_context_to_personal(room, user_id)
+    # Trace the message through AI processing, intervention, TTS and playback
+    with get_tracer().start_trace("chat_message", room, user_id=user_id, individual=is_individual_mode):
+        if is_individual_mode:
+            print(f"🤖 Individual mode message detected from user {user_id}")
+            # For individual mode, create a personal room for AI processing
+            # Avoid double suffixes if room is already personal
+            if "_personal_" in room:
+                personal_room = room  # Already a personal room, don't add another suffix
+                print(f"🤖 Using existing personal room: {personal_room}")
+            else:
+                personal_room = f"{room}_personal_{user_id}"
+                print(f"🤖 Created new personal room: {personal_room}")
         
-        # Set AI mode for personal room (individual mode generates audio)
-        ai_agent.set_room_ai_mode(personal_room, 'individual')
+            # Update the message to use the personal room for AI processing
+            personal_message = data.copy()
+            personal_message["room"] = personal_room
         
-        # Process message with AI agent in personal room in a separate thread
-        def process_individual_ai_message():
-            print(f"🤖 Processing individual AI message for personal room {personal_room}")
-            ai_agent.process_message_sync(personal_message)
-            print(f"🤖 Individual AI message processing completed for personal room {personal_room}")
+            # Don't broadcast individual mode messages to other users - keep them private
+            print(f"🤖 Processing individual message in personal room: {personal_room}")
         
-        threading.Thread(target=process_individual_ai_message, daemon=True).start()
-    else:
-        # Regular shared mode - broadcast to everyone and process normally
-        # Broadcast chat message - include self for system messages, exclude for regular messages
-        include_self = data.get('isSystem', False)
-        emit("chat_message", data, room=room, include_self=include_self)
+            # For individual mode, always process with AI (user explicitly chose individual AI mode)
+            # Copy context from original room to personal room if needed
+            individual_ai_service.copy_room_context_to_personal(room, user_id)
         
-        # Check AI mode before processing with AI agent
-        current_ai_mode = manager.get_ai_mode(room)
+            # Set AI mode for personal room (individual mode generates audio)
+            ai_agent.set_room_ai_mode(personal_room, 'individual')
         
-        # Update AI agent with current mode
-        ai_agent.set_room_ai_mode(room, current_ai_mode)
+            # Process message with AI agent in personal room in a separate thread
+            def process_individual_ai_message():
+                log.debug("🤖 Processing individual AI message for personal room %s", personal_room)
+                ai_agent.process_message_sync(personal_message)
+                log.debug("🤖 Individual AI message processing completed for personal room %s", personal_room)
         
-        # Only process with AI if not in 'none' mode
-        if current_ai_mode != 'none':
-            # Process message with AI agent in a separate thread
-            def process_ai_message():
-                print(f"🤖 Processing AI message for room {room} (mode: {current_ai_mode})")
-                ai_agent.process_message_sync(data)
-                print(f"🤖 AI message processing completed for room {room}")
-            
-            threading.Thread(target=process_ai_message, daemon=True).start()
+            threading.Thread(target=propagate(process_individual_ai_message), daemon=True).start()
         else:
-            print(f"🚫 Skipping AI processing for room {room} - AI mode is 'none'")
+            # Regular shared mode - broadcast to everyone and process normally
+            # Broadcast chat message - include self for system messages, exclude for regular messages
+            include_self = data.get('isSystem', False)
+            emit("chat_message", data, room=room, include_self=include_self)
+        
+            # Check AI mode before processing with AI agent
+            current_ai_mode = manager.get_ai_mode(room)
+        
+            # Update AI agent with current mode
+            ai_agent.set_room_ai_mode(room, current_ai_mode)
+        
+            # Only process with AI if not in 'none' mode
+            if current_ai_mode != 'none':
+                # Process message with AI agent in a separate thread
+                def process_ai_message():
+                    log.debug("🤖 Processing AI message for room %s (mode: %s)", room, current_ai_mode)
+                    ai_agent.process_message_sync(data)
+                    log.debug("🤖 AI message processing completed for room %s", room)
+            
+                threading.Thread(target=propagate(process_ai_message), daemon=True).start()
+            else:
+                print(f"🚫 Skipping AI processing for room {room} - AI mode is 'none'")
 
-@socketio.on("ai_mode_changed", namespace="/ws")
+@socket_event("ai_mode_changed")
 def ws_ai_mode_changed(data):
     """
     Handle AI mode changes and broadcast to all users in the room.
@@ -372,7 +409,7 @@ def ws_ai_mode_changed(data):
     
     print(f"📡 AI mode change to {data['mode']} accepted and broadcasted to room {room}")
 
-@socketio.on("problem_update", namespace="/ws")
+@socket_event("problem_update")
 def ws_problem_update(data):
     """
     Handle problem description updates and notify AI agent.
@@ -391,7 +428,7 @@ def ws_problem_update(data):
         "problemDescription": problem_description
     }, room=room, include_self=False)
 
-@socketio.on("ai_audio_playback_complete", namespace="/ws")
+@socket_event("ai_audio_playback_complete")
 def ws_ai_audio_playback_complete(data):
     """
     Handle notification from frontend that AI audio playback is complete.
@@ -403,8 +440,9 @@ def ws_ai_audio_playback_complete(data):
     
     # Release AI generation lock now that audio is actually finished
     ai_agent.release_generation_lock(room, message_id)
+    get_tracer().finish_pending(message_id)
 
-@socketio.on("code_execution", namespace="/ws")
+@socket_event("code_execution")
 def ws_code_execution(data):
     """
     Handle code execution events for real-time collaboration and AI analysis.
@@ -427,7 +465,7 @@ def ws_code_execution(data):
     # Trigger AI validation in background (already handled by API endpoint)
     print(f"🤖 Code execution broadcasted to room {room}")
 
-@socketio.on("voice_activity_detected", namespace="/ws")
+@socket_event("voice_activity_detected")
 def ws_voice_activity_detected(data):
     """
     Handle voice activity detection from frontend to cancel pending timers.
@@ -453,7 +491,11 @@ def ws_voice_activity_detected(data):
         available_timers = list(ai_agent.pending_timers.keys())
         print(f"🔍 No pending AI agent timer to cancel in room {room}. Available timers: {available_timers}")
 
-@socketio.on("chat_typing_activity", namespace="/ws")
+    # Abort an intervention that is already generating its reply or audio
+    if ai_agent.intervention_service.cancel_in_flight(room, "voice activity detected"):
+        print(f"✅ Aborted in-flight AI intervention due to voice activity in room {room}")
+
+@socket_event("chat_typing_activity")
 def ws_chat_typing_activity(data):
     """
     Handle chat typing activity detection from frontend to cancel pending timers.
@@ -476,7 +518,11 @@ def ws_chat_typing_activity(data):
         available_timers = list(ai_agent.pending_timers.keys())
         print(f"🔍 No pending AI agent timer to cancel in room {room}. Available timers: {available_timers}")
 
-@socketio.on("disconnect", namespace="/ws")
+    # Abort an intervention that is already generating its reply or audio
+    if ai_agent.intervention_service.cancel_in_flight(room, "chat typing activity detected"):
+        print(f"✅ Aborted in-flight AI intervention due to chat typing in room {room}")
+
+@socket_event("disconnect")
 def ws_disconnect():
     print(f"WS client {request.sid} disconnected")
     # Notify other users when someone disconnects
@@ -499,7 +545,7 @@ def ws_disconnect():
 
 
 # Reflection toggle handler
-@socketio.on("toggle_reflection", namespace="/ws")
+@socket_event("toggle_reflection")
 def ws_toggle_reflection(data):
     """Handle reflection session toggle (start/stop)"""
     try:
@@ -605,6 +651,11 @@ def health_check():
             "error": str(e)
         }), 500
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics (text exposition format)"""
+    return get_metrics_registry().render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 @app.route("/api/login", methods=["POST"])
 def login():
     """
@@ -727,7 +778,16 @@ def execute_code_endpoint():
             return jsonify({'error': 'No code provided'}), 400
         
         # Execute code based on language
-        result = execute_code(code, language)
+        EXECUTIONS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            result = execute_code(code, language)
+        finally:
+            EXECUTIONS_IN_FLIGHT.dec()
+        exit_code = result.get('exitCode')
+        outcome = 'ok' if exit_code == 0 else 'timeout' if exit_code == 124 else 'error'
+        metric_language = language if language in ('python', 'java', 'cpp', 'c') else 'other'
+        EXECUTION_SECONDS.observe(time.perf_counter() - started, language=metric_language, outcome=outcome)
         
         # Save code execution to database
         if room_id:
@@ -749,7 +809,7 @@ def execute_code_endpoint():
                             'content': msg.content,
                             'username': msg.username,
                             'userId': msg.userId,
-                            'timestamp': msg.timestamp,
+                            'timestamp': msg.iso_timestamp,
                             'room': msg.room,
                             'isAutoGenerated': msg.isAutoGenerated,
                             'ai_trigger_type': msg.ai_trigger_type,
@@ -759,6 +819,12 @@ def execute_code_endpoint():
                     print(f"📚 Captured {message_count} messages for code execution context")
                 
                 if is_mongodb_enabled() and _models_available:
+                    # Chat history goes to the snapshot store; keep it inline if that write fails
+                    try:
+                        history_fields = {'chat_history_hashes': get_snapshot_store().put_chat_history(chat_history)}
+                    except Exception as snapshot_error:
+                        print(f"⚠️  Could not write chat history snapshots, storing inline: {snapshot_error}")
+                        history_fields = {'chat_history': chat_history}
                     code_execution = CodeExecution(
                         room_id=room_id,
                         session_id=session_id,
@@ -768,8 +834,8 @@ def execute_code_endpoint():
                         execution_output=result.get('output', ''),
                         execution_error=result.get('error', ''),
                         execution_time_ms=int(result.get('executionTime', 0)),
-                        chat_history=chat_history,
-                        message_count=message_count
+                        message_count=message_count,
+                        **history_fields
                     )
                     code_execution.save()
                     print(f"💾 Saved code execution to database for room {room_id} (with {message_count} chat messages)")
@@ -1160,6 +1226,76 @@ def get_ai_state():
         print(f"Error getting AI state: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/room-memory', methods=['GET'])
+def get_room_memory():
+    """Get per-room AI state entry counts and approximate memory (for monitoring)"""
+    try:
+        room_id = request.args.get('room_id')
+        
+        return jsonify({
+            'success': True,
+            'memory': get_room_lifecycle().memory_stats(room_id)
+        })
+        
+    except Exception as e:
+        print(f"Error getting room memory stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/traces/<room_id>', methods=['GET'])
+def get_room_traces(room_id):
+    """Recent message traces for a room as span waterfalls (newest first)"""
+    try:
+        limit = request.args.get('limit', type=int)
+        
+        return jsonify({
+            'success': True,
+            'room_id': room_id,
+            'traces': get_tracer().recent_traces(room_id, limit)
+        })
+        
+    except Exception as e:
+        print(f"Error getting traces: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usage', methods=['GET'])
+def get_usage_report():
+    """LLM token and TTS usage per room and for the deployment, with budgets and degradation tiers"""
+    try:
+        from services.usage_governor import get_usage_governor
+        room_id = request.args.get('room_id')
+        limit = request.args.get('limit', 50, type=int)
+        
+        return jsonify({'success': True, **get_usage_governor().report(room_id, limit)})
+        
+    except Exception as e:
+        print(f"Error getting usage report: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/intervention-settings/profiles', methods=['GET'])
+def get_intervention_profiles():
+    """All intervention profiles: defaults, cohorts, per-room overrides and cohort membership"""
+    return jsonify({'success': True, **ai_agent.intervention_service.settings.to_dict()})
+
+@app.route('/api/intervention-settings/rooms/<room_id>', methods=['DELETE'])
+def reset_room_intervention_settings(room_id):
+    """Drop a room's own profile so it follows its cohort and the defaults again"""
+    version = ai_agent.intervention_service.reset_room_settings(room_id)
+    return jsonify({
+        'success': True,
+        'settings': ai_agent.intervention_service.get_intervention_settings(room_id),
+        'version': version
+    })
+
+@app.route('/api/intervention-settings/cohorts/<cohort>/rooms', methods=['POST'])
+def assign_intervention_cohort(cohort):
+    """Put rooms in a cohort ({"rooms": [...]}, or {"rooms": [...], "remove": true} to take them out)"""
+    data = request.get_json() or {}
+    rooms = data.get('rooms')
+    if not isinstance(rooms, list) or not all(isinstance(room, str) for room in rooms):
+        return jsonify({'success': False, 'error': 'rooms must be a list of room ids'}), 400
+    version = ai_agent.intervention_service.assign_cohort(rooms, None if data.get('remove') else cohort)
+    return jsonify({'success': True, 'cohort': cohort, 'rooms': rooms, 'version': version})
+
 @app.route('/api/generate-scaffolding', methods=['POST'])
 def generate_scaffolding():
     """Generate code scaffolding using LLM based on user comments"""
@@ -1234,10 +1370,10 @@ def generate_scaffolding():
             ai_agent = get_ai_agent()
             
             if ai_agent and room_id:
-                result = ai_agent.generate_scaffolding_with_tracking(room_id, comment_line, language, code)
+                result = ai_agent.generate_scaffolding_with_tracking(room_id, comment_line, language, code, cursor_line)
             else:
                 # Fallback to direct service call
-                result = scaffolding_service.generate_scaffolding(comment_line, language, code)
+                result = scaffolding_service.generate_scaffolding(comment_line, language, code, cursor_line)
             
             if not result:
                 # Release lock on no scaffolding
@@ -1327,11 +1463,11 @@ def reveal_todo():
         ai_agent = get_ai_agent()
         
         if ai_agent and room_id:
-            result = ai_agent.generate_todo_code_with_tracking(room_id, todo_line, language, code, problem_context)
+            result = ai_agent.generate_todo_code_with_tracking(room_id, todo_line, language, code, problem_context, cursor_line)
         else:
             # Fallback to direct service call
             result = todo_reveal_service.generate_todo_code(
-                todo_line, language, code, problem_context
+                todo_line, language, code, problem_context, cursor_line
             )
         
         if not result:
@@ -1404,12 +1540,13 @@ def start_session():
 
 @app.route('/api/intervention-settings', methods=['GET'])
 def get_intervention_settings():
-    """Get current intervention settings"""
+    """Get current intervention settings (?room_id= for the settings in effect in one room)"""
     try:
-        settings = ai_agent.intervention_service.get_intervention_settings()
+        settings = ai_agent.intervention_service.get_intervention_settings(request.args.get('room_id'))
         return jsonify({
             'success': True,
-            'settings': settings
+            'settings': settings,
+            'version': ai_agent.intervention_service.settings.version
         })
     except Exception as e:
         print(f"❌ Error getting intervention settings: {str(e)}")
@@ -1417,41 +1554,33 @@ def get_intervention_settings():
 
 @app.route('/api/intervention-settings', methods=['POST'])
 def update_intervention_settings():
-    """Update intervention settings"""
+    """Update intervention settings: the global defaults, or a profile for one room_id or cohort"""
+    from services.intervention_settings import validate_settings
     try:
         data = request.get_json()
         if not data or 'settings' not in data:
             return jsonify({'success': False, 'error': 'Missing settings data'}), 400
         
         settings = data['settings']
+        room_id = data.get('room_id')
+        cohort = data.get('cohort')
+        if room_id and cohort:
+            return jsonify({'success': False, 'error': 'Specify room_id or cohort, not both'}), 400
         
         # Validate settings
-        valid_keys = {'idle_intervention_enabled', 'idle_intervention_delay', 'progress_check_enabled', 'progress_check_interval'}
-        for key in settings:
-            if key not in valid_keys:
-                return jsonify({'success': False, 'error': f'Invalid setting key: {key}'}), 400
-            
-            # Validate boolean settings
-            if key in ['idle_intervention_enabled', 'progress_check_enabled']:
-                if not isinstance(settings[key], bool):
-                    return jsonify({'success': False, 'error': f'Setting value must be boolean: {key}'}), 400
-            
-            # Validate timing settings
-            elif key == 'idle_intervention_delay':
-                if not isinstance(settings[key], (int, float)) or not (1 <= settings[key] <= 60):
-                    return jsonify({'success': False, 'error': f'Idle intervention delay must be between 1 and 60 seconds: {key}'}), 400
-            
-            elif key == 'progress_check_interval':
-                if not isinstance(settings[key], (int, float)) or not (10 <= settings[key] <= 300):
-                    return jsonify({'success': False, 'error': f'Progress check interval must be between 10 and 300 seconds: {key}'}), 400
+        error = validate_settings(settings)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
         
-        # Update settings
-        ai_agent.intervention_service.update_intervention_settings(settings)
+        # Update settings (only timers in the affected rooms are touched)
+        service = ai_agent.intervention_service
+        version = service.update_intervention_settings(settings, room_id=room_id, cohort=cohort)
         
         return jsonify({
             'success': True,
             'message': 'Intervention settings updated successfully',
-            'settings': ai_agent.intervention_service.get_intervention_settings()
+            'settings': service.get_intervention_settings(room_id),
+            'version': version
         })
         
     except Exception as e:
@@ -1515,7 +1644,7 @@ def get_code_executions(room_id):
         executions = CodeExecution.objects(room_id=room_id).order_by('-timestamp').skip(skip).limit(limit)
         
         # Convert to dictionaries for JSON response
-        execution_list = [execution.to_dict() for execution in executions]
+        execution_list = get_snapshot_store().hydrate_executions([execution.to_dict() for execution in executions])
         
         return jsonify({
             'success': True,
@@ -1721,8 +1850,9 @@ def get_conversation_stats():
     try:
         room_id = request.args.get('room_id')
         session_id = request.args.get('session_id')
+        include_rooms = request.args.get('include_rooms', default='false').lower() == 'true'
         
-        stats = ai_agent.get_conversation_stats(room_id, session_id)
+        stats = ai_agent.get_conversation_stats(room_id, session_id, include_rooms=include_rooms)
         
         return jsonify({
             'success': True,
@@ -1736,6 +1866,27 @@ def get_conversation_stats():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/stats/rollup/rebuild', methods=['POST'])
+def rebuild_stats_rollup_api():
+    """Recompute the materialized room stats rollup from raw messages"""
+    try:
+        error_response = db_operation_required()
+        if error_response:
+            return error_response
+        
+        from database.message_queries import rebuild_stats_rollup
+        rebuild_stats_rollup()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Room stats rollup rebuilt'
+        })
+        
+    except Exception as e:
+        print(f"❌ Error rebuilding stats rollup: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/rooms', methods=['GET'])
 def get_room_ids():
     """Get distinct room IDs from chat messages"""
@@ -1745,6 +1896,8 @@ def get_room_ids():
             return error_response
             
         from database.models import ChatMessage
+        from database.message_queries import get_room_stats, get_rollup_room_stats, is_stats_rollup_ready
+        from database.message_writer import is_stats_rollup_enabled
         
         # Get query parameters
         limit = request.args.get('limit', default=100, type=int)
@@ -1763,21 +1916,22 @@ def get_room_ids():
             'count': len(room_ids)
         }
         
-        # Include statistics if requested
+        # Include statistics if requested - one aggregation (or rollup read) for all rooms
         if include_stats:
-            room_stats = []
-            for room_id in room_ids:
-                message_count = ChatMessage.objects(room_id=room_id).count()
-                latest_message = ChatMessage.objects(room_id=room_id).order_by('-timestamp').first()
-                
-                room_stat = {
+            use_rollup = is_stats_rollup_enabled() and is_stats_rollup_ready()
+            stats_by_room = get_rollup_room_stats(room_ids) if use_rollup else {}
+            missing_room_ids = [room_id for room_id in room_ids if room_id not in stats_by_room]
+            if missing_room_ids:
+                stats_by_room.update(get_room_stats(missing_room_ids))
+            
+            result['room_stats'] = [
+                {
                     'room_id': room_id,
-                    'message_count': message_count,
-                    'latest_timestamp': latest_message.timestamp.isoformat() if latest_message else None
+                    'message_count': stats_by_room.get(room_id, {}).get('message_count', 0),
+                    'latest_timestamp': stats_by_room.get(room_id, {}).get('latest_timestamp')
                 }
-                room_stats.append(room_stat)
-            
-            result['room_stats'] = room_stats
+                for room_id in room_ids
+            ]
         
         return jsonify(result)
         
@@ -1794,7 +1948,8 @@ def get_messages_by_room(room_id):
         if error_response:
             return error_response
             
-        from database.models import ChatMessage
+        from database.message_queries import fetch_page_with_unknown, sort_spec, UNKNOWN_ROOM_ID
+        from database.snapshot_store import needs_snapshots
         
         # Get query parameters
         limit = request.args.get('limit', default=50, type=int)
@@ -1805,15 +1960,16 @@ def get_messages_by_room(room_id):
         include_unknown_room = request.args.get('include_unknown_room', default='false').lower() == 'true'
         order_by = request.args.get('order_by', 'timestamp')
         order_direction = request.args.get('order_direction', 'desc')
+        try:
+            sort_spec(order_by)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         # Date filtering parameters
         date_filter = request.args.get('date')  # Specific date (YYYY-MM-DD)
         date_from = request.args.get('date_from')  # Start date (YYYY-MM-DD)
         date_to = request.args.get('date_to')  # End date (YYYY-MM-DD)
         
-        # Build ordering string
-        order_field = f"-{order_by}" if order_direction == 'desc' else order_by
-        
         # Build primary query
         query = {'room_id': room_id}
         
@@ -1897,143 +2053,31 @@ def get_messages_by_room(room_id):
             selected_fields = [f.strip() for f in fields.split(',')]
             print(f"📋 Selected fields: {selected_fields}")
         
-        # Get messages for the specific room
-        messages = ChatMessage.objects(**query).order_by(order_field).skip(skip).limit(limit)
-        message_list = [filter_message_fields(message.to_dict(), selected_fields) for message in messages]
-        
-        # Get total count for the specific room
-        total_count = ChatMessage.objects(**query).count()
-        
-        # If include_unknown_room is true, get timestamp range and fetch unknown room messages
-        unknown_messages = []
-        unknown_count = 0
-        
-        if include_unknown_room and message_list:
-            print(f"📋 Including unknown room_id messages within timestamp range")
-            
-            # Get timestamp range from the fetched messages
-            timestamps = [msg.get('timestamp') for msg in message_list if msg.get('timestamp')]
-            if timestamps:
-                # Convert string timestamps to datetime objects for proper MongoDB comparison
-                from datetime import datetime
-                datetime_timestamps = []
-                for ts in timestamps:
-                    if isinstance(ts, str):
-                        try:
-                            # Parse ISO format timestamp string to datetime object
-                            dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                            datetime_timestamps.append(dt)
-                        except ValueError:
-                            print(f"⚠️  Could not parse timestamp: {ts}")
-                    elif hasattr(ts, 'timestamp'):  # Already a datetime object
-                        datetime_timestamps.append(ts)
-                    else:
-                        datetime_timestamps.append(ts)
-                
-                if datetime_timestamps:
-                    min_timestamp = min(datetime_timestamps)
-                    max_timestamp = max(datetime_timestamps)
-                    
-                    print(f"🔍 Timestamp range: {min_timestamp} to {max_timestamp}")
-                    print(f"🔍 Total timestamps found: {len(timestamps)}")
-                    print(f"🔍 Converted timestamps: {len(datetime_timestamps)}")
-                else:
-                    print(f"❌ No valid timestamps could be converted")
-                    min_timestamp = max_timestamp = None
-                
-                # Build query for unknown room messages within timestamp range
-                # Skip this if we're already querying the unknown room
-                if room_id != 'unknown' and min_timestamp and max_timestamp:
-                    # Use MongoEngine syntax instead of raw MongoDB operators
-                    unknown_query = {
-                        'room_id': 'unknown',
-                        'timestamp__gte': min_timestamp,
-                        'timestamp__lte': max_timestamp
-                    }
-                    
-                    # Apply same AI filtering to unknown messages
-                    if only_ai:
-                        unknown_query['is_ai_message'] = True
-                    elif not include_ai:
-                        unknown_query['is_ai_message'] = False
-                    
-                    print(f"🔍 Unknown query: {unknown_query}")
-                    
-                    # Debug: Check if ANY unknown messages exist
-                    total_unknown = ChatMessage.objects(room_id='unknown').count()
-                    print(f"🔍 Total unknown messages in DB: {total_unknown}")
-                    
-                    # Debug: Check unknown messages around this time
-                    if total_unknown > 0:
-                        sample_unknown = ChatMessage.objects(room_id='unknown').order_by('-timestamp').limit(3)
-                        print(f"🔍 Sample unknown message timestamps:")
-                        for msg in sample_unknown:
-                            print(f"    - {msg.timestamp} ({type(msg.timestamp)})")
-                        
-                        # Debug: Test the exact query to see what's happening
-                        print(f"🔍 Testing timestamp range query...")
-                        test_query_result = ChatMessage.objects(**unknown_query)
-                        print(f"🔍 Raw query result count: {test_query_result.count()}")
-                        if test_query_result.count() > 0:
-                            for test_msg in test_query_result.limit(3):
-                                print(f"    Found: {test_msg.timestamp} - {test_msg.content[:50]}")
-                        
-                        # Debug: Try alternative MongoEngine syntax
-                        print(f"🔍 Trying MongoEngine __gte __lte syntax...")
-                        alt_query_result = ChatMessage.objects(
-                            room_id='unknown',
-                            timestamp__gte=min_timestamp,
-                            timestamp__lte=max_timestamp
-                        )
-                        print(f"🔍 Alternative query result count: {alt_query_result.count()}")
-                        if alt_query_result.count() > 0:
-                            for test_msg in alt_query_result.limit(3):
-                                print(f"    Alt Found: {test_msg.timestamp} - {test_msg.content[:50]}")
-                        
-                        # Debug: Check if there are any unknown messages in September 1st
-                        from datetime import datetime
-                        sep_1_start = datetime(2025, 9, 1)
-                        sep_1_end = datetime(2025, 9, 2)
-                        sep_1_count = ChatMessage.objects(room_id='unknown', timestamp__gte=sep_1_start, timestamp__lt=sep_1_end).count()
-                        print(f"🔍 Unknown messages on Sep 1, 2025: {sep_1_count}")
-                        
-                        # Debug: Check messages in exact time range using MongoEngine syntax
-                        exact_range_count = ChatMessage.objects(
-                            room_id='unknown',
-                            timestamp__gte=min_timestamp,
-                            timestamp__lte=max_timestamp
-                        ).count()
-                        print(f"🔍 Messages in exact range using __gte/__lte: {exact_range_count}")
-                    
-                    # Get unknown room messages within the timestamp range
-                    unknown_msg_objects = ChatMessage.objects(**unknown_query).order_by(order_field)
-                    unknown_messages = [filter_message_fields(msg.to_dict(), selected_fields) for msg in unknown_msg_objects]
-                    unknown_count = len(unknown_messages)
-                    
-                    print(f"📋 Found {unknown_count} unknown room messages in timestamp range")
-                else:
-                    print(f"📋 Skipping unknown room search since we're already querying room_id='unknown'")
-        
-        elif include_unknown_room and not message_list:
-            print(f"📋 No messages found for room {room_id}, cannot determine timestamp range for unknown messages")
+        # Fetch the page server-side - unknown room messages from the same time window are
+        # merged into the same sorted, paginated result in a single aggregation
+        shared_filters = {key: value for key, value in query.items() if key != 'room_id'}
+        page = fetch_page_with_unknown(
+            {'room_id': room_id}, shared_filters,
+            order_by=order_by, descending=(order_direction == 'desc'),
+            skip=skip, limit=limit,
+            include_unknown=include_unknown_room and room_id != UNKNOWN_ROOM_ID
+        )
+        message_dicts = [message.to_dict() for message in page['messages']]
+        if needs_snapshots(selected_fields):
+            get_snapshot_store().hydrate_messages(message_dicts)
+        all_messages = [filter_message_fields(message_dict, selected_fields) for message_dict in message_dicts]
         
-        # Combine and sort all messages if we have both
-        all_messages = message_list + unknown_messages
-        if include_unknown_room and unknown_messages:
-            # Sort combined messages by timestamp
-            if order_by == 'timestamp':
-                reverse_sort = (order_direction == 'desc')
-                all_messages.sort(key=lambda x: x.get('timestamp', ''), reverse=reverse_sort)
-            print(f"📋 Combined {len(message_list)} room messages with {len(unknown_messages)} unknown messages")
+        if include_unknown_room:
+            print(f"📋 Merged {page['primary_count']} room messages with {page['unknown_count']} unknown messages")
         
         return jsonify({
             'success': True,
             'room_id': room_id,
-            'messages': all_messages if include_unknown_room else message_list,
-            'room_message_count': len(message_list),
-            'unknown_message_count': unknown_count,
+            'messages': all_messages,
+            'room_message_count': page['primary_count'],
+            'unknown_message_count': page['unknown_count'],
             'total_messages': len(all_messages),
-            'room_total': total_count,
+            'room_total': page['primary_total'],
             'skip': skip,
             'limit': limit,
             'selected_fields': selected_fields,
@@ -2059,7 +2103,8 @@ def get_messages_by_room_prefix(prefix):
             return error_response
             
         from database.models import ChatMessage
-        import re
+        from database.message_queries import fetch_page_with_unknown, room_prefix_filter, sort_spec, UNKNOWN_ROOM_ID
+        from database.snapshot_store import needs_snapshots
         
         # Get query parameters
         limit = request.args.get('limit', default=100, type=int)
@@ -2075,13 +2120,9 @@ def get_messages_by_room_prefix(prefix):
         date_from = request.args.get('date_from')  # Start date (YYYY-MM-DD)
         date_to = request.args.get('date_to')  # End date (YYYY-MM-DD)
         
-        # Build regex pattern for room_id prefix matching
-        # Escape special regex characters in prefix and add .* for anything after
-        escaped_prefix = re.escape(prefix)
-        room_pattern = f"^{escaped_prefix}.*"
-        
-        # Build query with regex for room_id
-        query = {'room_id': {'$regex': room_pattern, '$options': 'i'}}  # case insensitive
+        # Case-insensitive room_id prefix match (index range scan on room_id_lc)
+        prefix_filter = room_prefix_filter(prefix)
+        query = {}
         
         # Handle AI message filtering
         if only_ai:
@@ -2124,8 +2165,7 @@ def get_messages_by_room_prefix(prefix):
                 return jsonify({'success': False, 'error': 'Invalid date format. Use YYYY-MM-DD format.'}), 400
         
         print(f"�🔍 Searching for rooms with prefix: {prefix}")
-        print(f"🔍 Using regex pattern: {room_pattern}")
-        print(f"🔍 Final query: {query}")
+        print(f"🔍 Final query: {query} {prefix_filter}")
         
         # Helper function to filter message fields with support for nested fields
         def filter_message_fields(message_dict, selected_fields=None):
@@ -2172,12 +2212,16 @@ def get_messages_by_room_prefix(prefix):
             print(f"📋 Selected fields: {selected_fields}")
         
         # Get matching room IDs first
-        matching_room_ids = ChatMessage.objects(**query).distinct('room_id')
+        matching_room_ids = ChatMessage.objects(**prefix_filter, **query).distinct('room_id')
         print(f"📋 Found {len(matching_room_ids)} matching rooms: {matching_room_ids}")
         
         # Get order parameter (default to timestamp descending for chronological view)
         order_by = request.args.get('order_by', 'timestamp')
         order_direction = request.args.get('order_direction', 'desc')
+        try:
+            sort_spec(order_by)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         # Build ordering string
         order_field = f"-{order_by}" if order_direction == 'desc' else order_by
@@ -2192,7 +2236,10 @@ def get_messages_by_room_prefix(prefix):
                 room_query['room_id'] = room_id
                 
                 room_messages = ChatMessage.objects(**room_query).order_by(order_field).limit(limit)
-                room_message_list = [filter_message_fields(message.to_dict(), selected_fields) for message in room_messages]
+                room_message_dicts = [message.to_dict() for message in room_messages]
+                if needs_snapshots(selected_fields):
+                    get_snapshot_store().hydrate_messages(room_message_dicts)
+                room_message_list = [filter_message_fields(message_dict, selected_fields) for message_dict in room_message_dicts]
                 room_total = ChatMessage.objects(**room_query).count()
                 
                 result_by_room[room_id] = {
@@ -2218,91 +2265,33 @@ def get_messages_by_room_prefix(prefix):
                 'date_to': date_to
             })
         else:
-            # Get all messages from matching rooms (flat list) - ordered by timestamp across all rooms
-            messages = ChatMessage.objects(**query).order_by(order_field).skip(skip).limit(limit)
-            message_list = [filter_message_fields(message.to_dict(), selected_fields) for message in messages]
-            total_count = ChatMessage.objects(**query).count()
-            
-            # If include_unknown_room is true, get timestamp range and fetch unknown room messages
-            unknown_messages = []
-            unknown_count = 0
-            
-            if include_unknown_room and message_list:
-                print(f"📋 Including unknown room_id messages within timestamp range for prefix {prefix}")
-                
-                # Get timestamp range from the fetched messages
-                timestamps = [msg.get('timestamp') for msg in message_list if msg.get('timestamp')]
-                if timestamps:
-                    # Convert string timestamps to datetime objects for proper MongoDB comparison
-                    from datetime import datetime
-                    datetime_timestamps = []
-                    for ts in timestamps:
-                        if isinstance(ts, str):
-                            try:
-                                # Parse ISO format timestamp string to datetime object
-                                dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                                datetime_timestamps.append(dt)
-                            except ValueError:
-                                print(f"⚠️  Could not parse timestamp: {ts}")
-                        elif hasattr(ts, 'timestamp'):  # Already a datetime object
-                            datetime_timestamps.append(ts)
-                        else:
-                            datetime_timestamps.append(ts)
-                    
-                    if datetime_timestamps:
-                        min_timestamp = min(datetime_timestamps)
-                        max_timestamp = max(datetime_timestamps)
-                        
-                        print(f"🔍 Timestamp range for prefix {prefix}: {min_timestamp} to {max_timestamp}")
-                        
-                        # Build query for unknown room messages within timestamp range
-                        # Only include if prefix doesn't already match 'unknown'
-                        if not re.match(f"^{re.escape(prefix)}.*", 'unknown', re.IGNORECASE):
-                            unknown_query = {
-                                'room_id': 'unknown',
-                                'timestamp__gte': min_timestamp,
-                                'timestamp__lte': max_timestamp
-                            }
-                            
-                            # Apply same AI filtering to unknown messages
-                            if only_ai:
-                                unknown_query['is_ai_message'] = True
-                            elif not include_ai:
-                                unknown_query['is_ai_message'] = False
-                            
-                            print(f"🔍 Unknown query for prefix {prefix}: {unknown_query}")
-                            
-                            # Get unknown room messages within the timestamp range
-                            unknown_msg_objects = ChatMessage.objects(**unknown_query).order_by(order_field)
-                            unknown_messages = [filter_message_fields(msg.to_dict(), selected_fields) for msg in unknown_msg_objects]
-                            unknown_count = len(unknown_messages)
-                            
-                            print(f"📋 Found {unknown_count} unknown room messages in timestamp range for prefix {prefix}")
-                        else:
-                            print(f"📋 Skipping unknown room search since prefix '{prefix}' already matches 'unknown'")
-            
-            elif include_unknown_room and not message_list:
-                print(f"📋 No messages found for prefix {prefix}, cannot determine timestamp range for unknown messages")
+            # Get all messages from matching rooms (flat list) - ordered by timestamp across all rooms,
+            # with unknown room messages from the same time window merged server-side when requested
+            prefix_matches_unknown = UNKNOWN_ROOM_ID.startswith(prefix.lower())
+            page = fetch_page_with_unknown(
+                prefix_filter, query,
+                order_by=order_by, descending=(order_direction == 'desc'),
+                skip=skip, limit=limit,
+                include_unknown=include_unknown_room and not prefix_matches_unknown
+            )
+            message_dicts = [message.to_dict() for message in page['messages']]
+            if needs_snapshots(selected_fields):
+                get_snapshot_store().hydrate_messages(message_dicts)
+            all_messages = [filter_message_fields(message_dict, selected_fields) for message_dict in message_dicts]
             
-            # Combine and sort all messages if we have both
-            all_messages = message_list + unknown_messages
-            if include_unknown_room and unknown_messages:
-                # Sort combined messages by timestamp
-                if order_by == 'timestamp':
-                    reverse_sort = (order_direction == 'desc')
-                    all_messages.sort(key=lambda x: x.get('timestamp', ''), reverse=reverse_sort)
-                print(f"📋 Combined {len(message_list)} prefix messages with {len(unknown_messages)} unknown messages")
+            if include_unknown_room:
+                print(f"📋 Merged {page['primary_count']} prefix messages with {page['unknown_count']} unknown messages")
             
             return jsonify({
                 'success': True,
                 'prefix': prefix,
                 'matching_rooms': matching_room_ids,
                 'room_count': len(matching_room_ids),
-                'messages': all_messages if include_unknown_room else message_list,
-                'prefix_message_count': len(message_list),
-                'unknown_message_count': unknown_count,
+                'messages': all_messages,
+                'prefix_message_count': page['primary_count'],
+                'unknown_message_count': page['unknown_count'],
                 'total_messages': len(all_messages),
-                'prefix_total': total_count,
+                'prefix_total': page['primary_total'],
                 'skip': skip,
                 'limit': limit,
                 'grouped': False,
@@ -2329,9 +2318,10 @@ def get_messages_by_room_prefix_csv(prefix):
             return error_response
             
         from database.models import ChatMessage
+        from database.message_queries import fetch_page_with_unknown, room_prefix_filter, sort_spec, UNKNOWN_ROOM_ID
+        from database.snapshot_store import needs_snapshots
         import csv
         from io import StringIO
-        import re
         
         # Get query parameters
         limit = request.args.get('limit', default=1000, type=int)  # Higher default for CSV
@@ -2346,12 +2336,9 @@ def get_messages_by_room_prefix_csv(prefix):
         date_from = request.args.get('date_from')  # Start date (YYYY-MM-DD)
         date_to = request.args.get('date_to')  # End date (YYYY-MM-DD)
         
-        # Build regex pattern for room_id prefix matching
-        escaped_prefix = re.escape(prefix)
-        room_pattern = f"^{escaped_prefix}.*"
-        
-        # Build query with regex for room_id
-        query = {'room_id': {'$regex': room_pattern, '$options': 'i'}}
+        # Case-insensitive room_id prefix match (index range scan on room_id_lc)
+        prefix_filter = room_prefix_filter(prefix)
+        query = {}
         
         # Handle AI message filtering
         if only_ai:
@@ -2394,8 +2381,7 @@ def get_messages_by_room_prefix_csv(prefix):
                 return jsonify({'success': False, 'error': 'Invalid date format. Use YYYY-MM-DD format.'}), 400
         
         print(f"�🔍 CSV Export: Searching for rooms with prefix: {prefix}")
-        print(f"🔍 CSV Export: Using regex pattern: {room_pattern}")
-        print(f"🔍 CSV Export: Final query: {query}")
+        print(f"🔍 CSV Export: Final query: {query} {prefix_filter}")
         
         # Parse fields parameter
         selected_fields = [f.strip() for f in fields.split(',')]
@@ -2404,62 +2390,24 @@ def get_messages_by_room_prefix_csv(prefix):
         # Get order parameters
         order_by = request.args.get('order_by', 'timestamp')
         order_direction = request.args.get('order_direction', 'asc')  # Default ascending for CSV
-        order_field = f"-{order_by}" if order_direction == 'desc' else order_by
-        
-        # Get all messages from matching rooms ordered by timestamp
-        messages = ChatMessage.objects(**query).order_by(order_field).skip(skip).limit(limit)
-        message_list = list(messages)  # Convert to list for processing
-        
-        # If include_unknown_room is true, get timestamp range and fetch unknown room messages
-        unknown_messages = []
-        
-        if include_unknown_room and message_list:
-            print(f"📋 CSV Export: Including unknown room_id messages within timestamp range for prefix {prefix}")
-            
-            # Get timestamp range from the fetched messages
-            timestamps = [msg.timestamp for msg in message_list if msg.timestamp]
-            if timestamps:
-                min_timestamp = min(timestamps)
-                max_timestamp = max(timestamps)
-                
-                print(f"🔍 CSV Export: Timestamp range for prefix {prefix}: {min_timestamp} to {max_timestamp}")
-                
-                # Build query for unknown room messages within timestamp range
-                # Only include if prefix doesn't already match 'unknown'
-                if not re.match(f"^{re.escape(prefix)}.*", 'unknown', re.IGNORECASE):
-                    unknown_query = {
-                        'room_id': 'unknown',
-                        'timestamp__gte': min_timestamp,
-                        'timestamp__lte': max_timestamp
-                    }
-                    
-                    # Apply same AI filtering to unknown messages
-                    if only_ai:
-                        unknown_query['is_ai_message'] = True
-                    elif not include_ai:
-                        unknown_query['is_ai_message'] = False
-                    
-                    print(f"🔍 CSV Export: Unknown query for prefix {prefix}: {unknown_query}")
-                    
-                    # Get unknown room messages within the timestamp range
-                    unknown_msg_objects = ChatMessage.objects(**unknown_query).order_by(order_field)
-                    unknown_messages = list(unknown_msg_objects)
-                    
-                    print(f"📋 CSV Export: Found {len(unknown_messages)} unknown room messages in timestamp range for prefix {prefix}")
-                else:
-                    print(f"📋 CSV Export: Skipping unknown room search since prefix '{prefix}' already matches 'unknown'")
-        
-        elif include_unknown_room and not message_list:
-            print(f"📋 CSV Export: No messages found for prefix {prefix}, cannot determine timestamp range for unknown messages")
+        try:
+            sort_spec(order_by)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Get all messages from matching rooms ordered by timestamp, with unknown room messages
+        # from the same time window merged server-side when requested
+        prefix_matches_unknown = UNKNOWN_ROOM_ID.startswith(prefix.lower())
+        page = fetch_page_with_unknown(
+            prefix_filter, query,
+            order_by=order_by, descending=(order_direction == 'desc'),
+            skip=skip, limit=limit,
+            include_unknown=include_unknown_room and not prefix_matches_unknown
+        )
+        all_messages = page['messages']
         
-        # Combine all messages
-        all_messages = message_list + unknown_messages
-        if include_unknown_room and unknown_messages:
-            # Sort combined messages by timestamp
-            if order_by == 'timestamp':
-                reverse_sort = (order_direction == 'desc')
-                all_messages.sort(key=lambda x: x.timestamp, reverse=reverse_sort)
-            print(f"📋 CSV Export: Combined {len(message_list)} prefix messages with {len(unknown_messages)} unknown messages")
+        if include_unknown_room:
+            print(f"📋 CSV Export: Merged {page['primary_count']} prefix messages with {page['unknown_count']} unknown messages")
         
         # Create CSV in memory
         output = StringIO()
@@ -2469,8 +2417,10 @@ def get_messages_by_room_prefix_csv(prefix):
         writer.writerow(selected_fields)
         
         # Write data rows
-        for message in all_messages:
-            message_dict = message.to_dict()
+        message_dicts = [message.to_dict() for message in all_messages]
+        if needs_snapshots(selected_fields):
+            get_snapshot_store().hydrate_messages(message_dicts)
+        for message_dict in message_dicts:
             row = []
             for field in selected_fields:
                 # Handle nested field access with dot notation (e.g., extra_data.code_block)
@@ -2516,8 +2466,8 @@ def get_messages_by_room_prefix_csv(prefix):
         output.close()
         
         # Count total matching messages for metadata
-        total_count = ChatMessage.objects(**query).count()
-        matching_room_ids = ChatMessage.objects(**query).distinct('room_id')
+        total_count = page['primary_total']
+        matching_room_ids = ChatMessage.objects(**prefix_filter, **query).distinct('room_id')
         
         # Calculate row count for logging (avoid backslash in f-string)
         csv_lines = csv_content.split('\n')
@@ -2533,8 +2483,8 @@ def get_messages_by_room_prefix_csv(prefix):
                 'X-Total-Count': str(total_count),
                 'X-Room-Count': str(len(matching_room_ids)),
                 'X-Selected-Fields': ','.join(selected_fields),
-                'X-Prefix-Message-Count': str(len(message_list)),
-                'X-Unknown-Message-Count': str(len(unknown_messages)),
+                'X-Prefix-Message-Count': str(page['primary_count']),
+                'X-Unknown-Message-Count': str(page['unknown_count']),
                 'X-Total-Messages': str(len(all_messages)),
                 'X-Include-Unknown-Room': str(include_unknown_room),
                 'X-Date-Filter': str(date_filter) if date_filter else '',
@@ -0,0 +1,135 @@
+"""
+Logging configuration - leveled, structured logging with queued output
+
+init_logging() routes every record through a bounded queue: the socket, timer and writer
+threads only enqueue, and a single listener thread formats and writes to stdout. Per-event
+loggers (code deltas, cursor moves, audio chunks) are sampled so they cannot flood the log.
+
+Environment:
+    LOG_LEVEL              root level (default INFO)
+    LOG_FORMAT             'text' (default) or 'json' (one object per line, for log shipping)
+    LOG_EVENT_SAMPLE_RATE  fraction of per-event INFO/DEBUG records kept (default 0.01)
+    LOG_QUEUE_SIZE         records buffered before new ones are dropped (default 10000)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has - anything else was passed via extra= and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s [%(threadName)s] %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of INFO/DEBUG records; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that only renders the message text on the calling thread (so mutable
+    arguments are captured) and leaves formatting to the listener. Records are dropped,
+    not blocked on, when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Global listener state
+_listener = None
+_queue_handler = None
+_logging_lock = threading.Lock()
+
+def init_logging():
+    """Configure root logging from the environment (safe to call more than once)"""
+    global _listener, _queue_handler
+    with _logging_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if os.environ.get('LOG_FORMAT', 'text').lower() == 'json':
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        root.handlers = [_queue_handler]
+        root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Module logger"""
+    return logging.getLogger(name)
+
+
+def get_event_logger(name: str) -> logging.Logger:
+    """Sampled logger for per-event messages (rate from LOG_EVENT_SAMPLE_RATE)"""
+    logger = logging.getLogger(f"{name}.events")
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(float(os.environ.get('LOG_EVENT_SAMPLE_RATE', 0.01))))
+    return logger
+
+
+def dropped_log_records() -> int:
+    """Records dropped because the log queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
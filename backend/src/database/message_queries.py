@@ -0,0 +1,289 @@
+"""
+Server-side query and aggregation helpers for chat message retrieval and statistics
+"""
+
+import re
+import threading
+
+from database.models import ChatMessage, RoomStatsRollup
+
+# Messages saved before the frontend knew its room are stored under this id
+UNKNOWN_ROOM_ID = 'unknown'
+
+# Set once every stored message has a room_id_lc value
+_room_id_lc_ready = threading.Event()
+
+# Set once the stats rollup has been rebuilt from the stored messages
+_stats_rollup_ready = threading.Event()
+
+
+def room_prefix_filter(prefix: str) -> dict:
+    """
+    Case-insensitive room prefix filter as an index range scan on room_id_lc.
+    Falls back to the anchored regex until the room_id_lc backfill has finished.
+    """
+    if not _room_id_lc_ready.is_set():
+        return {'room_id': {'$regex': f"^{re.escape(prefix)}", '$options': 'i'}}
+    prefix_lc = prefix.lower()
+    return {'room_id_lc__gte': prefix_lc, 'room_id_lc__lt': prefix_lc + '\uffff'}
+
+
+def backfill_room_id_lc():
+    """Populate room_id_lc on messages written before the field existed (server-side, idempotent)"""
+    try:
+        ChatMessage.ensure_indexes()
+        result = ChatMessage._get_collection().update_many(
+            {'room_id_lc': {'$exists': False}},
+            [{'$set': {'room_id_lc': {'$toLower': '$room_id'}}}]
+        )
+        if result.modified_count:
+            print(f"🔡 Backfilled room_id_lc on {result.modified_count} messages")
+        _room_id_lc_ready.set()
+    except Exception as e:
+        print(f"⚠️  room_id_lc backfill failed - prefix queries will keep using regex: {e}")
+
+
+def start_room_id_lc_backfill():
+    """Run the room_id_lc backfill in a background thread"""
+    threading.Thread(target=backfill_room_id_lc, name="room-id-lc-backfill", daemon=True).start()
+
+
+def to_mongo_filter(filters: dict) -> dict:
+    """Translate MongoEngine-style keyword filters (e.g. timestamp__gte) into a raw MongoDB filter"""
+    return ChatMessage.objects(**filters)._query
+
+
+def get_timestamp_window(match: dict):
+    """Return (first, last) timestamps of the messages matching a raw filter, or (None, None)"""
+    result = list(ChatMessage._get_collection().aggregate([
+        {'$match': match},
+        {'$group': {'_id': None, 'first': {'$min': '$timestamp'}, 'last': {'$max': '$timestamp'}}}
+    ]))
+    if not result:
+        return None, None
+    return result[0]['first'], result[0]['last']
+
+
+def sort_spec(order_by: str, descending: bool = True) -> tuple:
+    """
+    (db field, direction) for sorting by a ChatMessage field name. A leading '-' or '+' (MongoEngine
+    style) overrides descending. Raises ValueError for unknown fields.
+    """
+    name = (order_by or '').strip()
+    if name and name[0] in '-+':
+        descending = name[0] == '-'
+        name = name[1:]
+    field = ChatMessage._fields.get(name)
+    if field is None:
+        raise ValueError(f"Unknown order_by field: {order_by!r}")
+    return field.db_field, -1 if descending else 1
+
+
+def fetch_page_with_unknown(primary_filters: dict, shared_filters: dict, order_by: str = 'timestamp',
+                            descending: bool = True, skip: int = 0, limit: int = 50,
+                            include_unknown: bool = False) -> dict:
+    """
+    Fetch one page of messages matching primary_filters, optionally merged with messages from the
+    'unknown' room that fall inside the primary messages' time window.
+
+    Both sources are matched with a single $or and paged with $sort/$skip/$limit directly in the
+    pipeline, so MongoDB keeps only the top skip + limit documents while sorting (or walks an index
+    on the sort field). The primary total is a separate count with no sort.
+
+    Args:
+        primary_filters: Filters selecting the requested room(s), e.g. {'room_id': room_id}
+        shared_filters: Filters applied to both sources (AI filtering, date range)
+        include_unknown: Merge in 'unknown' room messages from the same time window
+
+    Returns:
+        dict with 'messages' (ChatMessage documents), 'primary_total', 'primary_count' and 'unknown_count'
+    """
+    primary_match = to_mongo_filter({**primary_filters, **shared_filters})
+    match = primary_match
+
+    if include_unknown:
+        first, last = get_timestamp_window(primary_match)
+        if first is not None:
+            unknown_match = to_mongo_filter({
+                **shared_filters,
+                'room_id': UNKNOWN_ROOM_ID,
+                'timestamp__gte': max(first, shared_filters.get('timestamp__gte', first)),
+                'timestamp__lte': min(last, shared_filters.get('timestamp__lte', last))
+            })
+            match = {'$or': [primary_match, unknown_match]}
+        else:
+            include_unknown = False
+
+    sort_field, direction = sort_spec(order_by, descending)
+    collection = ChatMessage._get_collection()
+    pipeline = [
+        {'$match': match},
+        {'$sort': {sort_field: direction, '_id': direction}},
+        {'$skip': skip},
+        {'$limit': limit}
+    ]
+
+    messages = [ChatMessage._from_son(doc) for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+    unknown_count = sum(1 for msg in messages if include_unknown and msg.room_id == UNKNOWN_ROOM_ID)
+
+    return {
+        'messages': messages,
+        'primary_total': collection.count_documents(primary_match),
+        'primary_count': len(messages) - unknown_count,
+        'unknown_count': unknown_count
+    }
+
+
+def _empty_stats() -> dict:
+    return {
+        'total_messages': 0,
+        'user_messages': 0,
+        'ai_messages': 0,
+        'ai_trigger_breakdown': {},
+        'conversation_duration': None,
+        'average_response_time': None
+    }
+
+
+def get_conversation_stats(filters: dict, include_rooms: bool = False) -> dict:
+    """
+    Compute conversation statistics in a single aggregation round trip.
+
+    Returns totals, user vs AI counts, AI trigger breakdown and duration, plus a
+    'room_stats' list when include_rooms is set.
+    """
+    facets = {
+        'totals': [{'$group': {
+            '_id': None,
+            'total': {'$sum': 1},
+            'ai': {'$sum': {'$cond': [{'$eq': ['$is_ai_message', True]}, 1, 0]}},
+            'first': {'$min': '$timestamp'},
+            'last': {'$max': '$timestamp'}
+        }}],
+        'triggers': [
+            {'$match': {'is_ai_message': True}},
+            {'$group': {'_id': {'$ifNull': ['$ai_trigger_type', 'unknown']}, 'count': {'$sum': 1}}}
+        ]
+    }
+    if include_rooms:
+        facets['rooms'] = [
+            {'$group': {'_id': '$room_id', 'message_count': {'$sum': 1}, 'latest_timestamp': {'$max': '$timestamp'}}},
+            {'$sort': {'latest_timestamp': -1}}
+        ]
+
+    result = next(ChatMessage._get_collection().aggregate([
+        {'$match': to_mongo_filter(filters)},
+        {'$facet': facets}
+    ], allowDiskUse=True))
+
+    stats = _empty_stats()
+    if result['totals']:
+        totals = result['totals'][0]
+        stats['total_messages'] = totals['total']
+        stats['ai_messages'] = totals['ai']
+        stats['user_messages'] = totals['total'] - totals['ai']
+        if totals['first'] and totals['last']:
+            stats['conversation_duration'] = (totals['last'] - totals['first']).total_seconds()
+    stats['ai_trigger_breakdown'] = {group['_id']: group['count'] for group in result['triggers']}
+
+    if include_rooms:
+        stats['room_stats'] = [
+            {
+                'room_id': group['_id'],
+                'message_count': group['message_count'],
+                'latest_timestamp': group['latest_timestamp'].isoformat() if group['latest_timestamp'] else None
+            }
+            for group in result['rooms']
+        ]
+    return stats
+
+
+def get_room_stats(room_ids: list) -> dict:
+    """Return {room_id: {'message_count', 'latest_timestamp'}} for many rooms with one $group"""
+    groups = ChatMessage._get_collection().aggregate([
+        {'$match': {'room_id': {'$in': list(room_ids)}}},
+        {'$group': {'_id': '$room_id', 'message_count': {'$sum': 1}, 'latest_timestamp': {'$max': '$timestamp'}}}
+    ])
+    return {
+        group['_id']: {
+            'message_count': group['message_count'],
+            'latest_timestamp': group['latest_timestamp'].isoformat() if group['latest_timestamp'] else None
+        }
+        for group in groups
+    }
+
+
+def get_rollup_room_stats(room_ids: list) -> dict:
+    """Same shape as get_room_stats, read from the materialized rollup collection"""
+    return {
+        rollup.room_id: {
+            'message_count': rollup.total_messages,
+            'latest_timestamp': rollup.last_timestamp.isoformat() if rollup.last_timestamp else None
+        }
+        for rollup in RoomStatsRollup.objects(room_id__in=list(room_ids))
+    }
+
+
+def is_stats_rollup_ready() -> bool:
+    """Whether the rollup covers messages written before the writer started keeping it"""
+    return _stats_rollup_ready.is_set()
+
+
+def start_stats_rollup_rebuild():
+    """Rebuild the rollup in a background thread; stats use the raw aggregation until it is done"""
+    def rebuild():
+        try:
+            rebuild_stats_rollup()
+            print("📊 Room stats rollup rebuilt from stored messages")
+        except Exception as e:
+            print(f"⚠️  Room stats rollup rebuild failed - stats will keep using the raw aggregation: {e}")
+
+    threading.Thread(target=rebuild, name="stats-rollup-rebuild", daemon=True).start()
+
+
+def rebuild_stats_rollup():
+    """Recompute the whole rollup collection from raw messages with a server-side $merge"""
+    RoomStatsRollup.ensure_indexes()
+    ChatMessage._get_collection().aggregate([
+        {'$group': {
+            '_id': {
+                'room': '$room_id',
+                'trigger': {'$cond': [
+                    {'$eq': ['$is_ai_message', True]},
+                    {'$ifNull': ['$ai_trigger_type', 'unknown']},
+                    None
+                ]}
+            },
+            'count': {'$sum': 1},
+            'first': {'$min': '$timestamp'},
+            'last': {'$max': '$timestamp'}
+        }},
+        {'$group': {
+            '_id': '$_id.room',
+            'total': {'$sum': '$count'},
+            'ai': {'$sum': {'$cond': [{'$ne': ['$_id.trigger', None]}, '$count', 0]}},
+            'triggers': {'$push': {'k': '$_id.trigger', 'v': '$count'}},
+            'first': {'$min': '$first'},
+            'last': {'$max': '$last'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'room_id': '$_id',
+            'total_messages': '$total',
+            'ai_messages': '$ai',
+            'user_messages': {'$subtract': ['$total', '$ai']},
+            'ai_trigger_breakdown': {'$arrayToObject': {
+                '$filter': {'input': '$triggers', 'cond': {'$ne': ['$$this.k', None]}}
+            }},
+            'first_timestamp': '$first',
+            'last_timestamp': '$last',
+            'updated_at': '$$NOW'
+        }},
+        {'$merge': {
+            'into': RoomStatsRollup._get_collection_name(),
+            'on': 'room_id',
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ], allowDiskUse=True)
+    _stats_rollup_ready.set()
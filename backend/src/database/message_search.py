@@ -0,0 +1,306 @@
+"""
+Message search - MongoDB text index search with an optional local inverted index
+
+Query syntax (both backends):
+    two sum          messages containing any of the words, best matches first
+    "hash map"       exact phrase (required)
+    recurs*          word prefix (required)
+    -bob             exclude messages containing the word
+"""
+
+import bisect
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from database.models import ChatMessage
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_QUERY_PATTERN = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+
+# extra_data fields included in the search index (keep in sync with the ChatMessage text index)
+SEARCHABLE_EXTRA_FIELDS = ('current_line_trimmed', 'original_comment', 'original_todo')
+
+
+def get_search_backend() -> str:
+    """Configured search backend: 'mongo' (text index), 'local' (in-process inverted index) or 'regex'"""
+    return os.environ.get('MESSAGE_SEARCH_BACKEND', 'mongo').lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used by the local index"""
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def searchable_text(doc: dict) -> str:
+    """Content plus the searchable extra_data fields of a message document or dict"""
+    text = doc.get('content') or ''
+    extra_data = doc.get('extra_data') or {}
+    for key in SEARCHABLE_EXTRA_FIELDS:
+        if extra_data.get(key):
+            text += f"\n{extra_data[key]}"
+    return text
+
+
+@dataclass
+class SearchQuery:
+    terms: List[str] = field(default_factory=list)
+    phrases: List[List[str]] = field(default_factory=list)
+    prefixes: List[str] = field(default_factory=list)
+    excluded: List[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.terms or self.phrases or self.prefixes)
+
+    def to_mongo_text(self) -> str:
+        """Render as a MongoDB $text search string"""
+        parts = list(self.terms)
+        # $text has no prefix operator - the word stem still matches most inflections
+        parts.extend(self.prefixes)
+        parts.extend(f'"{" ".join(phrase)}"' for phrase in self.phrases)
+        parts.extend(f"-{word}" for word in self.excluded)
+        return " ".join(parts)
+
+
+def parse_search_query(query_text: str) -> SearchQuery:
+    """Parse words, "quoted phrases", prefix* and -excluded words"""
+    query = SearchQuery()
+    for phrase_negated, phrase, word_negated, word in _QUERY_PATTERN.findall(query_text):
+        if phrase:
+            tokens = tokenize(phrase)
+            if phrase_negated:
+                query.excluded.extend(tokens)
+            elif len(tokens) > 1:
+                query.phrases.append(tokens)
+            else:
+                query.terms.extend(tokens)
+        elif word.endswith('*') and not word_negated:
+            query.prefixes.extend(tokenize(word[:-1])[:1])
+        else:
+            tokens = tokenize(word)
+            (query.excluded if word_negated else query.terms).extend(tokens)
+    return query
+
+
+@dataclass
+class _IndexedDocument:
+    room_id: str
+    user_id: str
+    length: int
+
+
+class LocalSearchIndex:
+    """
+    In-process inverted index over message content for deployments without MongoDB text search.
+    Postings keep token positions so phrases can be verified; a sorted vocabulary serves prefixes.
+    Ranking is BM25.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, List[int]]] = defaultdict(dict)  # term -> {doc_id: [positions]}
+        self._vocabulary: List[str] = []  # sorted terms for prefix lookup
+        self._documents: Dict[str, _IndexedDocument] = {}
+        self._total_length = 0
+        self.ready = threading.Event()  # set once build_from_db has indexed every stored message
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id: str, text: str, room_id: str = None, user_id: str = None):
+        """Index one message (re-adding an id is ignored)"""
+        tokens = tokenize(text)
+        with self._lock:
+            if doc_id in self._documents:
+                return
+            self._documents[doc_id] = _IndexedDocument(room_id, user_id, len(tokens))
+            self._total_length += len(tokens)
+            for position, token in enumerate(tokens):
+                postings = self._postings[token]
+                if not postings:
+                    bisect.insort(self._vocabulary, token)
+                postings.setdefault(doc_id, []).append(position)
+
+    def add_message_document(self, doc: dict):
+        """Index a raw chat_messages document as inserted by the message writer"""
+        self.add(str(doc['_id']), searchable_text(doc), doc.get('room_id'), doc.get('user_id'))
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        return self._vocabulary[start:end]
+
+    def _phrase_docs(self, phrase: List[str]) -> set:
+        first_postings = self._postings.get(phrase[0], {})
+        matches = set()
+        for doc_id, positions in first_postings.items():
+            following = [self._postings.get(token, {}).get(doc_id) for token in phrase[1:]]
+            if not all(following):
+                continue
+            following_sets = [set(p) for p in following]
+            if any(all(start + offset + 1 in following_sets[offset] for offset in range(len(following_sets)))
+                   for start in positions):
+                matches.add(doc_id)
+        return matches
+
+    def search(self, query: SearchQuery, room_id: str = None, user_id: str = None, limit: int = 50) -> List[tuple]:
+        """Return [(doc_id, score)] ranked by BM25 - any word may match, phrases and prefixes are required"""
+        with self._lock:
+            if query.is_empty() or not self._documents:
+                return []
+
+            prefix_terms = [self._expand_prefix(prefix) for prefix in query.prefixes]
+            required = [self._phrase_docs(phrase) for phrase in query.phrases]
+            required.extend({doc_id for term in terms for doc_id in self._postings.get(term, {})} for terms in prefix_terms)
+
+            candidates = None
+            if query.terms:
+                candidates = {doc_id for term in query.terms for doc_id in self._postings.get(term, {})}
+            for docs in required:
+                candidates = docs if candidates is None else candidates & docs
+            if not candidates:
+                return []
+
+            for word in query.excluded:
+                candidates -= set(self._postings.get(word, {}))
+
+            if room_id or user_id:
+                candidates = {
+                    doc_id for doc_id in candidates
+                    if (not room_id or self._documents[doc_id].room_id == room_id)
+                    and (not user_id or self._documents[doc_id].user_id == user_id)
+                }
+
+            total_docs = len(self._documents)
+            average_length = self._total_length / total_docs or 1
+            scoring_terms = set(query.terms)
+            scoring_terms.update(term for terms in prefix_terms for term in terms)
+            scoring_terms.update(term for phrase in query.phrases for term in phrase)
+            scores = []
+            for doc_id in candidates:
+                length = self._documents[doc_id].length
+                score = 0.0
+                for term in scoring_terms:
+                    postings = self._postings.get(term)
+                    if not postings or doc_id not in postings:
+                        continue
+                    tf = len(postings[doc_id])
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+                scores.append((doc_id, score))
+
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:limit] if limit else scores
+
+    def build_from_db(self, batch_size: int = 1000):
+        """Index every stored message, streaming only the fields the index needs"""
+        projection = {'content': 1, 'room_id': 1, 'user_id': 1}
+        projection.update({f'extra_data.{key}': 1 for key in SEARCHABLE_EXTRA_FIELDS})
+        count = 0
+        for doc in ChatMessage._get_collection().find({}, projection, batch_size=batch_size):
+            self.add_message_document(doc)
+            count += 1
+        self.ready.set()
+        print(f"🔍 Local search index built with {count} messages")
+
+
+# Global local index (only created when MESSAGE_SEARCH_BACKEND=local)
+local_search_index = None
+_index_lock = threading.Lock()
+
+def get_local_search_index() -> Optional[LocalSearchIndex]:
+    """Get the local inverted index, building it from the database in the background on first use"""
+    global local_search_index
+    if get_search_backend() != 'local':
+        return None
+    if local_search_index is None:
+        with _index_lock:
+            if local_search_index is None:
+                local_search_index = LocalSearchIndex()
+                threading.Thread(target=local_search_index.build_from_db, daemon=True).start()
+    return local_search_index
+
+
+def _word_regex(words: List[str], prefix: bool = False) -> dict:
+    """Case-insensitive content regex for consecutive words (the last one as a prefix)"""
+    pattern = r'\b' + r'\W+'.join(re.escape(word) for word in words) + ('' if prefix else r'\b')
+    return {'content': {'$regex': pattern, '$options': 'i'}}
+
+
+def _regex_search(query: SearchQuery, filters: dict, limit: int) -> List[Dict]:
+    """Unindexed regex search on content (full collection scan), newest first"""
+    if query.is_empty():
+        return []
+    conditions = [_word_regex(phrase) for phrase in query.phrases]
+    conditions.extend(_word_regex([prefix], prefix=True) for prefix in query.prefixes)
+    if query.terms:
+        conditions.append({'$or': [_word_regex([term]) for term in query.terms]})
+    raw = {'$and': conditions}
+    if query.excluded:
+        raw['$nor'] = [_word_regex([word]) for word in query.excluded]
+    queryset = ChatMessage.objects(__raw__=raw, **filters).order_by('-timestamp')
+    if limit:
+        queryset = queryset.limit(limit)
+    return [msg.to_dict() for msg in queryset]
+
+
+def search_messages(query_text: str, room_id: str = None, user_id: str = None, limit: int = 50) -> List[Dict]:
+    """Search messages by content, ranked by relevance, optionally scoped to a room and/or user"""
+    filters = {}
+    if room_id:
+        filters['room_id'] = room_id
+    if user_id:
+        filters['user_id'] = user_id
+
+    query = parse_search_query(query_text)
+    if query.is_empty():
+        return []
+
+    backend = get_search_backend()
+    if backend == 'regex':
+        return _regex_search(query, filters, limit)
+
+    if backend == 'local':
+        index = get_local_search_index()
+        if not index.ready.is_set():
+            # A partially built index would silently miss older messages
+            return _regex_search(query, filters, limit)
+        ranked = index.search(query, room_id=room_id, user_id=user_id, limit=limit)
+        scores = dict(ranked)
+        documents = {str(msg.id): msg for msg in ChatMessage.objects(id__in=list(scores))}
+        results = []
+        for doc_id, score in ranked:
+            if doc_id in documents:
+                message = documents[doc_id].to_dict()
+                message['score'] = score
+                results.append(message)
+        return results
+
+    try:
+        queryset = ChatMessage.objects(**filters).search_text(query.to_mongo_text()).order_by('$text_score')
+        # $text matches stems, so prefixes are checked against the real words - the limit then applies
+        # to the messages that pass (the cursor is read in batches until enough have)
+        if limit and not query.prefixes:
+            queryset = queryset.limit(limit)
+        results = []
+        for msg in queryset:
+            message = msg.to_dict()
+            if query.prefixes:
+                tokens = tokenize(searchable_text(message))
+                if not all(any(token.startswith(prefix) for token in tokens) for prefix in query.prefixes):
+                    continue
+            message['score'] = msg.get_text_score()
+            results.append(message)
+            if limit and len(results) >= limit:
+                break
+        return results
+    except Exception as e:
+        print(f"⚠️  Text search unavailable ({e}), falling back to regex search")
+        return _regex_search(query, filters, limit)
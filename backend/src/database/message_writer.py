@@ -0,0 +1,218 @@
+"""
+Background writer that batches chat message inserts and keeps the stats rollup up to date
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database.models import ChatMessage, RoomStatsRollup
+from database.message_queries import start_stats_rollup_rebuild
+from database.message_search import get_local_search_index
+from database.snapshot_store import get_snapshot_store
+from config.logging_config import get_logger
+from services.metrics import DB_WRITER_BATCH_SECONDS, DB_WRITER_BATCH_SIZE, DB_WRITER_QUEUE_DEPTH
+
+log = get_logger(__name__)
+
+# Queued after the last message to make the writer thread exit
+_STOP = object()
+
+
+def is_stats_rollup_enabled():
+    """Check if the materialized room stats rollup is enabled"""
+    return os.environ.get('ENABLE_STATS_ROLLUP', 'false').lower() == 'true'
+
+
+class MessageWriter:
+    """Single background thread that drains queued ChatMessage documents with insert_many"""
+
+    def __init__(self, batch_size: int = 50, flush_interval: float = 0.2, rollup_enabled: bool = False):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup_enabled = rollup_enabled
+
+        self._queue = queue.Queue()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+        if rollup_enabled:
+            # The writer only increments the rollup for new messages; backfill the rest
+            start_stats_rollup_rebuild()
+
+    def enqueue(self, message: ChatMessage, snapshots: dict = None):
+        """Queue a message (and any code snapshots it references) for insertion - returns immediately"""
+        if self._stopped:
+            self._write_batch([(message, snapshots)])  # writer thread is gone during shutdown
+            return
+        self._queue.put((message, snapshots))
+
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be written"""
+        return self._queue.qsize()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued message has been written; False if the timeout ran out first"""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Write what is queued and stop the writer thread (registered with atexit)"""
+        if self._stopped:
+            return
+        self._stopped = True
+        pending = self._queue.qsize()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.warning("⚠️  Message writer did not finish within %.1fs, %d messages may be lost",
+                        timeout, self._queue.qsize())
+        elif pending:
+            log.info("💾 Message writer flushed %d queued messages on shutdown", pending)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            messages = batch[:-1] if stopping else batch
+            try:
+                if messages:
+                    DB_WRITER_BATCH_SIZE.observe(len(messages))
+                    with DB_WRITER_BATCH_SECONDS.time():
+                        self._write_batch(messages)
+            except Exception as e:
+                log.exception("❌ Error in message writer: %s", e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stopping:
+                return
+
+    def _write_batch(self, batch):
+        """Insert a batch of messages and apply their rollup increments"""
+        # Snapshots go first so a stored hash always resolves; if they cannot be written the
+        # messages keep their code inline instead of a hash
+        snapshots = {}
+        for _, message_snapshots in batch:
+            snapshots.update(message_snapshots or {})
+        if snapshots:
+            snapshot_store = get_snapshot_store()
+            try:
+                snapshot_store.write(snapshots)
+            except Exception as e:
+                restored = sum(snapshot_store.inline(message.extra_data, snapshots)
+                               for message, message_snapshots in batch if message_snapshots and message.extra_data)
+                print(f"❌ Error writing code snapshots to database, storing {restored} fields inline: {e}")
+
+        documents = []
+        for message, _ in batch:
+            try:
+                message.validate()
+                documents.append(message.to_mongo())
+            except Exception as e:
+                print(f"❌ Dropping invalid chat message {message.message_id}: {e}")
+
+        if not documents:
+            return
+
+        try:
+            ChatMessage._get_collection().insert_many(documents, ordered=False)
+            log.debug("💾 Wrote %d messages to MongoDB", len(documents))
+        except BulkWriteError as e:
+            # Unordered inserts keep going past a failed document; the rest are stored
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            log.error("❌ %d of %d messages in batch failed to write: %s",
+                      len(failed), len(documents), e.details.get('writeErrors', [])[:1])
+            documents = [doc for index, doc in enumerate(documents) if index not in failed]
+            if not documents:
+                return
+        except Exception as e:
+            log.error("❌ Error writing message batch to database: %s", e)
+            return
+
+        search_index = get_local_search_index()
+        if search_index is not None:
+            for doc in documents:
+                search_index.add_message_document(doc)
+
+        if self.rollup_enabled:
+            try:
+                self._update_rollups(documents)
+            except Exception as e:
+                print(f"❌ Error updating room stats rollup: {e}")
+
+    def _update_rollups(self, documents):
+        """Fold a batch into one $inc/$min/$max upsert per room"""
+        per_room = {}
+        for doc in documents:
+            room = per_room.setdefault(doc['room_id'], {
+                'inc': {'total_messages': 0, 'user_messages': 0, 'ai_messages': 0},
+                'first': doc['timestamp'],
+                'last': doc['timestamp']
+            })
+            room['inc']['total_messages'] += 1
+            if doc.get('is_ai_message'):
+                room['inc']['ai_messages'] += 1
+                trigger_key = f"ai_trigger_breakdown.{doc.get('ai_trigger_type') or 'unknown'}"
+                room['inc'][trigger_key] = room['inc'].get(trigger_key, 0) + 1
+            else:
+                room['inc']['user_messages'] += 1
+            room['first'] = min(room['first'], doc['timestamp'])
+            room['last'] = max(room['last'], doc['timestamp'])
+
+        operations = [
+            UpdateOne(
+                {'room_id': room_id},
+                {
+                    '$inc': room['inc'],
+                    '$min': {'first_timestamp': room['first']},
+                    '$max': {'last_timestamp': room['last']},
+                    '$set': {'updated_at': datetime.utcnow()}
+                },
+                upsert=True
+            )
+            for room_id, room in per_room.items()
+        ]
+        RoomStatsRollup._get_collection().bulk_write(operations, ordered=False)
+
+
+# Global writer instance
+message_writer = None
+_writer_lock = threading.Lock()
+
+def get_message_writer():
+    """Get the global message writer, starting it on first use"""
+    global message_writer
+    if message_writer is None:
+        with _writer_lock:
+            if message_writer is None:
+                message_writer = MessageWriter(
+                    batch_size=int(os.environ.get('MESSAGE_WRITER_BATCH_SIZE', 50)),
+                    flush_interval=float(os.environ.get('MESSAGE_WRITER_FLUSH_INTERVAL', 0.2)),
+                    rollup_enabled=is_stats_rollup_enabled()
+                )
+                DB_WRITER_QUEUE_DEPTH.set_function(message_writer.queue_depth)
+                atexit.register(message_writer.stop)
+    return message_writer
@@ -14,6 +14,7 @@ class ChatMessage(Document):
     username = StringField(required=True, max_length=100)
     user_id = StringField(required=True, max_length=100)
     room_id = StringField(required=True, max_length=200)
+    room_id_lc = StringField(max_length=200)  # Lowercased room_id for index-backed prefix (cohort) queries
     session_id = StringField(required=True, max_length=200)  # Programming session ID
     message_number = IntField(required=True)  # Sequential message number within session
     timestamp = DateTimeField(required=True, default=datetime.utcnow)
@@ -36,12 +37,30 @@ class ChatMessage(Document):
             'user_id',
             'message_number',
             ('room_id', 'timestamp'),
+            ('room_id_lc', 'timestamp'),
             ('session_id', 'message_number'),
             ('room_id', 'user_id'),
-            'is_ai_message'
+            'is_ai_message',
+            {
+                # Full-text search (see database/message_search.py)
+                'fields': ['$content', '$extra_data.current_line_trimmed', '$extra_data.original_comment', '$extra_data.original_todo'],
+                'default_language': 'english',
+                'weights': {
+                    'content': 10,
+                    'extra_data.original_comment': 3,
+                    'extra_data.original_todo': 3,
+                    'extra_data.current_line_trimmed': 1
+                },
+                'name': 'chat_messages_text'
+            }
         ]
     }
     
+    def clean(self):
+        """Keep the normalized room id in sync on every save"""
+        if self.room_id:
+            self.room_id_lc = self.room_id.lower()
+    
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
         return {
@@ -65,6 +84,60 @@ class ChatMessage(Document):
         return f"ChatMessage(room_id={self.room_id}, username={self.username}, timestamp={self.timestamp})"
 
 
+class RoomStatsRollup(Document):
+    """Materialized per-room message statistics, updated incrementally by the message writer"""
+
+    room_id = StringField(required=True, unique=True, max_length=200)
+    total_messages = IntField(default=0)
+    user_messages = IntField(default=0)
+    ai_messages = IntField(default=0)
+    ai_trigger_breakdown = DictField()  # trigger type -> count
+    first_timestamp = DateTimeField()
+    last_timestamp = DateTimeField()
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'room_stats_rollup',
+        'indexes': [
+            'last_timestamp'
+        ]
+    }
+
+    def to_stats_dict(self):
+        """Convert to the same shape as the aggregated conversation stats"""
+        duration = None
+        if self.first_timestamp and self.last_timestamp:
+            duration = (self.last_timestamp - self.first_timestamp).total_seconds()
+        return {
+            'total_messages': self.total_messages,
+            'user_messages': self.user_messages,
+            'ai_messages': self.ai_messages,
+            'ai_trigger_breakdown': dict(self.ai_trigger_breakdown or {}),
+            'conversation_duration': duration,
+            'average_response_time': None
+        }
+
+    def __str__(self):
+        return f"RoomStatsRollup(room_id={self.room_id}, total_messages={self.total_messages})"
+
+
+class CodeSnapshot(Document):
+    """Content-addressed payload (code or a chat history entry) shared by many documents"""
+
+    hash = StringField(primary_key=True, max_length=64)  # sha256 of content
+    kind = StringField(max_length=50)  # 'code' or 'chat_message'
+    content = StringField(required=True)
+    size = IntField()
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'code_snapshots'
+    }
+
+    def __str__(self):
+        return f"CodeSnapshot(hash={self.hash[:12]}, kind={self.kind}, size={self.size})"
+
+
 class CodeExecution(Document):
     """Model for storing code execution history"""
     
@@ -78,7 +151,8 @@ class CodeExecution(Document):
     execution_time_ms = IntField()
     
     # Chat conversation context at time of execution
-    chat_history = ListField(DictField(), default=list)  # Complete conversation history
+    chat_history = ListField(DictField(), default=list)  # Legacy: embedded conversation history
+    chat_history_hashes = ListField(StringField(), default=list)  # CodeSnapshot hashes, one per message
     message_count = IntField(default=0)  # Total number of messages in chat_history
     
     meta = {
@@ -105,6 +179,7 @@ class CodeExecution(Document):
             'execution_error': self.execution_error,
             'execution_time_ms': self.execution_time_ms,
             'chat_history': self.chat_history,
+            'chat_history_hashes': self.chat_history_hashes,
             'message_count': self.message_count
         }
     
@@ -112,6 +187,26 @@ class CodeExecution(Document):
         return f"CodeExecution(room_id={self.room_id}, timestamp={self.timestamp})"
 
 
+class RoomContextSpill(Document):
+    """Conversation context of an evicted room, kept for fast rehydration when users rejoin"""
+
+    room_id = StringField(required=True, unique=True, max_length=200)
+    base_room_id = StringField(required=True, max_length=200)  # Shared room for personal rooms
+    context = DictField()
+    spilled_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'room_context_spill',
+        'indexes': [
+            'base_room_id',
+            {'fields': ['spilled_at'], 'expireAfterSeconds': 7 * 24 * 3600}
+        ]
+    }
+
+    def __str__(self):
+        return f"RoomContextSpill(room_id={self.room_id}, spilled_at={self.spilled_at})"
+
+
 # Legacy model - keeping for backward compatibility
 class InterviewTranscript(Document):
     """Legacy model for interview transcripts"""
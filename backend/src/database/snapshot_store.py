@@ -0,0 +1,186 @@
+"""
+Content-addressed snapshot store for bulky payloads (code, chat history messages)
+
+Tracking messages and code executions keep only the sha256 of each payload; the payload
+itself is written once to the code_snapshots collection and re-attached on read.
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+from database.models import CodeSnapshot
+from services.room_lifecycle import RoomStateStore, room_state_limits
+
+# extra_data keys moved into the snapshot store - stored as '<key>_hash' on the message
+SNAPSHOT_FIELDS = ('full_code', 'code_block', 'executed_code', 'scaffolding_code')
+
+
+def is_snapshot_diff_enabled():
+    """Check if tracking messages should also store a diff against the room's previous snapshot"""
+    return os.environ.get('CODE_SNAPSHOT_DIFFS', 'false').lower() == 'true'
+
+
+def snapshot_hash(content: str) -> str:
+    """Content address of a snapshot payload"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    """Deduplicating writer/reader for CodeSnapshot documents"""
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = cache_size
+        self._known_hashes = OrderedDict()  # hashes already persisted (LRU)
+        # room_id -> {field: last tracked content}, for diffs (bounded, dropped when the room closes)
+        self._previous_code = RoomStateStore('snapshot_previous_code', **room_state_limits())
+        self._lock = threading.Lock()
+
+    def _is_known(self, content_hash: str) -> bool:
+        with self._lock:
+            if content_hash in self._known_hashes:
+                self._known_hashes.move_to_end(content_hash)
+                return True
+            return False
+
+    def _remember(self, hashes: Iterable[str]):
+        with self._lock:
+            for content_hash in hashes:
+                self._known_hashes[content_hash] = True
+                self._known_hashes.move_to_end(content_hash)
+            while len(self._known_hashes) > self.cache_size:
+                self._known_hashes.popitem(last=False)
+
+    def extract(self, room_id: str, extra_data: dict) -> Dict[str, tuple]:
+        """
+        Replace SNAPSHOT_FIELDS in extra_data with their hashes (in place).
+        Returns {hash: (kind, content)} for snapshots that still need to be written.
+        """
+        pending = {}
+        for key in SNAPSHOT_FIELDS:
+            content = extra_data.get(key)
+            if not content:
+                continue
+            content_hash = snapshot_hash(content)
+            extra_data[f'{key}_hash'] = content_hash
+            del extra_data[key]
+
+            if is_snapshot_diff_enabled():
+                previous_by_field = self._previous_code.get_or_create(room_id, dict)
+                previous = previous_by_field.get(key)
+                if previous is not None and previous != content:
+                    extra_data[f'{key}_diff'] = ''.join(difflib.unified_diff(
+                        previous.splitlines(keepends=True), content.splitlines(keepends=True), n=1
+                    ))
+                    extra_data[f'{key}_previous_hash'] = snapshot_hash(previous)
+                previous_by_field[key] = content
+
+            if not self._is_known(content_hash):
+                pending[content_hash] = ('code', content)
+        return pending
+
+    @staticmethod
+    def inline(extra_data: dict, snapshots: Dict[str, tuple]) -> int:
+        """Undo extract() for hashes in snapshots (e.g. after a failed write); returns fields restored"""
+        restored = 0
+        for key in SNAPSHOT_FIELDS:
+            content_hash = extra_data.get(f'{key}_hash')
+            if content_hash in snapshots:
+                extra_data[key] = snapshots[content_hash][1]
+                del extra_data[f'{key}_hash']
+                restored += 1
+        return restored
+
+    def write(self, snapshots: Dict[str, tuple]):
+        """Upsert snapshots with $setOnInsert - existing content is never rewritten"""
+        snapshots = {h: s for h, s in snapshots.items() if not self._is_known(h)}
+        if not snapshots:
+            return
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {'_id': content_hash},
+                {'$setOnInsert': {'kind': kind, 'content': content, 'size': len(content), 'created_at': now}},
+                upsert=True
+            )
+            for content_hash, (kind, content) in snapshots.items()
+        ]
+        CodeSnapshot._get_collection().bulk_write(operations, ordered=False)
+        self._remember(snapshots)
+
+    def put_chat_history(self, chat_history: List[dict]) -> List[str]:
+        """Store each chat history entry as its own snapshot and return the ordered hashes"""
+        hashes = []
+        pending = {}
+        for entry in chat_history:
+            content = json.dumps(entry, sort_keys=True, default=str)
+            content_hash = snapshot_hash(content)
+            hashes.append(content_hash)
+            pending[content_hash] = ('chat_message', content)
+        self.write(pending)
+        return hashes
+
+    def fetch(self, hashes: Iterable[str]) -> Dict[str, str]:
+        """Load snapshot contents for many hashes in one query"""
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+        return {
+            doc['_id']: doc['content']
+            for doc in CodeSnapshot._get_collection().find({'_id': {'$in': hashes}}, {'content': 1})
+        }
+
+    def hydrate_messages(self, messages: List[dict]) -> List[dict]:
+        """Restore SNAPSHOT_FIELDS on message dicts (in place) from their stored hashes"""
+        wanted = [
+            message['extra_data'][f'{key}_hash']
+            for message in messages for key in SNAPSHOT_FIELDS
+            if message.get('extra_data') and f'{key}_hash' in message['extra_data']
+        ]
+        contents = self.fetch(wanted)
+        for message in messages:
+            extra_data = message.get('extra_data')
+            if not extra_data:
+                continue
+            for key in SNAPSHOT_FIELDS:
+                content_hash = extra_data.get(f'{key}_hash')
+                if content_hash and key not in extra_data:
+                    extra_data[key] = contents.get(content_hash, '')
+        return messages
+
+    def hydrate_executions(self, executions: List[dict]) -> List[dict]:
+        """Rebuild chat_history on execution dicts (in place) from chat_history_hashes"""
+        contents = self.fetch(h for execution in executions for h in execution.get('chat_history_hashes') or [])
+        for execution in executions:
+            hashes = execution.pop('chat_history_hashes', None)
+            if hashes:
+                execution['chat_history'] = [json.loads(contents[h]) for h in hashes if h in contents]
+        return executions
+
+
+def needs_snapshots(selected_fields: List[str] = None) -> bool:
+    """Whether a field selection includes anything that lives in the snapshot store"""
+    if not selected_fields:
+        return True
+    return any(field == 'extra_data' or field.split('.', 1)[-1] in SNAPSHOT_FIELDS for field in selected_fields)
+
+
+# Global snapshot store instance
+snapshot_store = None
+_store_lock = threading.Lock()
+
+def get_snapshot_store():
+    """Get the global snapshot store"""
+    global snapshot_store
+    if snapshot_store is None:
+        with _store_lock:
+            if snapshot_store is None:
+                snapshot_store = SnapshotStore(cache_size=int(os.environ.get('CODE_SNAPSHOT_CACHE_SIZE', 10000)))
+    return snapshot_store
@@ -3,6 +3,7 @@ AI Agent Core - Main AIAgent class with core functionality
 Simplified and modular design using specialized service classes
 """
 
+import logging
 import os
 import random
 import threading
@@ -11,44 +12,86 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
-from openai import OpenAI
-
-from .ai_models import Message, ConversationContext
+from .ai_models import Message, ConversationContext, ContextSnapshot, recent
 from .ai_audio import AIAudioService
 from .ai_intervention import AIInterventionService
 from .ai_code_analysis import AICodeAnalysisService
 from .ai_reflection import get_reflection_service
+from .cancellation import OperationCancelled
+from .code_context import code_for_prompt, first_difference, line_of_offset, MAX_FOCUS_LINES, CODE_CONTEXT_TOKEN_BUDGET
+from .conversation_memory import ConversationMemory, prompt_memory, MEMORY_TOKEN_BUDGET
+from .usage_governor import get_usage_governor, usage_scope, UsageTier
+from .response_cache import semantic_cache_from_env
+from .decision_memo import DecisionMemo
+from .llm_provider import create_openai_client
+from .metrics import chat_completion, USAGE_DEGRADATIONS, SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SAVED_SECONDS
+from .tracing import get_tracer
+from .text_matching import KeywordMatcher
+from .room_lifecycle import RoomStateStore, get_room_lifecycle, room_state_limits, is_room_spill_enabled, base_room_id
 from database.db import is_mongodb_enabled
+from config.logging_config import get_logger, get_event_logger
 
 # Conditionally import ChatMessage only if needed
 try:
-    from database.models import ChatMessage
+    from database.models import ChatMessage, RoomStatsRollup, RoomContextSpill
+    from database.message_queries import get_conversation_stats as aggregate_conversation_stats, is_stats_rollup_ready
+    from database.message_writer import get_message_writer, is_stats_rollup_enabled
+    from database.message_search import search_messages as search_chat_messages
+    from database.snapshot_store import get_snapshot_store
     _models_available = True
 except ImportError:
     _models_available = False
     ChatMessage = None
 
+log = get_logger(__name__)
+event_log = get_event_logger(__name__)  # sampled: per-keystroke records
+
+# Keystroke-driven timer cancels are coalesced to one per room per interval (seconds)
+CODE_UPDATE_CANCEL_INTERVAL = float(os.environ.get('CODE_UPDATE_CANCEL_INTERVAL', '0.5'))
+
+# Keyword sets used to classify chat messages (compiled once, shared by all rooms)
+AI_MENTION_MATCHER = KeywordMatcher(['@ai', '@bob', 'bob', 'hey bob'])
+SYNTAX_REQUEST_MATCHER = KeywordMatcher(['syntax', 'example', 'code', 'documentation'], boundary='prefix')
+UNDERSTANDING_MATCHER = KeywordMatcher([
+    # Direct approach explanations
+    "i'm thinking about using", "we can use", "let's use", "i'll use",
+    "we can do", "i can do", "let's do", "we should",
+    "basically like", "so we", "then we", "first we",
+
+    # Algorithm step descriptions
+    "iterate", "loop", "check if", "add to", "put in",
+    "return", "create", "initialize", "make a",
+
+    # Confirmation of understanding
+    "got it", "i see", "makes sense", "understood", "i get it",
+    "yeah so", "okay so", "right so", "oh i see"
+], boundary='prefix')
+PROGRESS_MATCHER = KeywordMatcher(['works', 'working', 'fixed', 'got it', 'solved', 'success', 'good', 'nice'], boundary='prefix')
+
 
 class AIAgent:
     def __init__(self, socketio_instance):
-        # Check if OpenAI API key is available
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("⚠️  Warning: No OpenAI API key found. AI agent will be disabled.")
-            print("   Set OPENAI_API_KEY in your .env file to enable AI responses.")
-            self.client = None
+        # Client for the configured LLM provider (None disables the agent)
+        self.client = create_openai_client("AI agent")
+        if self.client:
+            print("✅ AI Agent (Bob) initialized successfully!")
         else:
-            try:
-                self.client = OpenAI(api_key=api_key)
-                print("✅ AI Agent (Bob) initialized successfully!")
-            except Exception as e:
-                print(f"❌ Error initializing OpenAI client: {e}")
-                print("   AI agent will be disabled.")
-                self.client = None
+            print("   Set OPENAI_API_KEY (or LLM_PROVIDER=mock) in your .env file to enable AI responses.")
         
         self.socketio = socketio_instance
-        self.conversation_history = {}  # room_id -> ConversationContext
-        self.room_ai_modes = {}  # room_id -> ai_mode (shared, shared_no_voice, individual, none)
+        # Per-room state is bounded and evicted once a room has been empty for the grace period
+        self.room_lifecycle = get_room_lifecycle()
+        self.conversation_history = RoomStateStore(  # room_id -> ConversationContext
+            'conversation_history', on_evict=self._on_context_evicted, **room_state_limits()
+        )
+        self.room_ai_modes = RoomStateStore(  # room_id -> ai_mode (shared, shared_no_voice, individual, none)
+            'room_ai_modes', **room_state_limits()
+        )
+        self.personal_room_index = RoomStateStore(  # shared room_id -> {user_id: personal room_id}
+            'personal_room_index', **room_state_limits()
+        )
+        self._next_code_cancel: Dict[str, float] = {}  # room_id -> monotonic time the next coalesced cancel may run
+        self.room_lifecycle.add_rehydrator(self._rehydrate_room_contexts)
         
         # AI Agent identity
         self.agent_name = "Bob (AI Assistant)"
@@ -70,66 +113,120 @@ class AIAgent:
             self.client, socketio_instance
         )
         
+        # Summarizes messages leaving each room's context window in the background
+        self.memory = ConversationMemory(self.client, self.conversation_history.get)
+        
+        # Answers to direct questions shared across rooms on the same problem (None unless enabled)
+        self.response_cache = semantic_cache_from_env()
+
+        # Last idle/progress/reflection decision per room, reused while the room state is unchanged
+        self.decision_memo = DecisionMemo()
+        
         # Reflection service will be obtained when needed (it may not be initialized yet)
         self.reflection_service = None
 
+    def _on_context_evicted(self, room_id: str, context: ConversationContext, reason: str):
+        """Cancel the room's timers and optionally spill its context for rehydration"""
+        self.intervention_service.cleanup_room(room_id)
+        self._next_code_cancel.pop(room_id, None)
+        self.decision_memo.forget(room_id)
+        self._unindex_personal_room(room_id)
+        if not is_room_spill_enabled() or not is_mongodb_enabled() or not _models_available:
+            return
+        try:
+            RoomContextSpill.objects(room_id=room_id).update_one(
+                set__base_room_id=base_room_id(room_id),
+                set__context=context.to_dict(),
+                set__spilled_at=datetime.utcnow(),
+                upsert=True
+            )
+            print(f"💾 Spilled conversation context for room {room_id} ({reason})")
+        except Exception as e:
+            print(f"❌ Error spilling context for room {room_id}: {e}")
+
+    def _rehydrate_room_contexts(self, room_id: str):
+        """Restore spilled contexts (shared and personal) when a room is occupied again"""
+        if not is_room_spill_enabled() or not is_mongodb_enabled() or not _models_available:
+            return
+        for spill in RoomContextSpill.objects(base_room_id=room_id):
+            if spill.room_id not in self.conversation_history:
+                self.conversation_history.get_or_create(spill.room_id, lambda: ConversationContext.from_dict(spill.context))
+                self._index_personal_room(spill.room_id)
+                print(f"♻️  Rehydrated conversation context for room {spill.room_id}")
+            spill.delete()
+
+    def get_context(self, room_id: str) -> ConversationContext:
+        """Get the room's conversation context, creating it atomically if missing"""
+        context = self.conversation_history.get(room_id)
+        if context is None:
+            context = self.conversation_history.get_or_create(
+                room_id, lambda: ConversationContext(messages=[], room_id=room_id)
+            )
+            self._index_personal_room(room_id)
+        return context
+
+    def _index_personal_room(self, room_id: str):
+        """Register a personal room (room_personal_user) under its shared room and user"""
+        if '_personal_' not in room_id:
+            return
+        shared_room, user_id = room_id.split('_personal_', 1)
+        self.personal_room_index.get_or_create(shared_room, dict)[user_id] = room_id
+
+    def _unindex_personal_room(self, room_id: str):
+        if '_personal_' not in room_id:
+            return
+        shared_room, user_id = room_id.split('_personal_', 1)
+        rooms = self.personal_room_index.get(shared_room)
+        if rooms:
+            rooms.pop(user_id, None)
+
+    def personal_room_for(self, room_id: str, user_id: str) -> Optional[str]:
+        """The user's personal room in a shared room, if it has AI state (index lookup)"""
+        rooms = self.personal_room_index.get(room_id)
+        return rooms.get(user_id) if rooms else None
+
     def _save_message_to_db_async(self, message: Message, context: 'ConversationContext'):
-        """Save message to MongoDB asynchronously"""
+        """Queue message for the background MongoDB writer"""
         # Skip if MongoDB is not enabled
         if not is_mongodb_enabled() or not _models_available:
             return
             
-        print("Saving message to DB async...", message)  # Debug print
-        def save_to_db():
-            try:
-                # Determine if this is an AI message
-                is_ai_message = message.userId == self.agent_id
-                
-                # Parse timestamp - handle both string and datetime
-                if isinstance(message.timestamp, str):
-                    # Try to parse ISO format timestamp
-                    try:
-                        timestamp = datetime.fromisoformat(message.timestamp.replace('Z', '+00:00'))
-                    except:
-                        # Fallback to current time if parsing fails
-                        timestamp = datetime.utcnow()
-                else:
-                    timestamp = message.timestamp if message.timestamp else datetime.utcnow()
-                
-                # Increment message counter
+        try:
+            # Determine if this is an AI message
+            is_ai_message = message.userId == self.agent_id
+            
+            # Message timestamps are epoch seconds (stored as naive UTC like datetime.utcnow())
+            timestamp = datetime.utcfromtimestamp(message.timestamp)
+            
+            # Sequence number and session id are assigned under the room lock
+            with context.lock:
                 context.message_counter += 1
-                
-                # Generate session ID if not exists
                 if not context.session_id:
                     context.session_id = f"{context.room_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-                
-                # Create database record using fields from message
-                chat_message = ChatMessage(
-                    message_id=str(message.id),
-                    content=message.content,
-                    username=message.username,
-                    user_id=message.userId,
-                    room_id=message.room,
-                    session_id=context.session_id,
-                    message_number=context.message_counter,
-                    timestamp=timestamp,
-                    is_auto_generated=message.isAutoGenerated,
-                    is_ai_message=is_ai_message,
-                    ai_trigger_type=message.ai_trigger_type if is_ai_message else None,
-                    is_reflection=message.is_reflection
-                )
-                
-                # Save to database
-                chat_message.save()
-                print(f"💾 Saved message #{context.message_counter} to MongoDB: {message.username[:20]} in session {context.session_id}")
-                
-            except Exception as e:
-                print(f"❌ Error saving message to database: {e}")
-                # Don't let database errors break the chat functionality
-                pass
-        
-        # Run in a separate thread to avoid blocking
-        threading.Thread(target=save_to_db, daemon=True).start()
+                session_id, message_number = context.session_id, context.message_counter
+            
+            # Create database record using fields from message
+            chat_message = ChatMessage(
+                message_id=str(message.id),
+                content=message.content,
+                username=message.username,
+                user_id=message.userId,
+                room_id=message.room,
+                session_id=session_id,
+                message_number=message_number,
+                timestamp=timestamp,
+                is_auto_generated=message.isAutoGenerated,
+                is_ai_message=is_ai_message,
+                ai_trigger_type=message.ai_trigger_type if is_ai_message else None,
+                is_reflection=message.is_reflection
+            )
+            
+            # Batched insert happens on the writer thread to avoid blocking
+            get_message_writer().enqueue(chat_message)
+            
+        except Exception as e:
+            print(f"❌ Error queuing message for database: {e}")
+            # Don't let database errors break the chat functionality
 
     def _extract_todo_type(self, todo_line: str) -> str:
         """Extract the type/purpose of the TODO comment"""
@@ -148,55 +245,49 @@ class AIAgent:
             return 'general'
 
     def _save_tracking_message_to_db_async(self, content: str, room_id: str, ai_trigger_type: str, username: str = None, extra_data: dict = None):
-        """Save AI tracking message directly to database without adding to conversation context"""
+        """Queue AI tracking message for the database writer without adding to conversation context"""
         # Skip if MongoDB is not enabled
         if not is_mongodb_enabled() or not _models_available:
             return
             
-        def save_to_db():
-            try:
-                # Get session context for session_id and message counter
-                context = self.conversation_history.get(room_id)
-                if not context:
-                    # Create minimal context if it doesn't exist
-                    context = ConversationContext(messages=[], room_id=room_id)
-                    self.conversation_history[room_id] = context
-                
-                # Generate session ID if not exists
+        try:
+            # Get session context for session_id and message counter (minimal context if missing)
+            context = self.get_context(room_id)
+            
+            # Sequence number and session id are assigned under the room lock
+            with context.lock:
                 if not context.session_id:
                     context.session_id = f"{context.room_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-                
-                # Increment message counter for proper sequencing
                 context.message_counter += 1
-                
-                # Create database record for tracking message
-                chat_message = ChatMessage(
-                    message_id=f"tracking_{ai_trigger_type}_{int(time.time() * 1000)}",
-                    content=content,
-                    username=username or self.agent_name,
-                    user_id=self.agent_id,
-                    room_id=room_id,
-                    session_id=context.session_id,
-                    message_number=context.message_counter,
-                    timestamp=datetime.utcnow(),
-                    is_auto_generated=True,
-                    is_ai_message=True,
-                    ai_trigger_type=ai_trigger_type,
-                    is_reflection=False,
-                    extra_data=extra_data or {}
-                )
-                
-                # Save to database
-                chat_message.save()
-                print(f"📊 Saved tracking message #{context.message_counter} to MongoDB: {ai_trigger_type} in session {context.session_id}")
-                
-            except Exception as e:
-                print(f"❌ Error saving tracking message to database: {e}")
-                # Don't let database errors break the functionality
-                pass
-        
-        # Run in a separate thread to avoid blocking
-        threading.Thread(target=save_to_db, daemon=True).start()
+                session_id, message_number = context.session_id, context.message_counter
+            
+            # Bulky code goes to the content-addressed snapshot store, the message keeps its hash
+            extra_data = dict(extra_data or {})
+            snapshots = get_snapshot_store().extract(room_id, extra_data)
+            
+            # Create database record for tracking message
+            chat_message = ChatMessage(
+                message_id=f"tracking_{ai_trigger_type}_{int(time.time() * 1000)}",
+                content=content,
+                username=username or self.agent_name,
+                user_id=self.agent_id,
+                room_id=room_id,
+                session_id=session_id,
+                message_number=message_number,
+                timestamp=datetime.utcnow(),
+                is_auto_generated=True,
+                is_ai_message=True,
+                ai_trigger_type=ai_trigger_type,
+                is_reflection=False,
+                extra_data=extra_data
+            )
+            
+            # Batched insert happens on the writer thread to avoid blocking
+            get_message_writer().enqueue(chat_message, snapshots)
+            
+        except Exception as e:
+            print(f"❌ Error queuing tracking message for database: {e}")
+            # Don't let database errors break the functionality
 
     def track_code_analysis(self, room_id: str, analysis_type: str, code_block: str, language: str, analysis_result: dict = None):
         """Track code analysis activity with complete context"""
@@ -355,7 +446,7 @@ class AIAgent:
             if limit:
                 query = query.limit(limit)
             
-            messages = [msg.to_dict() for msg in query]
+            messages = get_snapshot_store().hydrate_messages([msg.to_dict() for msg in query])
             print(f"📚 Retrieved {len(messages)} messages for session {session_id}")
             return messages
             
@@ -372,7 +463,7 @@ class AIAgent:
             if limit:
                 query = query.limit(limit)
             
-            messages = [msg.to_dict() for msg in query]
+            messages = get_snapshot_store().hydrate_messages([msg.to_dict() for msg in query])
             # Return in chronological order (oldest first)
             messages.reverse()
             print(f"📚 Retrieved {len(messages)} recent messages for room {room_id}")
@@ -398,7 +489,7 @@ class AIAgent:
             if limit:
                 query = query.limit(limit)
             
-            messages = [msg.to_dict() for msg in query]
+            messages = get_snapshot_store().hydrate_messages([msg.to_dict() for msg in query])
             print(f"📊 Retrieved {len(messages)} AI messages (trigger: {ai_trigger_type}, room: {room_id})")
             return messages
             
@@ -406,11 +497,17 @@ class AIAgent:
             print(f"❌ Error retrieving AI messages by trigger: {e}")
             return []
 
-    def get_conversation_stats(self, room_id: str = None, session_id: str = None) -> Dict:
+    def get_conversation_stats(self, room_id: str = None, session_id: str = None, include_rooms: bool = False) -> Dict:
         """Get conversation statistics for analytics"""
         if not is_mongodb_enabled() or not _models_available:
             return {}
         try:
+            # Whole-room stats can be served from the materialized rollup without scanning messages
+            if room_id and not session_id and not include_rooms and is_stats_rollup_enabled() and is_stats_rollup_ready():
+                rollup = RoomStatsRollup.objects(room_id=room_id).first()
+                if rollup:
+                    return rollup.to_stats_dict()
+            
             # Build base query
             filters = {}
             if room_id:
@@ -418,32 +515,10 @@ class AIAgent:
             if session_id:
                 filters['session_id'] = session_id
             
-            messages = ChatMessage.objects(**filters)
-            
-            stats = {
-                'total_messages': messages.count(),
-                'user_messages': messages.filter(is_ai_message=False).count(),
-                'ai_messages': messages.filter(is_ai_message=True).count(),
-                'ai_trigger_breakdown': {},
-                'conversation_duration': None,
-                'average_response_time': None
-            }
+            # Single $facet aggregation for totals, trigger breakdown, duration (and per-room stats)
+            stats = aggregate_conversation_stats(filters, include_rooms=include_rooms)
             
-            # Get AI trigger type breakdown
-            ai_messages = messages.filter(is_ai_message=True)
-            for msg in ai_messages:
-                trigger = msg.ai_trigger_type or 'unknown'
-                stats['ai_trigger_breakdown'][trigger] = stats['ai_trigger_breakdown'].get(trigger, 0) + 1
-            
-            # Calculate conversation duration
-            if messages.count() > 0:
-                first_msg = messages.order_by('timestamp').first()
-                last_msg = messages.order_by('-timestamp').first()
-                if first_msg and last_msg:
-                    duration = (last_msg.timestamp - first_msg.timestamp).total_seconds()
-                    stats['conversation_duration'] = duration
-            
-            print(f"📈 Generated conversation stats: {stats}")
+            print(f"📈 Generated conversation stats: {stats['total_messages']} messages")
             return stats
             
         except Exception as e:
@@ -459,7 +534,7 @@ class AIAgent:
             if limit:
                 query = query.limit(limit)
             
-            messages = [msg.to_dict() for msg in query]
+            messages = get_snapshot_store().hydrate_messages([msg.to_dict() for msg in query])
             print(f"👤 Retrieved {len(messages)} messages for user {user_id}")
             return messages
             
@@ -468,24 +543,14 @@ class AIAgent:
             return []
 
     def search_messages(self, query_text: str, room_id: str = None, user_id: str = None, limit: int = 50) -> List[Dict]:
-        """Search messages by content"""
+        """Search messages by content, ranked by relevance"""
         if not is_mongodb_enabled() or not _models_available:
             return []
         try:
-            # Build MongoDB text search query
-            filters = {'content__icontains': query_text}  # Case-insensitive substring search
-            
-            if room_id:
-                filters['room_id'] = room_id
-            if user_id:
-                filters['user_id'] = user_id
-            
-            query = ChatMessage.objects(**filters).order_by('-timestamp')
-            if limit:
-                query = query.limit(limit)
-            
-            messages = [msg.to_dict() for msg in query]
-            print(f"🔍 Found {len(messages)} messages containing '{query_text}'")
+            messages = get_snapshot_store().hydrate_messages(
+                search_chat_messages(query_text, room_id=room_id, user_id=user_id, limit=limit)
+            )
+            print(f"🔍 Found {len(messages)} messages matching '{query_text}'")
             return messages
             
         except Exception as e:
@@ -508,6 +573,12 @@ class AIAgent:
             if not self.reflection_service:
                 self.reflection_service = get_reflection_service()
             
+            # Nothing said or changed since the last reflection response
+            snapshot = context.snapshot()
+            reused = self.decision_memo.reuse(room_id, 'reflection', snapshot)
+            if reused is not None:
+                return reused
+            
             if self.reflection_service:
                 response = self.reflection_service.generate_reflection_response_sync(
                     room_id, self.conversation_history
@@ -515,45 +586,81 @@ class AIAgent:
             else:
                 print("❌ Error: Reflection service not available")
                 response = "What did you learn today?"
-            return True, response if response else "What did you learn today?"
+            decision = True, response if response else "What did you learn today?"
+            self.decision_memo.store(room_id, 'reflection', snapshot, decision)
+            return decision
         
+        # Prompts are built from an immutable snapshot - no room lock is held during the LLM call
+        snapshot = context.snapshot()
+
         # Handle 30-second progress check
         if is_progress_check:
+            if not is_manual_progress and get_usage_governor().tier(room_id) >= UsageTier.NO_PROGRESS_CHECKS:
+                USAGE_DEGRADATIONS.inc(action='progress_check_skipped')
+                log.info("💸 Progress check skipped for room %s: usage budget nearly spent", room_id)
+                return False, ""
             if is_manual_progress:
-                return self._handle_manual_progress_check(room_id, context)
-            else:
-                return self._handle_progress_check(room_id, context)
-
-        # Get recent conversation context (last 5 messages)
-        recent_messages = context.messages[-10:] if len(context.messages) >= 10 else context.messages
+                return self._handle_manual_progress_check(room_id, snapshot)
+            reused = self.decision_memo.reuse(room_id, 'progress_check', snapshot)
+            if reused is not None:
+                log.info("♻️ Progress check for room %s reused: nothing changed since the last one", room_id)
+                return reused
+            return self._handle_progress_check(room_id, snapshot)
+
+        # Rolling summary plus the latest turns, within the memory token budget (shrunk near the usage budget)
+        scale = self._prompt_scale(room_id)
+        memory = prompt_memory(snapshot, budget=int(MEMORY_TOKEN_BUDGET * scale))
+        recent_messages = memory.messages
         
         # Check if the last message contains direct AI mention
-        last_message = context.messages[-1] if context.messages else None
-        is_direct_mention = last_message and self._is_direct_ai_mention(last_message.content)
+        last_message = snapshot.messages[-1] if snapshot.messages else None
+        is_direct_mention = last_message and self._is_direct_ai_mention(last_message.content, last_message.id)
+        
+        # Idle decision already made for exactly this room state
+        if not is_direct_mention:
+            reused = self.decision_memo.reuse(room_id, 'idle', snapshot)
+            if reused is not None:
+                log.info("♻️ Idle decision for room %s reused: nothing changed since it was made", room_id)
+                return reused
+        
+        # Near-identical question already answered for this problem (in any room)
+        use_cache = bool(is_direct_mention and self.response_cache is not None and snapshot.problem_title)
+        if use_cache:
+            hit = self.response_cache.lookup(snapshot.problem_title, last_message.content)
+            if hit is None:
+                SEMANTIC_CACHE_LOOKUPS.inc(outcome='miss')
+            elif hit.answer in snapshot.ai_message_history:
+                SEMANTIC_CACHE_LOOKUPS.inc(outcome='repeat')
+            else:
+                SEMANTIC_CACHE_LOOKUPS.inc(outcome='hit')
+                SEMANTIC_CACHE_SAVED_SECONDS.inc(hit.saved_seconds)
+                log.info("⚡ Cached answer for room %s (similarity %.2f to %r)", room_id, hit.similarity, hit.question)
+                return True, hit.answer
         
         # Build AI message history context to avoid repetition
-        ai_history_context = self._build_ai_history_context(context)
+        ai_history_context = self._build_ai_history_context(snapshot)
         
         # Create comprehensive system message combining context and instructions
-        problem_info = f"Problem: {context.problem_title or 'General coding'}"
-        if context.problem_description:
-            problem_info += f" - {context.problem_description}"
+        problem_info = f"Problem: {snapshot.problem_title or 'General coding'}"
+        if snapshot.problem_description:
+            problem_info += f" - {snapshot.problem_description}"
         
-        code_info = f"Current code:\n{context.code_context}" if context.code_context else "No code visible yet"
+        code_info = (f"Current code:\n{code_for_prompt(snapshot, recent_messages, int(CODE_CONTEXT_TOKEN_BUDGET * scale))}"
+                     if snapshot.code_context else "No code visible yet")
         
         # Check if user is asking for syntax/code
-        is_asking_for_syntax = last_message and any(keyword in last_message.content.lower() for keyword in ['syntax', 'example', 'code', 'documentation'])
+        is_asking_for_syntax = last_message and SYNTAX_REQUEST_MATCHER.matches(last_message.content, last_message.id)
         
         # Build comprehensive system message
         if is_direct_mention:
             system_message = f"""You are Bob, an AI pair programming assistant focused on LEARNING. The user has directly mentioned you with @AI or similar keyword.
 
 {problem_info}
-Language: {context.programming_language}
+Language: {snapshot.programming_language}
 
 {code_info}
 
-{ai_history_context}
+{memory.summary_block()}{ai_history_context}
 
 LEARNING APPROACH:
 - Help users when they need it, but avoid unnecessary responses when they're satisfied
@@ -570,11 +677,11 @@ Provide a helpful response (10-30 words) or choose not to respond if they seem s
             system_message = f"""You are Bob, an AI pair programming assistant focused on LEARNING.
 
 {problem_info}
-Language: {context.programming_language}
+Language: {snapshot.programming_language}
 
 {code_info}
 
-{ai_history_context}
+{memory.summary_block()}{ai_history_context}
 
 INTERVENTION APPROACH:
 - Help users when they need it, but avoid unnecessary responses when they're satisfied
@@ -597,11 +704,12 @@ Return EXACTLY "NO_RESPONSE" (if no response needed) OR provide a helpful respon
             else:
                 messages.append({"role": "user", "content": f"{msg.username}: {msg.content}"})
 
-        print("🔍 AI Decision - System message:", system_message[:200], "...")
-        print(f"🔍 AI Decision - Message count: {len(messages)} messages")
-        print(messages)
+        log.debug("🔍 AI Decision - System message: %s ...", system_message[:200])
+        log.debug("🔍 AI Decision - Message count: %d messages: %s", len(messages), messages)
         try:
-            response = self.client.chat.completions.create(
+            started = time.perf_counter()
+            response = chat_completion(
+                self.client, 'ai_decision', room_id,
                 model="gpt-4.1-mini",
                 messages=messages,
                 max_tokens=90 if is_direct_mention else 60,
@@ -612,41 +720,61 @@ Return EXACTLY "NO_RESPONSE" (if no response needed) OR provide a helpful respon
             
             # Handle NO_RESPONSE for idle interventions (but not direct mentions)
             if llm_response == "NO_RESPONSE" and not is_direct_mention:
-                print(f"🚫 AI chose not to intervene: User seems satisfied/working independently")
+                log.info("🚫 AI chose not to intervene in room %s: User seems satisfied/working independently", room_id)
+                self.decision_memo.store(room_id, 'idle', snapshot, (False, ""))
                 return False, ""
             
             # Always respond with whatever the LLM generates (no YES/NO parsing)
             if llm_response and llm_response != "NO_RESPONSE":
+                if use_cache:
+                    self.response_cache.store(snapshot.problem_title, last_message.content, llm_response,
+                                              time.perf_counter() - started)
+                if not is_direct_mention:
+                    self.decision_memo.store(room_id, 'idle', snapshot, (True, llm_response))
                 mention_type = "DIRECT MENTION" if is_direct_mention else "IDLE INTERVENTION"
-                print(f"✅ AI WILL INTERVENE ({mention_type}): {llm_response[:50]}...")
+                log.info("✅ AI WILL INTERVENE (%s) in room %s: %.50s...", mention_type, room_id, llm_response)
                 return True, llm_response
             else:
                 mention_type = "direct mention" if is_direct_mention else "idle period"
-                print(f"🚫 AI generated empty response for {mention_type}")
+                log.info("🚫 AI generated empty response for %s in room %s", mention_type, room_id)
                 return False, ""
                 
+        except OperationCancelled as e:
+            log.info("🛑 AI decision for room %s %s", room_id, e)
+            return False, ""
         except Exception as e:
-            print(f"❌ Error in AI decision: {e}")
+            log.error("❌ Error in AI decision for room %s: %s", room_id, e)
             return False, ""
 
-    def _handle_progress_check(self, room_id: str, context: ConversationContext) -> tuple[bool, str]:
+    def _prompt_scale(self, room_id: str) -> float:
+        """Factor for prompt token budgets (below 1 when the room is near its usage budget)"""
+        scale = get_usage_governor().prompt_scale(room_id)
+        if scale < 1:
+            USAGE_DEGRADATIONS.inc(action='compact_prompt')
+        return scale
+
+    def _handle_progress_check(self, room_id: str, context: ContextSnapshot) -> tuple[bool, str]:
         """Handle 30-second progress check intervention"""
         return self._handle_progress_check_internal(room_id, context, is_manual=False)
 
-    def _handle_manual_progress_check(self, room_id: str, context: ConversationContext) -> tuple[bool, str]:
+    def _handle_manual_progress_check(self, room_id: str, context: ContextSnapshot) -> tuple[bool, str]:
         """Handle manual progress check - always returns feedback"""
         return self._handle_progress_check_internal(room_id, context, is_manual=True)
 
-    def _handle_progress_check_internal(self, room_id: str, context: ConversationContext, is_manual: bool = False) -> tuple[bool, str]:
+    def _handle_progress_check_internal(self, room_id: str, context: ContextSnapshot, is_manual: bool = False) -> tuple[bool, str]:
         """Internal method to handle progress checks"""
         try:
-            # Build conversation context (last 8 messages for better context)
+            # Build conversation context (rolling summary plus the latest turns)
+            scale = self._prompt_scale(room_id)
+            memory = prompt_memory(context, budget=int(MEMORY_TOKEN_BUDGET * scale))
             recent_conversation = ""
-            for msg in context.messages[-10:]:
+            recent_messages = memory.messages
+            for msg in recent_messages:
                 recent_conversation += f"{msg.username}: {msg.content}\n"
             
             # Build current state context
-            current_code = context.code_context if context.code_context else "No code written yet"
+            current_code = (code_for_prompt(context, recent_messages, int(CODE_CONTEXT_TOKEN_BUDGET * scale))
+                            if context.code_context else "No code written yet")
             problem_info = f"Title: {context.problem_title or 'Not specified'}\nDescription: {context.problem_description or 'Not specified'}"
             
             # Build AI message history context to avoid repetition
@@ -667,7 +795,7 @@ Language: {context.programming_language}
 Current Code:
 {current_code}
 
-Recent Conversation (last 10 messages):
+{memory.summary_block()}Recent Conversation:
 {recent_conversation}
 
 {ai_history_context}
@@ -710,7 +838,8 @@ Response format:
 Your response:"""
             
 
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'progress_check', room_id,
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "You are a helpful pair programming assistant doing progress monitoring. Only intervene when users truly need guidance."},
@@ -721,67 +850,65 @@ Your response:"""
             )
             
             llm_response = response.choices[0].message.content.strip()
-            print(f"📊 Progress check LLM response: {llm_response}")
-            
-            if llm_response.startswith("YES|"):
-                # Parse: YES|TYPE|MESSAGE
-                parts = llm_response.split("|", 2)
-                if len(parts) >= 3:
-                    intervention_type = parts[1]
-                    intervention_message = parts[2]
-                    
-                    print(f"📊 PROGRESS INTERVENTION ({intervention_type}): {intervention_message[:50]}...")
-                    return True, intervention_message
-                else:
-                    print(f"❌ Progress check format error: {llm_response}")
-                    return False, ""
-            elif llm_response.startswith("POSITIVE|"):
-                # Parse: POSITIVE|MESSAGE (for manual checks - return as positive feedback)
-                parts = llm_response.split("|", 1)
-                if len(parts) >= 2:
-                    positive_message = parts[1]
-                    print(f"📊 Manual progress check: Positive feedback - {positive_message[:50]}...")
-                    return True, positive_message  # Return True so it gets sent as notification
-                else:
-                    print(f"❌ Progress check format error: {llm_response}")
-                    return False, ""
-            elif llm_response.startswith("NO|"):
-                # Parse: NO|REASON
-                parts = llm_response.split("|", 1)
-                if len(parts) >= 2:
-                    reason = parts[1]
-                    print(f"📊 Progress check: Users making good progress in room {room_id} - Reason: {reason}")
-                    # For manual checks, convert NO responses to positive feedback
-                    if is_manual:
-                        return True, f"Good progress! {reason}"
-                    return False, ""
-                else:
-                    print(f"📊 Progress check: Users making good progress in room {room_id}")
-                    if is_manual:
-                        return True, "Good progress! You're on the right track."
-                    return False, ""
+            log.info("📊 Progress check LLM response for room %s: %s", room_id, llm_response)
+            
+            decision = self._parse_progress_check_response(room_id, llm_response, is_manual)
+            if not is_manual:
+                self.decision_memo.store(room_id, 'progress_check', context, decision)
+            return decision
+                
+        except Exception as e:
+            log.error("❌ Error in progress check for room %s: %s", room_id, e)
+            return False, ""
+
+    def _parse_progress_check_response(self, room_id: str, llm_response: str, is_manual: bool) -> tuple[bool, str]:
+        """Decision from a progress check reply (YES|TYPE|MESSAGE, POSITIVE|MESSAGE or NO|REASON)"""
+        if llm_response.startswith("YES|"):
+            # Parse: YES|TYPE|MESSAGE
+            parts = llm_response.split("|", 2)
+            if len(parts) >= 3:
+                intervention_type = parts[1]
+                intervention_message = parts[2]
+
+                print(f"📊 PROGRESS INTERVENTION ({intervention_type}): {intervention_message[:50]}...")
+                return True, intervention_message
+            else:
+                print(f"❌ Progress check format error: {llm_response}")
+                return False, ""
+        elif llm_response.startswith("POSITIVE|"):
+            # Parse: POSITIVE|MESSAGE (for manual checks - return as positive feedback)
+            parts = llm_response.split("|", 1)
+            if len(parts) >= 2:
+                positive_message = parts[1]
+                print(f"📊 Manual progress check: Positive feedback - {positive_message[:50]}...")
+                return True, positive_message  # Return True so it gets sent as notification
+            else:
+                print(f"❌ Progress check format error: {llm_response}")
+                return False, ""
+        elif llm_response.startswith("NO|"):
+            # Parse: NO|REASON
+            parts = llm_response.split("|", 1)
+            if len(parts) >= 2:
+                reason = parts[1]
+                print(f"📊 Progress check: Users making good progress in room {room_id} - Reason: {reason}")
+                # For manual checks, convert NO responses to positive feedback
+                if is_manual:
+                    return True, f"Good progress! {reason}"
+                return False, ""
             else:
                 print(f"📊 Progress check: Users making good progress in room {room_id}")
                 if is_manual:
-                    return True, "Good progress! Keep up the good work."
+                    return True, "Good progress! You're on the right track."
                 return False, ""
-                
-        except Exception as e:
-            print(f"❌ Error in progress check: {e}")
+        else:
+            print(f"📊 Progress check: Users making good progress in room {room_id}")
+            if is_manual:
+                return True, "Good progress! Keep up the good work."
             return False, ""
 
-    def _is_direct_ai_mention(self, message_content: str) -> bool:
-        """Check if message contains direct AI mention keywords"""
-        # Split into words for exact word matching (more efficient and accurate)
-        words = message_content.lower().split()
-        
-        # Single-word AI mention keywords
-        ai_keywords = {
-            '@ai', '@bob', 'bob', 'hey bob'
-        }
-        
-        # Check if any word is an AI keyword
-        return any(word in ai_keywords for word in words)
+    def _is_direct_ai_mention(self, message_content: str, message_id: Optional[str] = None) -> bool:
+        """Check if message contains direct AI mention keywords (whole words, cached by message id)"""
+        return AI_MENTION_MATCHER.matches(message_content, message_id)
 
     # def _is_syntax_request(self, message_content: str) -> bool:
     #     """Check if message contains syntax request keywords"""
@@ -793,16 +920,17 @@ Your response:"""
         
     #     return any(keyword in content_lower for keyword in syntax_keywords)
 
-    def _build_ai_history_context(self, context: ConversationContext) -> str:
+    def _build_ai_history_context(self, context: ContextSnapshot) -> str:
         """Build context about recent AI messages to avoid repetition"""
-        print(f"🔍 Building AI history context. Messages in history: {len(context.ai_message_history)}")
-        for i, msg in enumerate(context.ai_message_history):
-            print(f"   {i+1}. {msg[:50]}...")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("🔍 Building AI history context. Messages in history: %d", len(context.ai_message_history))
+            for i, msg in enumerate(context.ai_message_history):
+                log.debug("   %d. %.50s...", i + 1, msg)
             
         if not context.ai_message_history:
             return "REPETITION CHECK: No recent AI messages - this is your first intervention in a while."
         
-        recent_ai_messages = context.ai_message_history[-5:]  # Last 5 AI messages
+        recent_ai_messages = recent(context.ai_message_history, 5)  # Last 5 AI messages
         ai_context = "REPETITION CHECK - Your Recent AI Messages (AVOID REPEATING):\n"
         for i, msg in enumerate(recent_ai_messages, 1):
             ai_context += f"  {i}. \"{msg}\"\n"
@@ -825,26 +953,19 @@ Your response:"""
 
     def _track_ai_message(self, context: ConversationContext, message: str):
         """Track AI message for progressive hints"""
-        print(f"🤖 TRACKING AI MESSAGE: {message[:50]}...")
-        print(f"   Before tracking: {len(context.ai_message_history)} messages")
-        
-        # Add message to history (keep last 10 messages)
+        # Add message to history (ring buffer keeps the last 10 messages)
         context.ai_message_history.append(message)
-        if len(context.ai_message_history) > 10:
-            context.ai_message_history = context.ai_message_history[-10:]
-        
-        print(f"   After tracking: {len(context.ai_message_history)} messages")
+        context.bump_version()
+        log.debug("🤖 Tracked AI message (%d in history): %.50s...", len(context.ai_message_history), message)
 
     def _reset_ai_message_history(self, context: ConversationContext):
         """Reset AI message history when users make progress"""
         if context.ai_message_history:
-            print(f"🔄 RESETTING AI MESSAGE HISTORY: Had {len(context.ai_message_history)} messages")
-            for i, msg in enumerate(context.ai_message_history):
-                print(f"   Clearing {i+1}. {msg[:50]}...")
-            context.ai_message_history = []
-            print(f"🔄 Reset complete. New count: {len(context.ai_message_history)}")
+            log.debug("🔄 Resetting AI message history for room %s: had %d messages", context.room_id, len(context.ai_message_history))
+            context.ai_message_history.clear()
+            context.bump_version()
         else:
-            print(f"🔄 Reset called but history was already empty")
+            log.debug("🔄 Reset called but history was already empty for room %s", context.room_id)
 
     def _detect_user_progress(self, context: ConversationContext) -> bool:
         """Detect if users have made progress (to reset message history)"""
@@ -857,40 +978,21 @@ Your response:"""
             return True
         
         # 2. User demonstrates understanding by explaining approach
-        recent_messages = context.messages[-3:] if len(context.messages) >= 3 else context.messages
+        recent_messages = context.recent_messages(3)
         for msg in recent_messages:
             # Skip AI messages
             if msg.userId == 'ai_agent_bob':
                 continue
-                
-            msg_lower = msg.content.lower()
-            
-            # Look for solution explanation patterns
-            understanding_patterns = [
-                # Direct approach explanations
-                "i'm thinking about using", "we can use", "let's use", "i'll use",
-                "we can do", "i can do", "let's do", "we should",
-                "basically like", "so we", "then we", "first we",
-                
-                # Algorithm step descriptions  
-                "iterate", "loop", "check if", "add to", "put in",
-                "return", "create", "initialize", "make a",
-                
-                # Confirmation of understanding
-                "got it", "i see", "makes sense", "understood", "i get it",
-                "yeah so", "okay so", "right so", "oh i see"
-            ]
             
             # Check if user is explaining their approach
-            if any(pattern in msg_lower for pattern in understanding_patterns):
-                print(f"🧠 DETECTED USER UNDERSTANDING: '{msg.content[:60]}...' - will reset AI history")
+            if UNDERSTANDING_MATCHER.matches(msg.content, msg.id):
+                log.debug("🧠 Detected user understanding: '%.60s...' - will reset AI history", msg.content)
                 return True
         
         # 3. Traditional progress indicators
         for msg in recent_messages:
             # Look for keywords indicating successful progress
-            progress_keywords = ['works', 'working', 'fixed', 'got it', 'solved', 'success', 'good', 'nice']
-            if any(keyword in msg.content.lower() for keyword in progress_keywords):
+            if PROGRESS_MATCHER.matches(msg.content, msg.id):
                 return True
         
         # 4. No AI intervention needed for a while (users working independently)
@@ -917,7 +1019,8 @@ Your response:"""
         
         if should_respond and message:
             # Update AI response timestamp (but no cooldown enforced for direct mentions)
-            context.last_ai_response = datetime.now()
+            with context.lock:
+                context.last_ai_response = datetime.now()
             
             # Send immediate AI response using proper chat message format
             self.send_ai_message(room_id, message)
@@ -926,7 +1029,8 @@ Your response:"""
         else:
             # Even if LLM says no, we should respond to direct mentions with a helpful message
             fallback_message = "I'm here to help! What specific question do you have about your code or programming problem?"
-            context.last_ai_response = datetime.now()
+            with context.lock:
+                context.last_ai_response = datetime.now()
             self.send_ai_message(room_id, fallback_message)
             print(f"✅ AI responded with fallback to direct mention in room {room_id}")
 
@@ -949,93 +1053,91 @@ Your response:"""
             is_reflection=message_data.get('isReflection', False)
         )
         
-        if room_id not in self.conversation_history:
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
-            
-        context = self.conversation_history[room_id]
-        context.messages.append(message)
-        
-        # Set AI trigger type for AI messages
-        if message.userId == 'ai_agent_bob':
-            # This is an AI message - determine the trigger type
-            if message.is_reflection:
-                message.ai_trigger_type = 'reflection'
-            elif message_data.get('isProgressCheck', False):
-                message.ai_trigger_type = 'progress_check'
-            elif len(context.messages) >= 2 and self._is_direct_ai_mention(context.messages[-2].content):
-                message.ai_trigger_type = 'direct_mention'
-            else:
-                message.ai_trigger_type = 'idle_5s'  # Default for other AI interventions
+        context = self.get_context(room_id)
+        # Mutations are serialized per room (socket handlers, timers and savers share the context)
+        with context.lock:
+            if len(context.messages) == context.messages.maxlen:
+                self.memory.on_message_evicted(context, context.messages[0])
+            context.messages.append(message)
+            context.bump_version()
+        
+            # Set AI trigger type for AI messages
+            if message.userId == 'ai_agent_bob':
+                # This is an AI message - determine the trigger type
+                if message.is_reflection:
+                    message.ai_trigger_type = 'reflection'
+                elif message_data.get('isProgressCheck', False):
+                    message.ai_trigger_type = 'progress_check'
+                elif len(context.messages) >= 2 and self._is_direct_ai_mention(context.messages[-2].content, context.messages[-2].id):
+                    message.ai_trigger_type = 'direct_mention'
+                else:
+                    message.ai_trigger_type = 'idle_5s'  # Default for other AI interventions
         
-        # Save message to database asynchronously
-        self._save_message_to_db_async(message, context)
+            # Save message to database asynchronously
+            self._save_message_to_db_async(message, context)
         
-        # Track AI messages for progressive hints (only for non-reflection messages)
-        if message.userId == 'ai_agent_bob' and not message_data.get('isReflection', False):
-            self._track_ai_message(context, message.content)
+            # Track AI messages for progressive hints (only for non-reflection messages)
+            if message.userId == 'ai_agent_bob' and not message_data.get('isReflection', False):
+                self._track_ai_message(context, message.content)
         
-        # Update last message time for 5-second idle timer
-        context.last_message_time = datetime.now()
+            # Update last message time for 5-second idle timer
+            context.last_message_time = datetime.now()
         
-        # Check for user progress and reset AI message history if needed
-        if message.userId != 'ai_agent_bob':  # Only for user messages
-            if self._detect_user_progress(context):
-                self._reset_ai_message_history(context)
+            # Check for user progress and reset AI message history if needed
+            if message.userId != 'ai_agent_bob':  # Only for user messages
+                if self._detect_user_progress(context):
+                    self._reset_ai_message_history(context)
         
         # Cancel any pending intervention since user is active
         self.intervention_service.cancel_intervention(room_id, "new message received")
 
-        print(f"💬 New message added to context in room {room_id}: {message.content[:50]}...")
+        log.debug("💬 New message added to context in room %s: %.50s...", room_id, message.content)
         
         # Check for direct AI mention (@AI keyword) - PRIORITY RESPONSE
-        if self._is_direct_ai_mention(message.content):
-            print(f"🎯 DIRECT AI MENTION detected in room {room_id}: {message.content[:50]}...")
+        if self._is_direct_ai_mention(message.content, message.id):
+            log.info("🎯 Direct AI mention detected in room %s: %.50s...", room_id, message.content)
             # Respond immediately without waiting for 5-second timer
             self._handle_direct_ai_mention(room_id)
             # DO NOT start timer for direct mentions - return early
-            if len(context.messages) > 10:  # max_context_messages
-                context.messages = context.messages[-10:]
             return
         
         # Trigger 30-second progress check (only if not already running)
         # Only for user messages (not AI messages)
         if message.userId != 'ai_agent_bob':
-            print("📊 Triggering 30-second progress check for new message...", message)
+            log.debug("📊 Triggering progress check for new message in room %s", room_id)
             self.intervention_service.trigger_progress_check(room_id)
-        
-        # Keep only recent messages
-        if len(context.messages) > 10:  # max_context_messages
-            context.messages = context.messages[-10:]
 
     def update_code_context(self, room_id: str, code: str, language: str = "python", user_id: str = None):
-        """Update the current code context for a room"""
-        if room_id not in self.conversation_history:
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
-            
-        context = self.conversation_history[room_id]
-        context.code_context = code
-        context.programming_language = language
-        
-        # Cancel pending interventions - target specific user's personal room if user_id provided
-        if user_id:
-            # Cancel timer for the specific user's personal room (if they're in individual mode)
-            personal_room = f"{room_id}_personal_{user_id}"
-            self.intervention_service.cancel_intervention(personal_room, "code update received")
-            print(f"🖥️ Code updated by user {user_id} - cancelled timer for personal room: {personal_room}")
-            
-            # Also cancel for the main room (for shared mode compatibility)
-            self.intervention_service.cancel_intervention(room_id, "code update received")
-            print(f"🖥️ Code updated in room {room_id} - cancelled pending timer")
-        else:
-            # Fallback to original behavior if no user_id provided
-            self.intervention_service.cancel_intervention(room_id, "code update received")
-            print(f"🖥️ Code updated in room {room_id} - cancelled pending timer")
+        """Ingest an editor revision: latest code wins, timer cancels are coalesced per room"""
+        context = self.get_context(room_id)
+        with context.lock:
+            # Where this revision (all edits coalesced since the last one) starts to differ becomes a focus point
+            edit_offset = first_difference(context.code_context, code) if context.code_context else None
+            context.code_context = code
+            context.programming_language = language
+            context.code_revision += 1
+            context.bump_version()
+            if edit_offset is not None:
+                offsets = context.cursor_offsets
+                if not offsets or line_of_offset(code, offsets[-1]) != line_of_offset(code, edit_offset):
+                    self._add_focus_offset(context, edit_offset)
+        
+        # Target the user's personal room (if they're in individual mode) and the main room (shared mode)
+        personal_room = self.personal_room_for(room_id, user_id) if user_id else None
+        now = time.monotonic()
+        for room in (personal_room, room_id):
+            if not room:
+                continue
+            # Idle timers started before this activity stand down when they fire, so an actual cancel
+            # is only needed once per interval to release the timer (and its speculative decision) early
+            self.intervention_service.note_activity(room, now)
+            if now < self._next_code_cancel.get(room, 0):
+                continue
+            self._next_code_cancel[room] = now + CODE_UPDATE_CANCEL_INTERVAL
+            if self.intervention_service.has_pending_timer(room):
+                self.intervention_service.cancel_intervention(room, "code update received")
+                log.debug("🖥️ Code updated in room %s - cancelled pending timer", room)
+        event_log.debug("🖥️ Code revision %d ingested for room %s", context.code_revision, room_id)
         
         # Planning intervention has been disabled
         # if not context.planning_check_done:
@@ -1048,28 +1150,26 @@ Your response:"""
             return
             
         context = self.conversation_history[room_id]
-        context.last_execution_code = code
-        context.last_execution_output = output
-        context.last_execution_error = error
-        context.last_execution_success = success
-        context.last_execution_time = datetime.now()
-        
-        # If execution was successful, reset AI message history
-        if success and not error:
-            self._reset_ai_message_history(context)
-            print(f"🎉 Successful execution in room {room_id} - reset AI message history")
+        with context.lock:
+            context.last_execution_code = code
+            context.last_execution_output = output
+            context.last_execution_error = error
+            context.last_execution_success = success
+            context.last_execution_time = datetime.now()
+            context.bump_version()
+            
+            # If execution was successful, reset AI message history
+            if success and not error:
+                self._reset_ai_message_history(context)
+                print(f"🎉 Successful execution in room {room_id} - reset AI message history")
 
     def update_problem_context(self, room_id: str, problem_title: str, problem_description: str):
         """Update the current problem description for a room"""
-        if room_id not in self.conversation_history:
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
-            
-        context = self.conversation_history[room_id]
-        context.problem_title = problem_title
-        context.problem_description = problem_description
+        context = self.get_context(room_id)
+        with context.lock:
+            context.problem_title = problem_title
+            context.problem_description = problem_description
+            context.bump_version()
 
     def should_respond(self, room_id: str) -> bool:
         """Simple decision making for AI intervention after 5-second idle"""
@@ -1086,19 +1186,16 @@ Your response:"""
             
         context = self.conversation_history[room_id]
         
-        # Check if we have a pre-generated intervention message from centralized decision
-        if hasattr(context, 'pending_intervention_message') and context.pending_intervention_message:
+        # Consume the pre-generated intervention message from centralized decision atomically
+        with context.lock:
             intervention_message = context.pending_intervention_message
-            
+            if intervention_message:
+                context.last_ai_response = datetime.now()
+                context.pending_intervention_message = None
+        
+        if intervention_message:
             print(f"✅ USING CENTRALIZED INTERVENTION: {len(intervention_message.split())} words")
             print(f"   Preview: {intervention_message[:100]}{'...' if len(intervention_message) > 100 else ''}")
-            
-            # Update tracking
-            context.last_ai_response = datetime.now()
-            
-            # Clear the pending message
-            context.pending_intervention_message = None
-            
             return intervention_message
         else:
             print("⚠️  No centralized intervention message found")
@@ -1153,17 +1250,15 @@ Your response:"""
             is_reflection=False
         )
         
-        if room_id not in self.conversation_history:
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
+        context = self.get_context(room_id)
+        with context.lock:
+            if len(context.messages) == context.messages.maxlen:
+                self.memory.on_message_evicted(context, context.messages[0])
+            context.messages.append(message)
+            context.bump_version()
             
-        context = self.conversation_history[room_id]
-        context.messages.append(message)
-        
-        # Save progress check message to database asynchronously
-        self._save_message_to_db_async(message, context)
+            # Save progress check message to database asynchronously
+            self._save_message_to_db_async(message, context)
         
         # DO NOT update last_ai_response timestamp for progress checks
         # DO NOT track AI message for progressive hints (to avoid interference)
@@ -1176,9 +1271,10 @@ Your response:"""
         # Use provided ai_mode or look up the stored mode for the room
         effective_ai_mode = ai_mode if ai_mode is not None else self.get_room_ai_mode(room_id)
         
-        message = self.audio_service.send_ai_message(
-            room_id, content, is_reflection, False, self.conversation_history, is_progress_check, effective_ai_mode
-        )
+        with get_tracer().span("send_ai_message", room=room_id, ai_mode=effective_ai_mode):
+            message = self.audio_service.send_ai_message(
+                room_id, content, is_reflection, False, self.conversation_history, is_progress_check, effective_ai_mode
+            )
         
         # Always add AI message to conversation context, even if audio service returns None
         # (audio service may return None for async operations but still sends the message)
@@ -1204,6 +1300,10 @@ Your response:"""
 
     def process_message_sync(self, message_data: Dict[str, Any]):
         """Process a new message and potentially respond"""
+        with get_tracer().span("process_message", room=message_data.get('room')):
+            self._process_message(message_data)
+
+    def _process_message(self, message_data: Dict[str, Any]):
         try:
             # Add message to context first
             self.add_message_to_context(message_data)
@@ -1237,7 +1337,7 @@ Your response:"""
             
             # Regular AI logic
             # Check if this is a direct AI mention BEFORE adding to context
-            is_direct_mention = self._is_direct_ai_mention(message_data.get('content', ''))
+            is_direct_mention = self._is_direct_ai_mention(message_data.get('content', ''), message_data.get('id'))
             
             # Only start timer for non-direct mentions
             if not is_direct_mention:
@@ -1251,6 +1351,25 @@ Your response:"""
         """Handle code updates from the editor"""
         self.update_code_context(room_id, code, language, user_id)
         
+    def handle_cursor_update(self, room_id: str, offset: int, user_id: str = None):
+        """Record an editor cursor position as the focus of code embedded in prompts"""
+        personal_room = self.personal_room_for(room_id, user_id) if user_id else None
+        for room in (room_id, personal_room):
+            context = self.conversation_history.get(room) if room else None
+            if context is None:
+                continue
+            # Not a prompt-visible change on its own (no version bump): cursor moves accompany edits
+            with context.lock:
+                self._add_focus_offset(context, offset)
+
+    def _add_focus_offset(self, context: ConversationContext, offset: int):
+        """Append a cursor or edit position to the room's focus list (call with the context lock held)"""
+        offsets = context.cursor_offsets
+        if offsets and offsets[-1] == offset:
+            return
+        offsets.append(offset)
+        del offsets[:-MAX_FOCUS_LINES]
+
     def handle_problem_update(self, room_id: str, problem_title: str, problem_description: str):
         """Handle problem description updates"""
         self.update_problem_context(room_id, problem_title, problem_description)
@@ -1274,14 +1393,9 @@ Your response:"""
     def join_room(self, room_id: str):
         """AI agent joins a room (but doesn't send greeting until session starts)"""
         # Reset AI message history for fresh room join (regardless of OpenAI client)
-        if room_id not in self.conversation_history:
-            # Initialize context if it doesn't exist
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
-        context = self.conversation_history[room_id]
-        self._reset_ai_message_history(context)
+        context = self.get_context(room_id)
+        with context.lock:
+            self._reset_ai_message_history(context)
         print(f"🔄 Reset AI message history for fresh room join: {room_id}")
         
         # Only proceed with OpenAI functionality if client is available
@@ -1298,14 +1412,9 @@ Your response:"""
             return
             
         # Reset AI message history for fresh session start
-        if room_id not in self.conversation_history:
-            # Initialize context if it doesn't exist
-            self.conversation_history[room_id] = ConversationContext(
-                messages=[],
-                room_id=room_id
-            )
-        context = self.conversation_history[room_id]
-        self._reset_ai_message_history(context)
+        context = self.get_context(room_id)
+        with context.lock:
+            self._reset_ai_message_history(context)
         print(f"🔄 Reset AI message history for new session in room {room_id}")
             
         # Send a greeting message when session starts
@@ -1351,7 +1460,8 @@ Your response:"""
         # Setting flag to true to prevent any calls to this function
         context = self.conversation_history.get(room_id)
         if context:
-            context.planning_check_done = True
+            with context.lock:
+                context.planning_check_done = True
         return
 
     def reset_room_state(self, room_id: str):
@@ -1363,8 +1473,7 @@ Your response:"""
             self.intervention_service.cleanup_room(room_id)
             
             # Remove conversation history
-            if room_id in self.conversation_history:
-                del self.conversation_history[room_id]
+            if self.conversation_history.pop(room_id, None) is not None:
                 print(f"🗑️ Cleared conversation history for room {room_id}")
             
             # Clear code analysis tracking
@@ -1430,13 +1539,13 @@ Your response:"""
         return self.intervention_service.has_progress_timer(room_id)
     
     def get_active_progress_rooms(self):
-        """Get list of rooms with active progress timers"""
+        """Get list of rooms with scheduled progress checks"""
         return self.intervention_service.get_active_progress_rooms()
 
     # Public methods for accessing intervention service functionality
-    def cancel_pending_intervention(self, room_id: str, reason: str):
-        """Public method to cancel pending interventions"""
-        self.intervention_service.cancel_intervention(room_id, reason)
+    def cancel_pending_intervention(self, room_id: str, reason: str, in_flight: bool = False):
+        """Public method to cancel pending interventions (in_flight also aborts one already running)"""
+        self.intervention_service.cancel_intervention(room_id, reason, in_flight)
 
     def has_pending_timer(self, room_id: str) -> bool:
         """Check if room has a pending timer"""
@@ -1457,26 +1566,28 @@ Your response:"""
         self.intervention_service.cancel_intervention(room_id, reason)
 
 
-    def generate_scaffolding_with_tracking(self, room_id: str, comment_line: str, language: str, full_code: str = ""):
+    def generate_scaffolding_with_tracking(self, room_id: str, comment_line: str, language: str, full_code: str = "", cursor_line: int = None):
         """Generate scaffolding with proper tracking"""
         from .scaffolding_service import ScaffoldingService
         
         # Create service instance and generate scaffolding
         scaffolding_service = ScaffoldingService()
-        result = scaffolding_service.generate_scaffolding(comment_line, language, full_code)
+        with usage_scope(room_id):
+            result = scaffolding_service.generate_scaffolding(comment_line, language, full_code, cursor_line)
         
         # Track the activity with complete context
         self.track_scaffolding_activity(room_id, comment_line, language, result)
         
         return result
 
-    def generate_todo_code_with_tracking(self, room_id: str, todo_line: str, language: str, full_code: str = "", problem_context: str = ""):
+    def generate_todo_code_with_tracking(self, room_id: str, todo_line: str, language: str, full_code: str = "", problem_context: str = "", cursor_line: int = None):
         """Generate TODO code with proper tracking"""
         from .todo_reveal_service import TodoRevealService
         
         # Create service instance and generate TODO code
         todo_reveal_service = TodoRevealService()
-        result = todo_reveal_service.generate_todo_code(todo_line, language, full_code, problem_context)
+        with usage_scope(room_id):
+            result = todo_reveal_service.generate_todo_code(todo_line, language, full_code, problem_context, cursor_line)
         
         # Track the activity with complete context
         self.track_todo_reveal(room_id, todo_line, language, result)
@@ -9,7 +9,17 @@ import time
 from datetime import datetime
 from typing import Optional
 
-from openai import OpenAI, AsyncOpenAI, DefaultAioHttpClient
+from openai import OpenAI, DefaultAioHttpClient
+
+from config.logging_config import get_logger, get_event_logger
+from .cancellation import current_token, is_cancelled
+from .llm_provider import create_async_openai_client
+from .metrics import TTS_FIRST_CHUNK_SECONDS, TTS_BYTES, TTS_STREAMS, CANCELLED_CALLS, USAGE_DEGRADATIONS
+from .tracing import get_tracer, propagate, annotate
+from .usage_governor import get_usage_governor, UsageTier
+
+log = get_logger(__name__)
+chunk_log = get_event_logger(__name__)  # sampled: one record per audio chunk
 
 
 class AIAudioService:
@@ -54,18 +64,56 @@ class AIAudioService:
     #         print(f"Error generating speech: {e}")
     #         return None
 
+    def _start_audio_thread(self, generate):
+        """Run audio generation on its own thread, as work of the current intervention (if any)"""
+        token = current_token()
+        if token:
+            token.begin_work()
+
+        def run():
+            try:
+                generate()
+            finally:
+                if token:
+                    token.end_work()
+
+        threading.Thread(target=propagate(run), daemon=True).start()
+
+    def _emit_audio_cancelled(self, room_id: str, message_id: str, reason: str):
+        """Tell clients to drop the message's audio because its intervention was cancelled"""
+        self.socketio.emit('ai_audio_error', {
+            'messageId': message_id,
+            'room': room_id,
+            'error': f'cancelled: {reason}'
+        }, room=room_id, namespace='/ws')
+        self.socketio.emit('ai_audio_done', {
+            'messageId': message_id,
+            'room': room_id,
+            'status': 'cancelled'
+        }, room=room_id, namespace='/ws')
+        get_tracer().finish_pending(message_id, cancelled=reason)
+
     def generate_streaming_speech(self, text: str, room_id: str, message_id: str):
         """Generate streaming speech audio using OpenAI's streaming TTS API with async inside"""
         if not self.client:
             return None
+
+        # Intervention token (if any): the stream is abandoned at the next chunk once it is cancelled
+        token = current_token()
+        if token and token.cancelled:
+            CANCELLED_CALLS.inc(kind='tts', stage='before')
+            self._emit_audio_cancelled(room_id, message_id, token.reason)
+            return None
+
+        get_usage_governor().record_tts(min(len(text), 500), room_id)
             
         async def _async_generate_streaming():
             """Internal async function for true streaming audio with aiohttp backend"""
             
             try:
                 # Use async with pattern for proper resource management with aiohttp
-                async with AsyncOpenAI(
-                    api_key=self.client.api_key,
+                async with create_async_openai_client(
+                    self.client,
                     http_client=DefaultAioHttpClient()
                 ) as async_client:
                     
@@ -81,7 +129,8 @@ class AIAudioService:
                     chunk_number = 0
                     total_bytes_sent = 0
                     
-                    print(f"🎤 Starting to stream audio with aiohttp: '{limited_text[:50]}...'")
+                    log.debug("🎤 Starting to stream audio with aiohttp: '%.50s...'", limited_text)
+                    tts_started = time.perf_counter()
                     
                     # Use OpenAI's official streaming approach with proper context management
                     async with async_client.audio.speech.with_streaming_response.create(
@@ -94,14 +143,19 @@ class AIAudioService:
                         chunks_sent = []
                         # Stream chunks directly as they arrive - TRUE real-time streaming
                         async for chunk in response.iter_bytes(chunk_size=1024 * 2):  # 2KB chunks for PCM real-time
+                            if token and token.cancelled:
+                                break  # leaving the response context closes the HTTP stream
                             if chunk:
                                 chunk_number += 1
                                 total_bytes_sent += len(chunk)
+                                if chunk_number == 1:
+                                    TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - tts_started, format='pcm')
+                                    annotate(first_chunk_ms=round((time.perf_counter() - tts_started) * 1000, 1))
                                 chunk_base64 = base64.b64encode(chunk).decode('utf-8')
                                 chunks_sent.append(chunk_number)
                                 
                                 # Log concise chunk info
-                                print(f"🎵 Audio chunk {chunk_number} sent ({len(chunk)} bytes) to room {room_id}")
+                                chunk_log.debug("🎵 Audio chunk %d sent (%d bytes) to room %s", chunk_number, len(chunk), room_id)
                                 
                                 # Send chunk immediately as it arrives from OpenAI
                                 self.socketio.emit('ai_audio_chunk', {
@@ -115,10 +169,18 @@ class AIAudioService:
                                     'format': 'pcm'  # PCM format for true real-time streaming
                                 }, room=room_id, namespace='/ws')
 
+                        if token and token.cancelled:
+                            log.info("🛑 Audio stream for %s cancelled after %d chunks (%s)", message_id, chunk_number, token.reason)
+                            CANCELLED_CALLS.inc(kind='tts', stage='in_flight')
+                            TTS_BYTES.inc(total_bytes_sent, format='pcm')
+                            TTS_STREAMS.inc(format='pcm', outcome='cancelled')
+                            self._emit_audio_cancelled(room_id, message_id, token.reason)
+                            return None
+
                         # Send a special "final chunk" marker
                         if chunks_sent:
                             final_chunk_number = chunks_sent[-1]
-                            print(f"🎵 Audio stream completed - {len(chunks_sent)} chunks sent ({total_bytes_sent} total bytes)")
+                            log.debug("🎵 Audio stream completed - %d chunks sent (%d total bytes)", len(chunks_sent), total_bytes_sent)
                             
                             # Send a special "final chunk" marker
                             self.socketio.emit('ai_audio_chunk', {
@@ -142,18 +204,21 @@ class AIAudioService:
                             'format': 'pcm'
                         }, room=room_id, namespace='/ws')
                         
-                        print(f"✅ Streamed {chunk_number} PCM chunks ({total_bytes_sent} bytes) with aiohttp")
+                        log.info("✅ Streamed %d PCM chunks (%d bytes) with aiohttp to room %s", chunk_number, total_bytes_sent, room_id)
+                        TTS_BYTES.inc(total_bytes_sent, format='pcm')
+                        TTS_STREAMS.inc(format='pcm', outcome='ok')
                     return True
                     
             except ImportError:
                 # Fallback to default httpx if aiohttp is not available
                 print("⚠️  aiohttp not available, falling back to default httpx")
-                async with AsyncOpenAI(api_key=self.client.api_key) as async_client:
+                async with create_async_openai_client(self.client) as async_client:
                     # Same streaming logic but with default httpx client
                     return await self._stream_with_client(async_client, text, room_id, message_id)
                     
             except Exception as e:
-                print(f"Error generating streaming speech: {e}")
+                log.error("❌ Error generating streaming speech: %s", e)
+                TTS_STREAMS.inc(format='pcm', outcome='error')
                 # Signal error
                 self.socketio.emit('ai_audio_error', {
                     'messageId': message_id,
@@ -170,13 +235,15 @@ class AIAudioService:
                 
                 return None
         
-        # Run the async function using asyncio.run in a safe way
-        try:
-            return asyncio.run(_async_generate_streaming())
-        except Exception as e:
-            print(f"Error in asyncio.run: {e}")
-            # Fallback to simple non-streaming audio
-            return self._fallback_simple_audio(text, room_id, message_id)
+        # Run the async function using asyncio.run in a safe way (the task inherits the trace context)
+        with get_tracer().span("tts_stream", message_id=message_id, chars=len(text)):
+            try:
+                return asyncio.run(_async_generate_streaming())
+            except Exception as e:
+                print(f"Error in asyncio.run: {e}")
+                annotate(fallback='mp3')
+                # Fallback to simple non-streaming audio
+                return self._fallback_simple_audio(text, room_id, message_id)
     
     def _fallback_simple_audio(self, text: str, room_id: str, message_id: str):
         """Fallback method for simple non-streaming audio generation"""
@@ -185,6 +252,7 @@ class AIAudioService:
             limited_text = text[:500] + "..." if len(text) > 500 else text
             
             # Generate audio using the sync OpenAI client
+            tts_started = time.perf_counter()
             response = self.client.audio.speech.create(
                 model=self.voice_config["model"],
                 voice=self.voice_config["voice"],
@@ -195,6 +263,9 @@ class AIAudioService:
             
             # Convert to base64 and send as single chunk
             audio_data = response.content
+            TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - tts_started, format='mp3')
+            TTS_BYTES.inc(len(audio_data), format='mp3')
+            TTS_STREAMS.inc(format='mp3', outcome='ok')
             chunk_base64 = base64.b64encode(audio_data).decode('utf-8')
             
             print(f"🎵 MP3 audio generated ({len(audio_data)} bytes) for room {room_id}")
@@ -225,6 +296,7 @@ class AIAudioService:
             
         except Exception as e:
             print(f"Error in fallback audio generation: {e}")
+            TTS_STREAMS.inc(format='mp3', outcome='error')
             return None
 
     def send_ai_message_with_audio(self, room_id: str, content: str, is_reflection: bool = False, 
@@ -250,7 +322,8 @@ class AIAudioService:
         # Update last response time for cooldown tracking
         if conversation_history and room_id in conversation_history:
             context = conversation_history[room_id]
-            context.last_ai_response = datetime.now()
+            with context.lock:
+                context.last_ai_response = datetime.now()
             print(f"🔒 AI RESPONSE: Tracking response time for cooldown in room {room_id}")
         
         print(f"🤖 Sending AI message with audio to room {room_id}: {content[:50]}...")
@@ -269,6 +342,7 @@ class AIAudioService:
                 
                 # Send to specific user only
                 self.socketio.emit('chat_message', message, room=user_id, namespace='/ws')
+                get_tracer().open_span("audio_playback", key=message['id'])  # finished by ai_audio_playback_complete
                 
                 # Generate audio for the personal user
                 def generate_and_stream_audio():
@@ -284,11 +358,12 @@ class AIAudioService:
                         }, room=user_id, namespace='/ws')
                 
                 # Start audio generation in background thread
-                threading.Thread(target=generate_and_stream_audio, daemon=True).start()
+                self._start_audio_thread(generate_and_stream_audio)
                 return message
         
         # Regular shared room - send to all users in the room
         self.socketio.emit('chat_message', message, room=room_id, namespace='/ws')
+        get_tracer().open_span("audio_playback", key=message['id'])  # finished by ai_audio_playback_complete
         
         # Generate audio in parallel (non-blocking)
         def generate_and_stream_audio():
@@ -304,7 +379,7 @@ class AIAudioService:
                 }, room=room_id, namespace='/ws')
         
         # Start audio generation in a separate thread
-        threading.Thread(target=generate_and_stream_audio, daemon=True).start()
+        self._start_audio_thread(generate_and_stream_audio)
         
         return message
 
@@ -329,7 +404,9 @@ class AIAudioService:
         
         # Update last response time for non-greeting messages
         if conversation_history and room_id in conversation_history:
-            conversation_history[room_id].last_ai_response = datetime.now()
+            context = conversation_history[room_id]
+            with context.lock:
+                context.last_ai_response = datetime.now()
         
         print(f"🤖 Sending text-only AI message to room {room_id}: {content[:50]}...")
         
@@ -363,6 +440,12 @@ class AIAudioService:
                 print(f"🤖 Shared No Voice mode detected - sending text-only message to room {room_id}")
                 return self.send_ai_message_text_only(
                     room_id, content, is_reflection, is_execution_help, conversation_history, is_progress_check)
+            elif get_usage_governor().tier(room_id) >= UsageTier.TEXT_ONLY:
+                # Usage budget spent - keep helping, but without voice
+                USAGE_DEGRADATIONS.inc(action='text_only')
+                log.info("💸 Sending text-only AI message to room %s: usage budget spent", room_id)
+                return self.send_ai_message_text_only(
+                    room_id, content, is_reflection, is_execution_help, conversation_history, is_progress_check)
             else:
                 # For other modes (shared, individual), generate audio
                 return self.send_ai_message_with_audio(
@@ -395,7 +478,9 @@ class AIAudioService:
         chunk_number = 0
         total_bytes_sent = 0
         
-        print(f"🎤 Starting to stream audio (fallback): '{limited_text[:50]}...'")
+        log.debug("🎤 Starting to stream audio (fallback): '%.50s...'", limited_text)
+        tts_started = time.perf_counter()
+        token = current_token()
         
         # Use streaming approach with the provided client
         async with async_client.audio.speech.with_streaming_response.create(
@@ -407,9 +492,14 @@ class AIAudioService:
         ) as response:
             chunks_sent = []
             async for chunk in response.iter_bytes(chunk_size=1024 * 2):
+                if is_cancelled():
+                    break  # leaving the response context closes the HTTP stream
                 if chunk:
                     chunk_number += 1
                     total_bytes_sent += len(chunk)
+                    if chunk_number == 1:
+                        TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - tts_started, format='pcm')
+                        annotate(first_chunk_ms=round((time.perf_counter() - tts_started) * 1000, 1))
                     chunk_base64 = base64.b64encode(chunk).decode('utf-8')
                     chunks_sent.append(chunk_number)
                     
@@ -424,6 +514,14 @@ class AIAudioService:
                         'format': 'pcm'
                     }, room=room_id, namespace='/ws')
 
+            if is_cancelled():
+                log.info("🛑 Audio stream for %s cancelled after %d chunks (%s)", message_id, chunk_number, token.reason)
+                CANCELLED_CALLS.inc(kind='tts', stage='in_flight')
+                TTS_BYTES.inc(total_bytes_sent, format='pcm')
+                TTS_STREAMS.inc(format='pcm', outcome='cancelled')
+                self._emit_audio_cancelled(room_id, message_id, token.reason)
+                return None
+
             # Final marker
             if chunks_sent:
                 final_chunk_number = chunks_sent[-1]
@@ -448,5 +546,7 @@ class AIAudioService:
                 'format': 'pcm'
             }, room=room_id, namespace='/ws')
             
-            print(f"✅ Streamed {chunk_number} PCM chunks ({total_bytes_sent} bytes)")
+            log.info("✅ Streamed %d PCM chunks (%d bytes) to room %s", chunk_number, total_bytes_sent, room_id)
+            TTS_BYTES.inc(total_bytes_sent, format='pcm')
+            TTS_STREAMS.inc(format='pcm', outcome='ok')
         return True
@@ -3,13 +3,22 @@ AI Code Analysis Service - Handles code analysis and execution validation
 """
 
 import json
-import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 
 from openai import OpenAI
 
 from .ai_models import ConversationContext
+from .metrics import chat_completion
+from .room_lifecycle import RoomStateStore, room_state_limits
+from .text_matching import KeywordMatcher
+from .usage_governor import usage_scope
+from config.logging_config import get_logger
+
+log = get_logger(__name__)
+
+# Words suggesting a chat message describes the task being solved
+PROBLEM_CONTEXT_MATCHER = KeywordMatcher(['problem', 'task', 'write', 'function', 'create'], boundary='prefix')
 
 
 class AICodeAnalysisService:
@@ -18,7 +27,7 @@ class AICodeAnalysisService:
         self.socketio = socketio_instance
         
         # Execution validation tracking
-        self.execution_attempts = {}  # Track attempts per room for graduated help
+        self.execution_attempts = RoomStateStore('execution_attempts', **room_state_limits())  # Track attempts per room for graduated help
         self.validation_tasks = {}    # Track running validation tasks
 
     def analyze_code_block(self, code: str, language: str, context: Dict[str, Any], 
@@ -45,7 +54,8 @@ class AICodeAnalysisService:
             # Create analysis prompt with problem context
             analysis_prompt = self._create_code_analysis_prompt(code, language, context, problem_context)
             
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'code_analysis', room_id,
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "You are an expert code reviewer. Analyze for real errors only. Single loops through helper function results are efficient O(n). Only suggest optimization for actual nested loops (for i, for j patterns). Trust helper functions work correctly."},
@@ -292,9 +302,10 @@ Response (max 150 chars):
 
 Examples: "Fix: Missing )", "correct", "Subtask 1: correct, subtask 2: replace nested loops with hashmap" (only mention subtasks with actual code)
 """
-            print(f"🔍 Panel analysis prompt: {prompt}...")  # Log first 200 chars
+            log.debug("🔍 Panel analysis prompt: %s", prompt)
 
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'panel_analysis',
                 model="gpt-4.1-mini",
                 messages=[{"role": "user", "content": prompt}],
                 # max_tokens=100,
@@ -303,7 +314,7 @@ Examples: "Fix: Missing )", "correct", "Subtask 1: correct, subtask 2: replace n
             
             analysis = response.choices[0].message.content.strip()
 
-            print(f"🔍 Panel analysis response: {analysis}")
+            log.debug("🔍 Panel analysis response: %s", analysis)
             
             if analysis.lower() == "correct":
                 return {
@@ -331,37 +342,34 @@ Examples: "Fix: Missing )", "correct", "Subtask 1: correct, subtask 2: replace n
             }
             
         except Exception as e:
-            logging.error(f"Error in panel analysis: {e}")
+            log.error("❌ Error in panel analysis: %s", e)
             return None
 
     def start_panel_analysis(self, room_id: str, code: str, result: dict, conversation_history):
         """Start non-blocking AI analysis for execution panel"""
         try:
             # Store execution results in conversation context for later reference
-            if room_id not in conversation_history:
-                from .ai_models import ConversationContext
-                conversation_history[room_id] = ConversationContext(
-                    messages=[],
-                    room_id=room_id
-                )
-            
-            context = conversation_history[room_id]
-            context.last_execution_code = code
-            context.last_execution_output = result.get('output', '')
-            context.last_execution_error = result.get('error', '')
-            context.last_execution_success = result.get('success', True)
-            context.last_execution_time = datetime.now()
+            context = conversation_history.get_or_create(
+                room_id, lambda: ConversationContext(messages=[], room_id=room_id)
+            )
+            with context.lock:
+                context.last_execution_code = code
+                context.last_execution_output = result.get('output', '')
+                context.last_execution_error = result.get('error', '')
+                context.last_execution_success = result.get('success', True)
+                context.last_execution_time = datetime.now()
+                context.bump_version()
+            snapshot = context.snapshot()
             
             # Get problem context from conversation history
             problem_context = ""
-            if context.problem_description or context.problem_title:
-                problem_context = context.problem_description or context.problem_title
+            if snapshot.problem_description or snapshot.problem_title:
+                problem_context = snapshot.problem_description or snapshot.problem_title
             else:
                 # If no explicit problem, look for recent problem-related messages
-                recent_messages = context.messages[-10:] if context.messages else []
+                recent_messages = snapshot.recent_messages(10)
                 for msg in reversed(recent_messages):
-                    content = msg.content.lower()
-                    if any(word in content for word in ['problem', 'task', 'write', 'function', 'create']):
+                    if PROBLEM_CONTEXT_MATCHER.matches(msg.content, msg.id):
                         problem_context = msg.content[:200]
                         break
             
@@ -373,12 +381,13 @@ Examples: "Fix: Missing )", "correct", "Subtask 1: correct, subtask 2: replace n
                 print(f"🔍 Started panel analysis for room {room_id}")
                 
         except Exception as e:
-            logging.error(f"Error starting panel analysis: {e}")
+            log.error("❌ Error starting panel analysis: %s", e)
 
     def _run_panel_analysis(self, room_id: str, code: str, result: dict, problem_context: str):
         """Background task for panel analysis"""
         try:
-            analysis = self.analyze_execution_for_panel(code, result, problem_context)
+            with usage_scope(room_id):
+                analysis = self.analyze_execution_for_panel(code, result, problem_context)
             
             # Track this code execution analysis activity with complete context
             try:
@@ -416,7 +425,7 @@ Examples: "Fix: Missing )", "correct", "Subtask 1: correct, subtask 2: replace n
                     }, room=base_room, namespace='/ws')
                 
         except Exception as e:
-            logging.error(f"Error in panel analysis background task: {e}")
+            log.error("❌ Error in panel analysis background task: %s", e)
 
     def reset_execution_tracking(self, room_id: str):
         """Reset execution tracking for a room"""
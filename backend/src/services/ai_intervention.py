@@ -3,12 +3,36 @@ AI Intervention Service - Handles timer management and intervention scheduling
 """
 
 import asyncio
+import os
 import threading
 import time
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Tuple
 
 from .ai_models import ConversationContext
+from .cancellation import CancellationToken, cancellation_scope, is_cancelled
+from .intervention_settings import InterventionSettings, SettingsRegistry, default_settings_from_env
+from .metrics import SPECULATIVE_DECISIONS, CANCELLED_CALLS
+from .progress_sweep import ProgressSweep
+from .tracing import get_tracer, propagate
+from config.logging_config import get_logger
+
+log = get_logger(__name__)
+
+# Longest a fired idle timer waits for its speculative decision before deciding afresh
+SPECULATION_WAIT_SECONDS = float(os.environ.get('SPECULATION_WAIT_SECONDS', '10'))
+
+
+class SpeculativeDecision:
+    """An idle intervention decision computed while the idle timer is still waiting"""
+
+    def __init__(self, room_id: str, state_version: int):
+        self.room_id = room_id
+        self.state_version = state_version  # room state the decision was computed from
+        self.done = threading.Event()
+        self.result: Optional[Tuple[bool, str]] = None
+        self.discarded = False
+        self.token = CancellationToken(f"speculation:{room_id}")
 
 
 class AIInterventionService:
@@ -30,34 +54,146 @@ class AIInterventionService:
         # Simple timer tracking
         self.pending_timers: Dict[str, threading.Timer] = {}  # room_id -> threading.Timer
         
-        # Progress tracking - single 30s timer per room
-        self.progress_timers: Dict[str, threading.Timer] = {}  # room_id -> threading.Timer
+        # Progress tracking - due checks of all rooms, swept by one scheduler thread
+        self.progress_sweep = ProgressSweep(self._run_progress_check, lambda room_id: self.get_conversation_history_callback().get(room_id))
+        self._timer_lock = threading.Lock()  # guards the timer dicts (socket handlers and timer threads race)
+
+        # Cancellation token of each room's latest fired intervention (LLM call, then audio streaming)
+        self.in_flight: Dict[str, CancellationToken] = {}
+
+        # Last editor activity per room (monotonic); an idle timer that sees activity after it was
+        # scheduled stands down, so keystroke-driven cancels can be coalesced
+        self.last_activity: Dict[str, float] = {}
         
-        # Intervention configuration settings
-        self.intervention_settings = {
-            'idle_intervention_enabled': True,  # idle intervention
-            'idle_intervention_delay': 5,       # seconds to wait before idle intervention
-            'progress_check_enabled': False,     # progress check
-            'progress_check_interval': 45       # seconds between progress checks
-        }
+        # Intervention configuration: global defaults, cohort and room profiles (read via settings_for)
+        self.settings = SettingsRegistry(default_settings_from_env())
         
         # Timing parameters
         self.response_cooldown = 20  # Minimum seconds between AI responses
         self.min_messages_before_response = 3  # Wait for at least 3 messages before responding
 
+    def _release_timer(self, timers: Dict[str, threading.Timer], room_id: str, timer: threading.Timer):
+        """Drop a fired timer's reference unless it has already been replaced by a newer one"""
+        with self._timer_lock:
+            if timers.get(room_id) is timer:
+                del timers[room_id]
+
     def _cancel_pending_intervention(self, room_id: str, reason: str):
         """Cancel any pending timer for a room"""
-        if room_id in self.pending_timers:
-            timer = self.pending_timers[room_id]
+        with self._timer_lock:
+            timer = self.pending_timers.pop(room_id, None)
+        if timer:
             timer.cancel()
-            del self.pending_timers[room_id]
-            print(f"🚫 CANCELLED timer ({reason}) in room {room_id}")
+            self._discard_speculation(timer)
+            get_tracer().finish_span(getattr(timer, 'trace_span', None), cancelled=reason)
+            log.debug("🚫 Cancelled timer (%s) in room %s", reason, room_id)
+
+    def _start_speculation(self, room_id: str, delay: float) -> Optional[SpeculativeDecision]:
+        """Run the idle decision in the background so its result is ready when the timer fires"""
+        context = self.get_conversation_history_callback().get(room_id)
+        if not context or self._blocked_reason(room_id, context, ahead=delay):
+            return None
+        with context.lock:
+            speculation = SpeculativeDecision(room_id, context.state_version)
+
+        def run():
+            try:
+                with cancellation_scope(speculation.token), \
+                        get_tracer().span("speculative_decision", room=room_id, state_version=speculation.state_version):
+                    speculation.result = self.ai_decision_callback(room_id)
+            except Exception as e:
+                log.error("❌ Speculative decision failed for room %s: %s", room_id, e)
+            finally:
+                speculation.done.set()
+
+        threading.Thread(target=propagate(run), daemon=True, name=f"speculate-{room_id}").start()
+        return speculation
+
+    def _discard_speculation(self, timer: threading.Timer):
+        """Drop the result of a cancelled timer's speculative decision"""
+        speculation = getattr(timer, 'speculation', None)
+        if speculation and not speculation.discarded:
+            speculation.discarded = True
+            speculation.token.cancel("timer cancelled")
+            SPECULATIVE_DECISIONS.inc(outcome='discarded')
+
+    def _take_speculation(self, speculation: Optional[SpeculativeDecision], context: ConversationContext) -> Optional[Tuple[bool, str]]:
+        """Speculative result if it was computed from the room's current state, else None"""
+        if not speculation or speculation.discarded:
+            return None
+        if not speculation.done.wait(SPECULATION_WAIT_SECONDS):
+            # Hung call: abandon it and fall through to a fresh decision
+            speculation.discarded = True
+            speculation.token.cancel("speculation timed out")
+            SPECULATIVE_DECISIONS.inc(outcome='failed')
+            log.warning("⏳ Speculative decision for room %s timed out after %ss", context.room_id, SPECULATION_WAIT_SECONDS)
+            return None
+        with context.lock:
+            current = context.state_version
+        if speculation.token.cancelled:
+            SPECULATIVE_DECISIONS.inc(outcome='discarded')
+            return None
+        if speculation.result is None:
+            SPECULATIVE_DECISIONS.inc(outcome='failed')
+            return None
+        if current != speculation.state_version:
+            SPECULATIVE_DECISIONS.inc(outcome='stale')
+            log.debug("🔄 Speculative decision for room %s is stale (version %d -> %d)", context.room_id, speculation.state_version, current)
+            return None
+        SPECULATIVE_DECISIONS.inc(outcome='used')
+        return speculation.result
+
+    def _start_in_flight(self, room_id: str, speculation: Optional[SpeculativeDecision]) -> CancellationToken:
+        """Token for an intervention whose timer just fired (replaces the room's previous one)"""
+        token = CancellationToken(f"idle:{room_id}")
+        token.begin_work()  # ended by the timer callback; audio threads add their own
+        token.add_finished_callback(lambda: self._release_in_flight(room_id, token))
+        if speculation:
+            # Aborting the intervention also aborts the speculative call it may be waiting for
+            token.add_callback(lambda: speculation.token.cancel(token.reason))
+        with self._timer_lock:
+            self.in_flight[room_id] = token
+        return token
+
+    def _release_in_flight(self, room_id: str, token: CancellationToken):
+        """Forget a finished intervention's token unless a newer intervention replaced it"""
+        with self._timer_lock:
+            if self.in_flight.get(room_id) is token:
+                del self.in_flight[room_id]
+
+    def cancel_in_flight(self, room_id: str, reason: str) -> bool:
+        """Abort the room's running intervention (LLM call or audio); False if none was running"""
+        with self._timer_lock:
+            token = self.in_flight.get(room_id)
+        if token and token.cancel(reason):
+            log.info("🛑 Cancelled in-flight intervention (%s) in room %s", reason, room_id)
+            return True
+        return False
+
+    def note_activity(self, room_id: str, now: float = None):
+        """Record user activity in a room (O(1), no locking)"""
+        self.last_activity[room_id] = now if now is not None else time.monotonic()
+
+    def _consume_pending_message(self, room_id: str) -> Optional[str]:
+        """Take the intervention text stored by should_respond"""
+        context = self.get_conversation_history_callback().get(room_id)
+        if not context:
+            return None
+        with context.lock:
+            message = context.pending_intervention_message
+            context.pending_intervention_message = None
+        return message
     
+    def settings_for(self, room_id: str) -> InterventionSettings:
+        """Immutable intervention settings in effect for a room"""
+        return self.settings.for_room(room_id)
+
     def _schedule_idle_intervention(self, room_id: str):
         """Schedule a 5-second idle intervention timer using threading.Timer"""
+        settings = self.settings_for(room_id)
         # Check if idle intervention is disabled
-        if not self.intervention_settings.get('idle_intervention_enabled', True):
-            print(f"🚫 Idle intervention disabled for room {room_id}")
+        if not settings.idle_intervention_enabled:
+            log.debug("🚫 Idle intervention disabled for room %s", room_id)
             return
             
         # Cancel existing timer
@@ -66,36 +202,69 @@ class AIInterventionService:
         def timer_callback():
             """Handle timer completion after configured delay"""
             try:
-                delay = self.intervention_settings.get('idle_intervention_delay', 5)
-                print(f"⏰ {delay}-second timer completed for room {room_id}")
+                log.debug("⏰ %s-second timer completed for room %s", delay, room_id)
+                get_tracer().finish_span(timer.trace_span)
                 
                 # Clean up timer reference
-                self.pending_timers.pop(room_id, None)
+                self._release_timer(self.pending_timers, room_id, timer)
+
+                # Users were active after the timer started (coalesced cancel not yet applied)
+                if self.last_activity.get(room_id, 0) > timer.scheduled_at:
+                    self._discard_speculation(timer)
+                    log.debug("⌨️  Idle timer for room %s skipped: activity since it was scheduled", room_id)
+                    return
                 
                 # Get conversation history through callback
                 conversation_history = self.get_conversation_history_callback()
                 
-                # Check if we should respond
-                if self.should_respond(room_id, conversation_history):
-                    print(f"🤖 AI will respond after {delay}-second idle period in room {room_id}")
-                    response = self._generate_response_sync(room_id)
-                    if response:
-                        self.send_message_callback(room_id, response)
-                else:
-                    print(f"🚫 No intervention needed after {delay}-second idle period for room {room_id}")
+                # Everything below (LLM call, audio thread) can be aborted by voice or typing activity
+                token = self._start_in_flight(room_id, timer.speculation)
+                try:
+                    with cancellation_scope(token):
+                        # Check if we should respond
+                        with get_tracer().span("should_respond", room=room_id) as span:
+                            respond = self.should_respond(room_id, conversation_history, timer.speculation)
+                            if span is not None:
+                                span.set(decision=respond, speculative=timer.speculation is not None)
+                        if token.cancelled:
+                            if respond:
+                                CANCELLED_CALLS.inc(kind='llm', stage='completed')
+                                self._consume_pending_message(room_id)
+                            log.info("🛑 Intervention cancelled (%s) in room %s", token.reason, room_id)
+                        elif respond:
+                            print(f"🤖 AI will respond after {delay}-second idle period in room {room_id}")
+                            # should_respond already produced the message - only ask again if it was consumed elsewhere
+                            response = self._consume_pending_message(room_id) or self._generate_response_sync(room_id)
+                            if response:
+                                self.send_message_callback(room_id, response)
+                        else:
+                            print(f"🚫 No intervention needed after {delay}-second idle period for room {room_id}")
+                finally:
+                    token.end_work()
                         
             except Exception as e:
-                print(f"❌ Timer callback error for room {room_id}: {e}")
+                log.exception("❌ Timer callback error for room %s: %s", room_id, e)
         
         # Create and start timer with configurable delay
-        delay = self.intervention_settings.get('idle_intervention_delay', 5)
-        timer = threading.Timer(float(delay), timer_callback)
+        delay = settings.idle_intervention_delay
+        timer = threading.Timer(float(delay), propagate(timer_callback))
         timer.daemon = True
-        timer.start()
+        timer.trace_span = get_tracer().open_span("idle_wait", delay=float(delay))
+        timer.scheduled_at = time.monotonic()
+        timer.speculation = None
+        if settings.speculative_intervention_enabled:
+            timer.speculation = self._start_speculation(room_id, float(delay))
         
-        # Store timer reference
-        self.pending_timers[room_id] = timer
-        print(f"⏱️ Started {delay}-second timer for room {room_id}")
+        # Store timer reference (replacing one scheduled concurrently) before it can fire
+        with self._timer_lock:
+            previous = self.pending_timers.pop(room_id, None)
+            self.pending_timers[room_id] = timer
+        if previous:
+            previous.cancel()
+            self._discard_speculation(previous)
+            get_tracer().finish_span(getattr(previous, 'trace_span', None), cancelled="replaced")
+        timer.start()
+        log.debug("⏱️ Started %s-second timer for room %s", delay, room_id)
 
     def _schedule_reflection_response(self, room_id: str):
         """Schedule a reflection response after 5 seconds"""
@@ -103,8 +272,9 @@ class AIInterventionService:
         self._cancel_pending_intervention(room_id, "new reflection message")
         
         # Start new 5-second timer for reflection
-        timer = threading.Timer(5.0, self._send_reflection_response, args=[room_id])
-        self.pending_timers[room_id] = timer
+        timer = threading.Timer(5.0, propagate(self._send_reflection_response), args=[room_id])
+        with self._timer_lock:
+            self.pending_timers[room_id] = timer
         timer.start()
         print(f"🎓 Scheduled reflection response in 5 seconds for room {room_id}")
 
@@ -124,8 +294,8 @@ class AIInterventionService:
                 print(f"❌ Failed to generate reflection response for room {room_id}")
             
             # Clean up timer
-            if room_id in self.pending_timers:
-                del self.pending_timers[room_id]
+            with self._timer_lock:
+                self.pending_timers.pop(room_id, None)
                 
         except Exception as e:
             print(f"❌ Error sending reflection response: {e}")
@@ -143,51 +313,64 @@ class AIInterventionService:
             print(f"❌ Error in response generation: {e}")
             return None
 
-    def should_respond(self, room_id: str, conversation_history: Dict[str, ConversationContext]) -> bool:
-        """Simple decision making for AI intervention after 5-second idle"""
+    def _blocked_reason(self, room_id: str, context: ConversationContext, ahead: float = 0) -> Optional[str]:
+        """Why the AI may not respond `ahead` seconds from now without asking the LLM (None if it may)"""
         # Check if room is in reflection mode - if so, skip normal AI responses
         try:
             from .ai_reflection import get_reflection_service
             reflection_service = get_reflection_service()
             if reflection_service and reflection_service.is_room_in_reflection(room_id):
-                print(f"🎓 AI WILL NOT RESPOND: Room {room_id} is in reflection mode")
-                return False
+                return f"🎓 AI WILL NOT RESPOND: Room {room_id} is in reflection mode"
         except:
             pass  # Continue if reflection service not available
-            
+
+        # Check cooldown period
+        if context.last_ai_response:
+            time_since_last = datetime.now() + timedelta(seconds=ahead) - context.last_ai_response
+            if time_since_last.total_seconds() < self.response_cooldown:
+                return f"🚫 AI WILL NOT RESPOND: Cooldown period ({time_since_last.total_seconds():.1f}s < {self.response_cooldown}s)"
+        return None
+
+    def should_respond(self, room_id: str, conversation_history: Dict[str, ConversationContext],
+                       speculation: Optional[SpeculativeDecision] = None) -> bool:
+        """Simple decision making for AI intervention after 5-second idle"""
         if room_id not in conversation_history:
             print(f"🚫 AI WILL NOT RESPOND: No conversation history for room {room_id}")
             return False
             
         context = conversation_history[room_id]
+        if is_cancelled():
+            return False
 
-        # Check cooldown period
-        if context.last_ai_response:
-            time_since_last = datetime.now() - context.last_ai_response
-            if time_since_last.total_seconds() < self.response_cooldown:
-                print(f"🚫 AI WILL NOT RESPOND: Cooldown period ({time_since_last.total_seconds():.1f}s < {self.response_cooldown}s)")
-                return False
+        blocked = self._blocked_reason(room_id, context)
+        if blocked:
+            print(blocked)
+            return False
                 
         # # Need minimum number of messages
         # if len(context.messages) < self.min_messages_before_response:
         #     print(f"🚫 AI WILL NOT RESPOND: Not enough messages ({len(context.messages)} < {self.min_messages_before_response})")
         #     return False
         
-        # Simple AI decision using centralized LLM
-        should_intervene, intervention_message = self.ai_decision_callback(room_id)
+        # Simple AI decision using centralized LLM (reusing the speculative one if the room is unchanged)
+        decision = self._take_speculation(speculation, context)
+        should_intervene, intervention_message = decision or self.ai_decision_callback(room_id)
         
         if should_intervene:
             print(f"✅ AI WILL RESPOND: Intervention decision made for room {room_id}")
             # Store the intervention message for generate_response to use
-            context.pending_intervention_message = intervention_message
+            with context.lock:
+                context.pending_intervention_message = intervention_message
         else:
             print(f"🚫 AI WILL NOT RESPOND: AI decided not to intervene for room {room_id}")
         
         return should_intervene
 
-    def cancel_intervention(self, room_id: str, reason: str):
-        """Public method to cancel pending interventions"""
+    def cancel_intervention(self, room_id: str, reason: str, in_flight: bool = False):
+        """Public method to cancel pending interventions (and, with in_flight, one already running)"""
         self._cancel_pending_intervention(room_id, reason)
+        if in_flight:
+            self.cancel_in_flight(room_id, reason)
 
     def schedule_idle_intervention(self, room_id: str):
         """Public method to schedule idle intervention"""
@@ -205,97 +388,110 @@ class AIInterventionService:
         """Clean up all timers for a room"""
         self._cancel_pending_intervention(room_id, "room cleanup")
         self._cancel_progress_timer(room_id, "room cleanup")
+        self.progress_sweep.forget(room_id)
+        self.cancel_in_flight(room_id, "room cleanup")
+        with self._timer_lock:
+            self.in_flight.pop(room_id, None)
+        self.last_activity.pop(room_id, None)
     
     # Progress tracking methods
     def trigger_progress_check(self, room_id: str):
-        """Trigger (45)-second progress check timer on new message"""
+        """Schedule the room's (45)-second progress check on new message"""
+        settings = self.settings_for(room_id)
         # Check if progress check is disabled
-        if not self.intervention_settings.get('progress_check_enabled', True):
-            print(f"🚫 Progress check disabled for room {room_id}")
+        if not settings.progress_check_enabled:
+            log.debug("🚫 Progress check disabled for room %s", room_id)
             return
             
-        # If already running, don't create new timer
-        if room_id in self.progress_timers:
-            print(f"📊 Progress timer already running for room {room_id}, keeping existing")
-            return
+        interval = settings.progress_check_interval
+        # If already scheduled, keep the existing due time
+        if self.progress_sweep.schedule(room_id, float(interval)):
+            log.debug("📊 Progress check for room %s due in %s seconds", room_id, interval)
+        else:
+            log.debug("📊 Progress check already scheduled for room %s, keeping existing", room_id)
+
+    def _run_progress_check(self, room_id: str):
+        """Handle a due progress check (called by the progress sweep's workers)"""
+        try:
+            print(f"📊 Progress check triggered for room {room_id}")
             
-        interval = self.intervention_settings.get('progress_check_interval', 45)
-        print(f"📊 Starting {interval}-second progress check timer for room {room_id}")
-        
-        def progress_check_callback():
-            """Handle progress check"""
-            try:
-                print(f"📊 {interval}-second progress check triggered for room {room_id}")
-                
-                # Clean up timer reference
-                self.progress_timers.pop(room_id, None)
-                
-                # Get conversation history
-                conversation_history = self.get_conversation_history_callback()
-                context = conversation_history.get(room_id)
-                
-                if not context or len(context.messages) < 3:
-                    print(f"📊 Progress check skipped for room {room_id}: Not enough activity")
-                    return
-                
-                # Use specialized AI decision for progress tracking
-                should_intervene, message = self.ai_decision_callback(room_id, is_progress_check=True)
+            # Get conversation history
+            conversation_history = self.get_conversation_history_callback()
+            context = conversation_history.get(room_id)
+            
+            if not context or len(context.messages) < 3:
+                print(f"📊 Progress check skipped for room {room_id}: Not enough activity")
+                return
+            
+            # Use specialized AI decision for progress tracking
+            should_intervene, message = self.ai_decision_callback(room_id, is_progress_check=True)
+            
+            if should_intervene and message:
+                print(f"📊 Progress intervention needed for room {room_id}: {message[:50]}...")
+                # Use the progress notification callback instead of regular message callback
+                self.send_progress_notification_callback(room_id, message)
+            else:
+                print(f"📊 Progress check: Users on track in room {room_id}")
                 
-                if should_intervene and message:
-                    print(f"📊 Progress intervention needed for room {room_id}: {message[:50]}...")
-                    # Use the progress notification callback instead of regular message callback
-                    self.send_progress_notification_callback(room_id, message)
-                else:
-                    print(f"📊 Progress check: Users on track in room {room_id}")
-                    
-            except Exception as e:
-                print(f"❌ Error in progress check for room {room_id}: {e}")
-        
-        # Create and start timer with configurable interval
-        timer = threading.Timer(float(interval), progress_check_callback)
-        timer.daemon = True
-        timer.start()
-        
-        # Store timer reference
-        self.progress_timers[room_id] = timer
+        except Exception as e:
+            print(f"❌ Error in progress check for room {room_id}: {e}")
     
     def _cancel_progress_timer(self, room_id: str, reason: str):
-        """Cancel any pending progress timer for a room"""
-        if room_id in self.progress_timers:
-            timer = self.progress_timers[room_id]
-            timer.cancel()
-            del self.progress_timers[room_id]
-            print(f"🚫 CANCELLED progress timer ({reason}) in room {room_id}")
+        """Cancel any scheduled progress check for a room"""
+        if self.progress_sweep.cancel(room_id):
+            log.debug("🚫 Cancelled progress check (%s) in room %s", reason, room_id)
     
     def cancel_progress_check(self, room_id: str, reason: str):
         """Public method to cancel progress check""" 
         self._cancel_progress_timer(room_id, reason)
     
     def has_progress_timer(self, room_id: str) -> bool:
-        """Check if room has a pending progress timer"""
-        return room_id in self.progress_timers
+        """Check if room has a scheduled progress check"""
+        return self.progress_sweep.is_scheduled(room_id)
     
     def get_active_progress_rooms(self):
-        """Get list of rooms with active progress timers"""
-        return list(self.progress_timers.keys())
+        """Get list of rooms with scheduled progress checks"""
+        return self.progress_sweep.scheduled_rooms()
 
-    def update_intervention_settings(self, settings: Dict[str, bool]):
-        """Update intervention configuration settings"""
+    def update_intervention_settings(self, settings: Mapping[str, Any], room_id: str = None, cohort: str = None) -> int:
+        """Update the defaults, a cohort profile or a room profile; returns the new settings version"""
+        if room_id:
+            version = self._apply_settings_change(lambda: self.settings.update_room(room_id, settings), rooms=[room_id])
+        elif cohort:
+            version = self._apply_settings_change(lambda: self.settings.update_cohort(cohort, settings), cohort=cohort)
+        else:
+            version = self._apply_settings_change(lambda: self.settings.update_defaults(settings))
+        scope = f"room {room_id}" if room_id else f"cohort {cohort}" if cohort else "defaults"
         for key, value in settings.items():
-            if key in self.intervention_settings:
-                self.intervention_settings[key] = value
-                print(f"🔧 Updated intervention setting: {key} = {value}")
-        
-        # If idle intervention is disabled, cancel all pending timers
-        if not self.intervention_settings.get('idle_intervention_enabled', True):
-            for room_id in list(self.pending_timers.keys()):
-                self._cancel_pending_intervention(room_id, "idle intervention disabled")
-        
-        # If progress check is disabled, cancel all progress timers
-        if not self.intervention_settings.get('progress_check_enabled', True):
-            for room_id in list(self.progress_timers.keys()):
-                self._cancel_progress_timer(room_id, "progress check disabled")
-    
-    def get_intervention_settings(self) -> Dict[str, bool]:
-        """Get current intervention configuration settings"""
-        return self.intervention_settings.copy()
+            print(f"🔧 Updated intervention setting ({scope}): {key} = {value}")
+        return version
+
+    def reset_room_settings(self, room_id: str) -> int:
+        """Drop a room's own profile"""
+        return self._apply_settings_change(lambda: self.settings.reset_room(room_id), rooms=[room_id])
+
+    def assign_cohort(self, room_ids, cohort: Optional[str]) -> int:
+        """Move rooms into a cohort (None: out of their cohort)"""
+        room_ids = list(room_ids)
+        return self._apply_settings_change(lambda: self.settings.assign_cohort(room_ids, cohort), rooms=room_ids)
+
+    def _apply_settings_change(self, change, rooms=None, cohort: str = None) -> int:
+        """Run a registry change, then cancel timers only in reached rooms whose feature it disabled"""
+        with self._timer_lock:
+            idle_rooms = self.settings.rooms_in_scope(list(self.pending_timers), rooms, cohort)
+            progress_rooms = self.settings.rooms_in_scope(self.progress_sweep.scheduled_rooms(), rooms, cohort)
+        before = {room: self.settings_for(room) for room in idle_rooms | progress_rooms}
+
+        version = change()
+
+        for room in idle_rooms:
+            if before[room].idle_intervention_enabled and not self.settings_for(room).idle_intervention_enabled:
+                self._cancel_pending_intervention(room, "idle intervention disabled")
+        for room in progress_rooms:
+            if before[room].progress_check_enabled and not self.settings_for(room).progress_check_enabled:
+                self._cancel_progress_timer(room, "progress check disabled")
+        return version
+
+    def get_intervention_settings(self, room_id: str = None) -> Dict[str, Any]:
+        """Settings in effect for a room (the global defaults without one)"""
+        return (self.settings_for(room_id) if room_id else self.settings.defaults).to_dict()
@@ -1,51 +1,207 @@
 """
 AI Agent Models - Data classes and models for the AI agent system
+
+Models are slotted to avoid a per-instance __dict__, repeated ids (user, room, username)
+are interned so all messages share one string object, timestamps are epoch floats, and
+message histories are fixed-capacity ring buffers.
+
+Thread-safety model: each ConversationContext owns a reentrant lock. Socket handlers, timer
+threads and background savers hold it while mutating the context, and LLM prompts are built
+from an immutable ContextSnapshot taken under the lock so no lock is held during API calls.
 """
 
-from dataclasses import dataclass, field
-from datetime import datetime
-from typing import List, Optional
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields, asdict, replace
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Deque, List, Optional, Tuple, Union
+
+# Ring buffer capacities for per-room history
+MAX_CONTEXT_MESSAGES = 10
+MAX_AI_MESSAGE_HISTORY = 10
+
+
+def intern_id(value: Optional[str]) -> Optional[str]:
+    """Intern short repeated identifiers (user ids, room ids, usernames)"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def to_epoch(timestamp: Union[str, float, int, datetime, None]) -> float:
+    """Normalize ISO strings, datetimes and numbers to epoch seconds (now if missing or invalid)"""
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        return float(timestamp)
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    if isinstance(timestamp, str) and timestamp:
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
 
+def recent(items, count: int) -> list:
+    """Last `count` items of a list or deque without slicing support"""
+    return list(islice(items, max(len(items) - count, 0), None))
 
-@dataclass
+
+@dataclass(slots=True)
 class Message:
     id: str
     content: str
     username: str
     userId: str
-    timestamp: str
+    timestamp: float  # epoch seconds (ISO strings and datetimes are converted)
     room: str
     isAutoGenerated: bool = False
     ai_trigger_type: Optional[str] = None  # 'direct_mention', 'idle_5s', 'progress_check', 'reflection', etc.
     is_reflection: bool = False
 
+    def __post_init__(self):
+        self.username = intern_id(self.username)
+        self.userId = intern_id(self.userId)
+        self.room = intern_id(self.room)
+        self.ai_trigger_type = intern_id(self.ai_trigger_type)
+        self.timestamp = to_epoch(self.timestamp)
+
+    @property
+    def iso_timestamp(self) -> str:
+        """Timestamp as an ISO 8601 UTC string"""
+        return datetime.fromtimestamp(self.timestamp, tz=timezone.utc).isoformat()
+
+
+@dataclass(frozen=True, slots=True)
+class ContextSnapshot:
+    """Immutable point-in-time copy of a room's context, safe to read without the room lock"""
+    room_id: str
+    messages: Tuple[Message, ...]
+    ai_message_history: Tuple[str, ...]
+    code_context: str
+    programming_language: str
+    problem_description: str
+    problem_title: str
+    last_ai_response: Optional[datetime]
+    last_message_time: Optional[datetime]
+    last_execution_code: str
+    last_execution_output: str
+    last_execution_error: str
+    last_execution_success: bool
+    last_execution_time: Optional[datetime]
+    state_version: int = 0
+    cursor_offsets: Tuple[int, ...] = ()
+    summary: str = ""
+    code_revision: int = 0
+
+    def recent_messages(self, count: int) -> List[Message]:
+        """The last `count` messages, oldest first"""
+        return list(self.messages[-count:]) if count > 0 else []
 
-@dataclass
+
+@dataclass(slots=True)
 class ConversationContext:
-    messages: List[Message]
+    messages: Deque[Message]  # lists are converted to a ring buffer of MAX_CONTEXT_MESSAGES
     room_id: str
     last_ai_response: Optional[datetime] = None
     code_context: str = ""
     programming_language: str = "python"
     problem_description: str = ""
     problem_title: str = ""
-    
+
     # Session and message tracking
     session_id: str = ""  # Unique session identifier
     message_counter: int = 0  # Sequential message counter for this session
-    
+
     # Execution results tracking
     last_execution_code: str = ""
     last_execution_output: str = ""
     last_execution_error: str = ""
     last_execution_success: bool = True
     last_execution_time: Optional[datetime] = None
-    
+
     # Simple timestamp tracking
     last_message_time: Optional[datetime] = None  # When the last message was received
-    
+
     # Planning check tracking - only run once per session
     planning_check_done: bool = False
-    
-    # AI message tracking for progressive hints (last 10 AI messages)
-    ai_message_history: List[str] = field(default_factory=list)
+
+    # AI message tracking for progressive hints (last MAX_AI_MESSAGE_HISTORY AI messages)
+    ai_message_history: Deque[str] = field(default_factory=lambda: deque(maxlen=MAX_AI_MESSAGE_HISTORY))
+
+    # Intervention text decided by the idle timer, consumed by the next generate_response
+    pending_intervention_message: Optional[str] = None
+
+    # Incremented on every change that affects AI prompts (messages, code, problem, execution, AI history)
+    state_version: int = 0
+
+    # Editor revisions ingested into code_context
+    code_revision: int = 0
+
+    # Latest editor cursor positions and edit locations (character offsets, newest last) - the focus of code in prompts
+    cursor_offsets: List[int] = field(default_factory=list)
+
+    # Rolling summary of messages that left the window, and those not yet folded into it
+    summary: str = ""
+    summary_backlog: List[Message] = field(default_factory=list)
+
+    # Serializes mutations of this room's state across socket, timer and saver threads
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.room_id = intern_id(self.room_id)
+        if not isinstance(self.messages, deque) or self.messages.maxlen != MAX_CONTEXT_MESSAGES:
+            self.messages = deque(self.messages, maxlen=MAX_CONTEXT_MESSAGES)
+        if not isinstance(self.ai_message_history, deque) or self.ai_message_history.maxlen != MAX_AI_MESSAGE_HISTORY:
+            self.ai_message_history = deque(self.ai_message_history, maxlen=MAX_AI_MESSAGE_HISTORY)
+
+    def recent_messages(self, count: int) -> List[Message]:
+        """The last `count` messages, oldest first"""
+        return recent(self.messages, count)
+
+    def bump_version(self):
+        """Mark the room state as changed (call with the lock held)"""
+        self.state_version += 1
+
+    def snapshot(self) -> ContextSnapshot:
+        """Immutable copy for building LLM prompts outside the lock"""
+        with self.lock:
+            return ContextSnapshot(
+                room_id=self.room_id,
+                messages=tuple(replace(message) for message in self.messages),
+                ai_message_history=tuple(self.ai_message_history),
+                code_context=self.code_context,
+                programming_language=self.programming_language,
+                problem_description=self.problem_description,
+                problem_title=self.problem_title,
+                last_ai_response=self.last_ai_response,
+                last_message_time=self.last_message_time,
+                last_execution_code=self.last_execution_code,
+                last_execution_output=self.last_execution_output,
+                last_execution_error=self.last_execution_error,
+                last_execution_success=self.last_execution_success,
+                last_execution_time=self.last_execution_time,
+                state_version=self.state_version,
+                cursor_offsets=tuple(self.cursor_offsets),
+                summary=self.summary,
+                code_revision=self.code_revision
+            )
+
+    def to_dict(self) -> dict:
+        """Serialize for spilling an evicted room to the database"""
+        with self.lock:
+            data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'lock'}
+            data['messages'] = [asdict(message) for message in self.messages]
+            data['summary_backlog'] = [asdict(message) for message in self.summary_backlog]
+            data['ai_message_history'] = list(self.ai_message_history)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ConversationContext':
+        """Rebuild a context spilled with to_dict (unknown keys are ignored)"""
+        known = {f.name for f in fields(cls)} - {'lock'}
+        values = {key: value for key, value in data.items() if key in known}
+        values['messages'] = [Message(**message) for message in values.get('messages', [])]
+        values['summary_backlog'] = [Message(**message) for message in values.get('summary_backlog', [])]
+        return cls(**values)
@@ -3,17 +3,20 @@ Reflection Service - LLM-powered interactive learning reflection
 Combines AI agent reflection and dedicated reflection session logic
 """
 
-import os
 import json
 import re
 import time
 import base64
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
 from dataclasses import dataclass
 
-from .ai_models import ConversationContext
+from .ai_models import ContextSnapshot
+from .code_context import code_for_prompt
+from .conversation_memory import prompt_memory
+from .llm_provider import create_openai_client
+from .metrics import chat_completion, TTS_FIRST_CHUNK_SECONDS, TTS_BYTES, TTS_STREAMS
+from .room_lifecycle import RoomStateStore, room_state_limits
 
 @dataclass
 class ReflectionSession:
@@ -37,22 +40,21 @@ class ReflectionSession:
 class ReflectionService:
     def __init__(self, socketio_instance=None):
         # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("⚠️  Warning: No OpenAI API key found. Reflection will be disabled.")
-            self.client = None
-        else:
-            try:
-                self.client = OpenAI(api_key=api_key)
-                print("✅ Reflection Service initialized successfully!")
-            except Exception as e:
-                print(f"❌ Error initializing OpenAI client: {e}")
-                self.client = None
+        self.client = create_openai_client("Reflection")
+        if self.client:
+            print("✅ Reflection Service initialized successfully!")
         
         self.socketio = socketio_instance
-        self.active_sessions = {}  # session_id -> ReflectionSession
+        self.active_sessions = RoomStateStore(  # session_id -> ReflectionSession
+            'reflection_sessions', room_of=lambda session_id, session: session.room_id,
+            on_evict=self._on_session_evicted, **room_state_limits()
+        )
         self.pending_timers = {}   # room_id -> threading.Timer (like AI agent)
         
+    def _on_session_evicted(self, session_id: str, session: ReflectionSession, reason: str):
+        """Stop any pending reflection timer for an evicted session's room"""
+        self._cancel_pending_timer(session.room_id, f"session evicted ({reason})")
+
     def start_reflection_session(self, room_id: str, final_code: str, language: str, 
                                problem_description: str, chat_history: List[Dict]) -> str:
         """Start a new reflection session"""
@@ -133,9 +135,10 @@ class ReflectionService:
             context = conversation_history.get(room_id)
             if not context:
                 return "What did you learn today?"
+            context = context.snapshot()  # read-only copy, no room lock held during the LLM call
             
-            # Get current code from context
-            current_code = context.code_context
+            # Get current code from context (the part relevant to the cursor and recent conversation)
+            current_code = code_for_prompt(context, context.recent_messages(5))
             language = context.programming_language
             
             print(f"🎓 DEBUG: Reflection prompt code context: '{current_code[:100] if current_code else 'EMPTY'}'")
@@ -146,7 +149,8 @@ class ReflectionService:
             print(f"🎓 Reflection prompt: {reflection_prompt}")
             
             # Generate response using OpenAI
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'reflection', room_id,
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "You are a supportive programming tutor. Keep responses very short (1-2 sentences max). Ask simple, focused questions to help students reflect."},
@@ -162,9 +166,10 @@ class ReflectionService:
             print(f"❌ Error generating reflection response: {e}")
             return "What was the trickiest part?"
 
-    def _create_reflection_prompt(self, context: ConversationContext, current_code: str, language: str) -> str:
+    def _create_reflection_prompt(self, context: ContextSnapshot, current_code: str, language: str) -> str:
         """Create a reflection-specific prompt"""
-        recent_messages = context.messages[-5:] if context.messages else []
+        memory = prompt_memory(context, turns=5)
+        recent_messages = memory.messages
         print(f"🎓 DEBUG: Recent messages for reflection: {recent_messages}")
         
         # Build conversation including both user and AI messages, but exclude system messages
@@ -173,7 +178,7 @@ class ReflectionService:
             if not msg.content.startswith("🎓"):  # Skip system reflection messages
                 conversation_lines.append(f"{msg.username}: {msg.content}")
         
-        conversation = "\n".join(conversation_lines)
+        conversation = memory.summary_block() + "\n".join(conversation_lines)
         
         # Include problem context if available
         problem_section = ""
@@ -234,6 +239,7 @@ class ReflectionService:
             
             # Generate TTS audio
             print(f"🎓 Calling OpenAI TTS API...")
+            tts_started = time.perf_counter()
             response = self.client.audio.speech.create(
                 model="tts-1",
                 voice="echo",  # Same voice as regular AI agent
@@ -244,6 +250,9 @@ class ReflectionService:
             
             # Get audio data
             audio_data = response.content
+            TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - tts_started, format='mp3')
+            TTS_BYTES.inc(len(audio_data), format='mp3')
+            TTS_STREAMS.inc(format='mp3', outcome='ok')
             print(f"🎓 Received audio data: {len(audio_data)} bytes")
             
             # Send audio using the same streaming pattern as AI agent
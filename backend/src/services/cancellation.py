@@ -0,0 +1,173 @@
+"""
+Cancellation - Tokens that abort an intervention's in-flight LLM and TTS work
+
+An intervention runs under a CancellationToken (cancellation_scope). The token follows the work
+through contextvars, including into threads started with tracing.propagate, so chat_completion and
+the audio streamer can check it without it being passed through every call. Cancelling a token
+(voice activity, typing) wakes a waiting LLM call immediately and stops a TTS stream at the next
+chunk; work that was already paid for when it was dropped is counted in cancelled_calls_total.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+_current_token: ContextVar[Optional['CancellationToken']] = ContextVar('cancellation_token', default=None)
+
+
+class OperationCancelled(Exception):
+    """Raised when work is abandoned because its cancellation token was cancelled"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"cancelled: {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    """Thread-safe cancel flag with callbacks run once on cancellation"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._work = 0  # running pieces of the token's work (the intervention, audio threads)
+        self._finished_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str) -> bool:
+        """Cancel the token; False if it was already cancelled"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Run callback on cancellation (immediately if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def begin_work(self):
+        """Mark a piece of work running under the token (e.g. an audio stream on its own thread)"""
+        with self._lock:
+            self._work += 1
+
+    def end_work(self):
+        """Mark a piece of work done; the finished callbacks run once no work is left"""
+        with self._lock:
+            self._work -= 1
+            if self._work > 0:
+                return
+            callbacks, self._finished_callbacks = self._finished_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_finished_callback(self, callback: Callable[[], None]):
+        """Run callback when the token's last piece of work ends"""
+        with self._lock:
+            self._finished_callbacks.append(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    """Make token the current token for the enclosed work (and threads it propagates to)"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token of the intervention the caller is running for, if any"""
+    return _current_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+
+def cancellable_completion(client, token: CancellationToken, on_wasted: Callable[[str], None], **kwargs) -> ChatCompletion:
+    """
+    Chat completion that returns as soon as token is cancelled.
+    The request is streamed on a worker thread, which closes the stream at the next chunk after
+    cancellation so generation stops server-side. on_wasted(stage) is called when a request that
+    was already sent gets dropped ('in_flight' or 'completed').
+    """
+    token.raise_if_cancelled()
+    done = threading.Event()
+    outcome = {}
+
+    def worker():
+        try:
+            stream = client.chat.completions.create(stream=True, stream_options={'include_usage': True}, **kwargs)
+            parts, usage, finish_reason, first = [], None, None, None
+            try:
+                for chunk in stream:
+                    if token.cancelled:
+                        break
+                    first = first or chunk
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    for choice in chunk.choices:
+                        if choice.delta and choice.delta.content:
+                            parts.append(choice.delta.content)
+                        finish_reason = choice.finish_reason or finish_reason
+            finally:
+                stream.close()
+            outcome['response'] = ChatCompletion.model_construct(
+                id=getattr(first, 'id', ''), object='chat.completion', created=getattr(first, 'created', int(time.time())),
+                model=getattr(first, 'model', kwargs.get('model')), usage=usage,
+                choices=[Choice.model_construct(index=0, finish_reason=finish_reason or 'stop',
+                                                message=ChatCompletionMessage.model_construct(role='assistant', content=''.join(parts)))])
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    token.add_callback(done.set)
+    try:
+        threading.Thread(target=worker, daemon=True, name="llm-cancellable").start()
+        done.wait()
+    finally:
+        token.remove_callback(done.set)
+    if token.cancelled:
+        # Woken by the cancellation while the request was running, or it finished but is no longer wanted
+        on_wasted('completed' if outcome else 'in_flight')
+        token.raise_if_cancelled()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['response']
@@ -0,0 +1,294 @@
+"""
+Code Context - Relevance-windowed code for LLM prompts
+
+Prompts get the whole file only while it fits the token budget. Larger files are outlined into
+definition blocks (functions, classes, methods) by indentation, which works for Python and brace
+languages alike and tolerates code that does not parse mid-edit. The budget is then filled in
+order of relevance: the scopes enclosing the focus lines (cursor, recent edits), definitions those
+scopes reference or the conversation mentions, the signatures of everything else (a skeleton),
+module-level statements, and finally whole blocks nearest the focus. Omitted spans are replaced by
+a one-line marker so the model knows code exists there.
+"""
+
+import functools
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .metrics import CODE_CONTEXT_TOKENS
+
+CODE_CONTEXT_TOKEN_BUDGET = int(os.environ.get('CODE_CONTEXT_TOKEN_BUDGET', '1500'))
+CHARS_PER_TOKEN = 4          # rough estimate, good enough for budgeting
+FOCUS_WINDOW_LINES = 12      # lines kept around a focus line whose scope is too large (or module level)
+MAX_FOCUS_LINES = 4          # most recent cursor/edit positions considered
+MARKER_CHARS = 32            # budget charged for the omission marker under a signature kept without its body
+
+# def/class/function-style definitions (Python, JS/TS, Go, Rust, Swift, ...)
+_KEYWORD_DEFINITION = re.compile(
+    r'\s*(?:(?:export|default|public|private|protected|internal|static|async|abstract|final|pub)\s+)*'
+    r'(?:def|class|function|func|fn|struct|interface|enum|impl|trait)\s+(\w+)'
+)
+# C/C++/Java/C# style: return type(s) then name( - a declaration line, not a statement ending in ;
+_TYPED_DEFINITION = re.compile(r'\s*(?:[\w:<>\[\],*&]+\s+)+[*&]?(\w+)\s*\([^;]*$')
+_NOT_DEFINITIONS = frozenset({'if', 'for', 'while', 'switch', 'return', 'catch', 'else', 'new', 'sizeof', 'throw', 'case', 'do'})
+_IDENTIFIER = re.compile(r'[A-Za-z_]\w+')
+
+
+@dataclass(frozen=True, slots=True)
+class CodeBlock:
+    """A definition and its body as a line range [start, end)"""
+    name: str
+    start: int   # first line, decorators included
+    header: int  # signature line
+    end: int
+    indent: int
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def line_of_offset(code: str, offset: int) -> int:
+    """0-based line number of a character offset (as sent by the editor)"""
+    return code.count('\n', 0, max(0, min(offset, len(code))))
+
+
+def first_difference(old: str, new: str) -> Optional[int]:
+    """Offset of the first character where two revisions of a file differ (None if they are equal)"""
+    if old == new:
+        return None
+    # Binary search over prefix comparisons (C-speed slices instead of a per-character loop)
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _definition_name(line: str, python: bool) -> Optional[str]:
+    match = _KEYWORD_DEFINITION.match(line)
+    if match:
+        return match.group(1)
+    if not python:
+        match = _TYPED_DEFINITION.match(line)
+        if match and match.group(1) not in _NOT_DEFINITIONS and line.split()[0] not in _NOT_DEFINITIONS:
+            return match.group(1)
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class _Layout:
+    """Per-file data reused by every selection on the same code text"""
+    lines: Tuple[str, ...]
+    blocks: Tuple[CodeBlock, ...]
+    offsets: Tuple[int, ...]               # offsets[i] = characters before line i (newlines included)
+    blank: bytes                           # 1 for whitespace-only lines
+    module_runs: Tuple[Tuple[int, int], ...]  # non-blank line ranges outside top-level blocks
+
+
+@functools.lru_cache(maxsize=64)
+def _layout(code: str, language: str) -> _Layout:
+    lines = code.split('\n')
+    python = language.lower() == 'python'
+    blank = bytes(0 if line.strip() else 1 for line in lines)
+    blocks = []
+    for index, line in enumerate(lines):
+        if blank[index]:
+            continue
+        name = _definition_name(line, python)
+        if not name:
+            continue
+        indent = _indent(line)
+        start = index
+        while start > 0 and lines[start - 1].strip().startswith('@') and _indent(lines[start - 1]) == indent:
+            start -= 1
+        end = index + 1
+        while end < len(lines):
+            current = lines[end]
+            if not blank[end] and _indent(current) <= indent:
+                # A brace language closes the block at the definition's own indentation
+                if not python and current.lstrip().startswith('}'):
+                    end += 1
+                break
+            end += 1
+        # Trailing blank lines belong to whatever follows
+        while end > index + 1 and blank[end - 1]:
+            end -= 1
+        blocks.append(CodeBlock(name, start, index, end, indent))
+
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    module = bytearray(b'\x01') * len(lines)
+    for block in blocks:
+        if block.indent == 0:
+            module[block.start:block.end] = bytes(block.end - block.start)
+    runs, index = [], 0
+    while index < len(lines):
+        if module[index] and not blank[index]:
+            end = index
+            while end < len(lines) and module[end]:
+                end += 1
+            runs.append((index, end))
+            index = end
+        else:
+            index += 1
+    return _Layout(tuple(lines), tuple(blocks), tuple(offsets), blank, tuple(runs))
+
+
+def outline(code: str, language: str = 'python') -> Tuple[CodeBlock, ...]:
+    """Definition blocks of a file, in order of their first line (cached per code text)"""
+    return _layout(code, language).blocks
+
+
+class _Selection:
+    """Lines chosen so far against a character budget"""
+
+    def __init__(self, layout: _Layout, budget_tokens: int):
+        self.layout = layout
+        self.kept = bytearray(len(layout.lines))
+        self.remaining = budget_tokens * CHARS_PER_TOKEN
+
+    def take(self, start: int, end: int, extra: int = 0) -> bool:
+        """Keep lines [start, end) if they all fit the budget"""
+        start, end = max(0, start), min(len(self.kept), end)
+        kept, offsets = self.kept, self.layout.offsets
+        if kept.find(0, start, end) == -1:
+            return True
+        if kept.find(1, start, end) == -1:
+            cost = offsets[end] - offsets[start]
+        else:
+            cost = sum(offsets[i + 1] - offsets[i] for i in range(start, end) if not kept[i])
+        cost += extra
+        if cost > self.remaining:
+            return False
+        self.remaining -= cost
+        kept[start:end] = b'\x01' * (end - start)
+        return True
+
+    def take_window(self, center: int, radius: int):
+        """Keep as much of [center - radius, center + radius] as fits, shrinking from the edges"""
+        while radius > 0:
+            if self.take(center - radius, center + radius + 1):
+                return
+            radius //= 2
+        self.take(center, center + 1)
+
+    def take_signature(self, block: CodeBlock) -> bool:
+        return self.take(block.start, block.header + 1, MARKER_CHARS)
+
+    def text(self, start: int, end: int) -> str:
+        lines = self.layout.lines
+        return '\n'.join(lines[i] for i in range(start, end) if self.kept[i])
+
+    def render(self, comment: str) -> str:
+        lines, blank, kept = self.layout.lines, self.layout.blank, self.kept
+        out, index, count = [], 0, len(lines)
+        while index < count:
+            end = kept.find(0, index)
+            if end == -1:
+                end = count
+            out.extend(lines[index:end])
+            if end == count:
+                break
+            index = kept.find(1, end)
+            if index == -1:
+                index = count
+            first = blank.find(0, end, index)
+            if first == -1:
+                out.append('')
+            else:
+                out.append(f"{' ' * _indent(lines[first])}{comment} ... {index - end} lines omitted")
+        return '\n'.join(out)
+
+
+def _innermost(blocks: Sequence[CodeBlock], line: int) -> Tuple[Optional[CodeBlock], List[CodeBlock]]:
+    """Innermost block containing line, and the blocks enclosing it"""
+    containing = [block for block in blocks if block.start <= line < block.end]
+    if not containing:
+        return None, []
+    containing.sort(key=lambda block: block.end - block.start)
+    return containing[0], containing[1:]
+
+
+def select_code_context(code: str, language: str = 'python', focus_lines: Iterable[int] = (),
+                        mentions: str = '', budget: int = None) -> str:
+    """
+    The parts of code most relevant to the focus lines and mentioned names, within budget tokens.
+    Code that already fits is returned unchanged.
+    """
+    budget = CODE_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if not code or estimate_tokens(code) <= budget:
+        return code
+
+    layout = _layout(code, language)
+    blocks, lines = layout.blocks, layout.lines
+    selection = _Selection(layout, budget)
+    by_name = {}
+    for block in blocks:
+        by_name.setdefault(block.name, []).append(block)
+    focus = [min(max(line, 0), len(lines) - 1) for line in focus_lines][:MAX_FOCUS_LINES]
+
+    # 1. Scopes enclosing the focus lines (the signature of every enclosing definition)
+    focus_blocks = []
+    for line in focus:
+        block, enclosing = _innermost(blocks, line)
+        for outer in enclosing:
+            selection.take_signature(outer)
+        if block is None:
+            selection.take_window(line, FOCUS_WINDOW_LINES)
+        elif selection.take(block.start, block.end):
+            focus_blocks.append(block)
+        else:
+            selection.take_signature(block)
+            selection.take_window(line, FOCUS_WINDOW_LINES)
+
+    # 2. Definitions referenced from the focus scopes or named in the conversation
+    referenced = set(_IDENTIFIER.findall(mentions))
+    for block in focus_blocks:
+        referenced.update(_IDENTIFIER.findall(selection.text(block.header + 1, block.end)))
+    for name in sorted(referenced & by_name.keys()):
+        for block in by_name[name]:
+            if not selection.take(block.start, block.end):
+                selection.take_signature(block)
+
+    # 3. Skeleton: signatures of the remaining definitions, nearest the focus first (until one no longer fits)
+    anchor = focus[0] if focus else 0
+    nearest = sorted(blocks, key=lambda block: abs(block.header - anchor))
+    for block in nearest:
+        if not selection.take_signature(block):
+            break
+
+    # 4. Module-level statements (imports, globals, entry point)
+    for start, end in layout.module_runs:
+        if not selection.take(start, end):
+            for index in range(start, end):
+                selection.take(index, index + 1)
+
+    # 5. Whole blocks nearest the focus while they fit
+    for block in nearest:
+        if not selection.take(block.start, block.end):
+            break
+
+    selected = selection.render('#' if language.lower() == 'python' else '//')
+    CODE_CONTEXT_TOKENS.inc(estimate_tokens(code), kind='original')
+    CODE_CONTEXT_TOKENS.inc(estimate_tokens(selected), kind='selected')
+    return selected
+
+
+def code_for_prompt(snapshot, messages: Sequence = (), budget: int = None) -> str:
+    """Relevant code of a room's ContextSnapshot, focused on recent cursor and edit positions and the conversation"""
+    code = snapshot.code_context
+    if not code:
+        return code
+    focus = [line_of_offset(code, offset) for offset in reversed(snapshot.cursor_offsets)]
+    mentions = ' '.join(message.content for message in messages)
+    return select_code_context(code, snapshot.programming_language, focus, mentions, budget)
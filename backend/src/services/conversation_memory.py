@@ -0,0 +1,159 @@
+"""
+Conversation Memory - Rolling summary of a room's conversation plus its latest turns
+
+A room's context keeps only the last MAX_CONTEXT_MESSAGES messages. Messages that fall out of
+that window are queued on the context's summary backlog; once SUMMARY_REFRESH_EVERY of them have
+accumulated, a background worker folds them into the room's running summary with one small LLM
+call (never on the message path, at most one refresh per room queued at a time). The summary
+lives on the room's context, so it is spilled and rehydrated with it.
+
+Prompts carry the summary and the last MEMORY_RECENT_TURNS messages, trimmed newest-first to
+MEMORY_TOKEN_BUDGET.
+"""
+
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from .ai_models import ContextSnapshot, ConversationContext, Message
+from .cancellation import OperationCancelled
+from .code_context import estimate_tokens
+from .metrics import chat_completion, SUMMARY_REFRESHES
+from config.logging_config import get_logger
+
+log = get_logger(__name__)
+
+SUMMARY_REFRESH_EVERY = int(os.environ.get('SUMMARY_REFRESH_EVERY', '6'))  # backlog messages per refresh
+MEMORY_RECENT_TURNS = int(os.environ.get('MEMORY_RECENT_TURNS', '6'))
+MEMORY_TOKEN_BUDGET = int(os.environ.get('MEMORY_TOKEN_BUDGET', '600'))
+MAX_SUMMARY_BACKLOG = 60     # oldest backlog messages are dropped beyond this (e.g. no LLM client)
+MAX_SUMMARY_CHARS = 1200     # summaries are asked to stay short; longer ones are cut
+
+
+@dataclass(frozen=True, slots=True)
+class PromptMemory:
+    """What a prompt gets of the conversation: the rolling summary and the latest raw turns"""
+    summary: str
+    messages: Tuple[Message, ...]
+
+    def summary_block(self) -> str:
+        """Prompt section for the summary (empty, or ending in a blank line)"""
+        return f"Earlier in this session (summary):\n{self.summary}\n\n" if self.summary else ""
+
+
+def prompt_memory(snapshot: ContextSnapshot, turns: int = None, budget: int = None) -> PromptMemory:
+    """Summary plus the last turns of a snapshot's conversation, within budget tokens (newest kept first)"""
+    turns = MEMORY_RECENT_TURNS if turns is None else turns
+    budget = MEMORY_TOKEN_BUDGET if budget is None else budget
+    summary = snapshot.summary[:MAX_SUMMARY_CHARS]
+    remaining = budget - estimate_tokens(summary)
+    messages = []
+    for message in reversed(snapshot.recent_messages(turns)):
+        cost = estimate_tokens(message.username) + estimate_tokens(message.content) + 2
+        if messages and cost > remaining:
+            break
+        messages.append(message)
+        remaining -= cost
+    messages.reverse()
+    return PromptMemory(summary, tuple(messages))
+
+
+def _transcript(messages: List[Message]) -> str:
+    return "\n".join(f"{'Bob (AI)' if message.userId == 'ai_agent_bob' else message.username}: {message.content}"
+                     for message in messages)
+
+
+class ConversationMemory:
+    """Background summarizer of the messages that left rooms' context windows"""
+
+    def __init__(self, client, get_context: Callable[[str], Optional[ConversationContext]]):
+        self.client = client
+        self.get_context = get_context
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def on_message_evicted(self, context: ConversationContext, message: Message):
+        """Add a message leaving the context window to the backlog (call with the context lock held)"""
+        backlog = context.summary_backlog
+        backlog.append(message)
+        if len(backlog) > MAX_SUMMARY_BACKLOG:
+            del backlog[0]
+        if len(backlog) >= SUMMARY_REFRESH_EVERY and self.client:
+            self._enqueue(context.room_id)
+
+    def _enqueue(self, room_id: str):
+        with self._lock:
+            if room_id in self._queued:
+                return
+            self._queued.add(room_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversation-summarizer", daemon=True)
+                self._thread.start()
+        self._queue.put(room_id)
+
+    def _run(self):
+        while True:
+            room_id = self._queue.get()
+            with self._lock:
+                self._queued.discard(room_id)
+            try:
+                self.refresh(room_id)
+            except Exception as e:
+                log.error("❌ Error refreshing conversation summary for room %s: %s", room_id, e)
+
+    def refresh(self, room_id: str) -> bool:
+        """Fold the room's backlog into its summary (blocking; normally run by the worker)"""
+        context = self.get_context(room_id)
+        if context is None:
+            return False
+        with context.lock:
+            backlog = list(context.summary_backlog)
+            previous = context.summary
+        if not backlog:
+            return False
+
+        try:
+            summary = self._summarize(room_id, previous, backlog)
+        except OperationCancelled:
+            return False
+        except Exception:
+            SUMMARY_REFRESHES.inc(outcome='error')
+            raise
+        if not summary:
+            SUMMARY_REFRESHES.inc(outcome='empty')
+            return False
+
+        with context.lock:
+            # Messages evicted while the summary was being written stay in the backlog for the next refresh
+            folded = {id(message) for message in backlog}
+            context.summary_backlog = [message for message in context.summary_backlog if id(message) not in folded]
+            context.summary = summary[:MAX_SUMMARY_CHARS]
+            context.bump_version()
+        SUMMARY_REFRESHES.inc(outcome='updated')
+        log.debug("🧠 Summary for room %s now covers %d more messages", room_id, len(backlog))
+        return True
+
+    def _summarize(self, room_id: str, previous: str, messages: List[Message]) -> str:
+        prompt = f"""Update the running summary of a pair programming session between students and Bob, their AI tutor.
+
+Current summary:
+{previous or "(none yet)"}
+
+New messages:
+{_transcript(messages)}
+
+Write the updated summary in at most 5 short sentences: what the students are working on, decisions and
+approaches tried, what they are stuck on, and what Bob already suggested. Keep names of functions and
+variables they mention. Return only the summary."""
+        response = chat_completion(
+            self.client, 'summary', room_id,
+            model="gpt-4.1-mini",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=200,
+            temperature=0.2
+        )
+        return (response.choices[0].message.content or "").strip()
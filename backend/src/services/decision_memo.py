@@ -0,0 +1,45 @@
+"""
+Decision Memo - Last AI decision per room and kind, keyed by the room state it was made from
+
+Idle interventions, progress checks and reflection responses are often re-evaluated while nothing
+the prompt is built from has changed (e.g. a check rescheduled without new messages). Each completed
+decision is stored with the state_version of the snapshot it was made from; a re-evaluation at the
+same version reuses it without an LLM call, or answers no response when the stored message has
+already been said.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from .ai_models import ContextSnapshot
+from .metrics import UNCHANGED_STATE_DECISIONS
+from .room_lifecycle import RoomStateStore, room_state_limits
+
+Decision = Tuple[bool, str]
+
+
+class DecisionMemo:
+    """Per-room memo of (state_version, decision) for each decision kind"""
+
+    def __init__(self):
+        self.rooms = RoomStateStore('decision_memo', **room_state_limits())  # room_id -> {kind: (state_version, decision)}
+
+    def reuse(self, room_id: str, kind: str, snapshot: ContextSnapshot) -> Optional[Decision]:
+        """The stored decision if the snapshot matches the state it was made from, else None"""
+        entry = self.rooms.get(room_id, {}).get(kind)
+        if entry is None or entry[0] != snapshot.state_version:
+            return None
+        should_respond, message = entry[1]
+        if should_respond and (message in snapshot.ai_message_history
+                               or any(previous.content == message for previous in snapshot.messages)):
+            UNCHANGED_STATE_DECISIONS.inc(kind=kind, outcome='no_response')
+            return False, ""
+        UNCHANGED_STATE_DECISIONS.inc(kind=kind, outcome='reused')
+        return should_respond, message
+
+    def store(self, room_id: str, kind: str, snapshot: ContextSnapshot, decision: Decision):
+        """Remember a completed decision (not one that failed or was cancelled)"""
+        entries: Dict[str, Tuple[int, Decision]] = self.rooms.get_or_create(room_id, dict)
+        entries[kind] = (snapshot.state_version, decision)
+
+    def forget(self, room_id: str):
+        self.rooms.pop(room_id, None)
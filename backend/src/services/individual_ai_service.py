@@ -9,6 +9,7 @@ from datetime import datetime
 from typing import Dict, List, Optional
 
 from .ai_agent import get_ai_agent
+from .room_lifecycle import RoomStateStore, room_state_limits
 
 
 class IndividualAIService:
@@ -17,7 +18,9 @@ class IndividualAIService:
         
         # Store mapping of personal rooms to original rooms for cleanup
         # Format: {personal_room_id: original_room_id}
-        self.personal_room_mapping = {}
+        self.personal_room_mapping = RoomStateStore(
+            'personal_room_mapping', room_of=lambda personal_room, original_room: original_room, **room_state_limits()
+        )
         
         print("✅ Individual AI Service initialized (using core AI agent)!")
 
@@ -151,20 +154,18 @@ class IndividualAIService:
                 return
             
             # Copy problem and code context to personal room
-            if personal_room_id not in ai_agent.conversation_history:
-                from .ai_models import ConversationContext
-                ai_agent.conversation_history[personal_room_id] = ConversationContext(
-                    messages=[],
-                    room_id=personal_room_id
-                )
-            
-            personal_context = ai_agent.conversation_history[personal_room_id]
+            personal_context = ai_agent.get_context(personal_room_id)
+            original = original_context.snapshot()
             
             # Copy relevant context (but not the conversation history)
-            personal_context.problem_title = original_context.problem_title
-            personal_context.problem_description = original_context.problem_description
-            personal_context.code_context = original_context.code_context
-            personal_context.programming_language = original_context.programming_language
+            with personal_context.lock:
+                personal_context.problem_title = original.problem_title
+                personal_context.problem_description = original.problem_description
+                personal_context.code_context = original.code_context
+                personal_context.code_revision += 1
+                personal_context.programming_language = original.programming_language
+                personal_context.cursor_offsets = list(original.cursor_offsets)
+                personal_context.bump_version()
             
             print(f"✅ Copied context from {original_room_id} to personal room {personal_room_id}")
             
@@ -224,7 +225,7 @@ class IndividualAIService:
             personal_room_id = self.get_personal_room_id(room_id, user_id)
             context = ai_agent.conversation_history.get(personal_room_id)
             
-            return context.messages if context else []
+            return list(context.messages) if context else []
         except Exception as e:
             print(f"❌ Error getting conversation history: {e}")
             return []
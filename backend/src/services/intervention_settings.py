@@ -0,0 +1,172 @@
+"""
+Intervention Settings - Versioned, copy-on-write intervention profiles per room and cohort
+
+Settings resolve in layers: global defaults <- cohort profile <- room profile. A personal room
+(room_personal_user) uses the profile of its shared room unless it has one of its own.
+Writers build a new immutable registry state under a lock and swap it in; readers (timer code)
+take the current state without locking and get a frozen InterventionSettings for the room.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, asdict, replace, fields
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Set
+
+from .room_lifecycle import base_room_id
+
+MAX_RESOLVED_CACHE = 10000  # rooms whose resolved settings are cached per registry version
+BOOLEAN_SETTINGS = ('idle_intervention_enabled', 'progress_check_enabled', 'speculative_intervention_enabled')
+
+
+@dataclass(frozen=True, slots=True)
+class InterventionSettings:
+    """Resolved settings for one room (immutable)"""
+    idle_intervention_enabled: bool = True   # idle intervention
+    idle_intervention_delay: float = 5       # seconds to wait before idle intervention
+    progress_check_enabled: bool = False     # progress check
+    progress_check_interval: float = 45      # seconds between progress checks
+    # Start the idle decision when the message arrives instead of when the timer fires
+    speculative_intervention_enabled: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+SETTING_KEYS = frozenset(f.name for f in fields(InterventionSettings))
+
+
+def validate_settings(settings: Mapping[str, Any]) -> Optional[str]:
+    """Error message for the first invalid key or value, or None"""
+    for key, value in settings.items():
+        if key not in SETTING_KEYS:
+            return f'Invalid setting key: {key}'
+        if key in BOOLEAN_SETTINGS:
+            if not isinstance(value, bool):
+                return f'Setting value must be boolean: {key}'
+        elif key == 'idle_intervention_delay':
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not (1 <= value <= 60):
+                return f'Idle intervention delay must be between 1 and 60 seconds: {key}'
+        elif key == 'progress_check_interval':
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not (10 <= value <= 300):
+                return f'Progress check interval must be between 10 and 300 seconds: {key}'
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class _RegistryState:
+    version: int
+    defaults: InterventionSettings
+    cohorts: Mapping[str, Mapping[str, Any]]      # cohort -> overrides
+    rooms: Mapping[str, Mapping[str, Any]]        # room -> overrides
+    room_cohorts: Mapping[str, str]               # room -> cohort
+    resolved: Dict[str, InterventionSettings]     # per-state cache, filled by readers
+
+
+def _frozen(mapping: Dict) -> Mapping:
+    return MappingProxyType(dict(mapping))
+
+
+class SettingsRegistry:
+    """Copy-on-write store of intervention profiles"""
+
+    def __init__(self, defaults: InterventionSettings = None):
+        self._state = _RegistryState(0, defaults or InterventionSettings(), _frozen({}), _frozen({}), _frozen({}), {})
+        self._write_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._state.version
+
+    @property
+    def defaults(self) -> InterventionSettings:
+        return self._state.defaults
+
+    def for_room(self, room_id: str) -> InterventionSettings:
+        """Immutable settings for a room (lock-free)"""
+        state = self._state
+        settings = state.resolved.get(room_id)
+        if settings is None:
+            settings = self._resolve(state, room_id)
+            if len(state.resolved) < MAX_RESOLVED_CACHE:
+                state.resolved[room_id] = settings  # benign race: every reader computes the same value
+        return settings
+
+    def _resolve(self, state: _RegistryState, room_id: str) -> InterventionSettings:
+        base = base_room_id(room_id)
+        overrides = {}
+        cohort = state.room_cohorts.get(room_id) or state.room_cohorts.get(base)
+        if cohort:
+            overrides.update(state.cohorts.get(cohort, {}))
+        if room_id != base:
+            overrides.update(state.rooms.get(base, {}))
+        overrides.update(state.rooms.get(room_id, {}))
+        return replace(state.defaults, **overrides) if overrides else state.defaults
+
+    def _commit(self, **changes) -> int:
+        """Swap in a new state (call with the write lock held)"""
+        self._state = replace(self._state, version=self._state.version + 1, resolved={}, **changes)
+        return self._state.version
+
+    def update_defaults(self, settings: Mapping[str, Any]) -> int:
+        with self._write_lock:
+            return self._commit(defaults=replace(self._state.defaults, **settings))
+
+    def update_cohort(self, cohort: str, settings: Mapping[str, Any]) -> int:
+        with self._write_lock:
+            cohorts = dict(self._state.cohorts)
+            cohorts[cohort] = _frozen({**cohorts.get(cohort, {}), **settings})
+            return self._commit(cohorts=_frozen(cohorts))
+
+    def update_room(self, room_id: str, settings: Mapping[str, Any]) -> int:
+        with self._write_lock:
+            rooms = dict(self._state.rooms)
+            rooms[room_id] = _frozen({**rooms.get(room_id, {}), **settings})
+            return self._commit(rooms=_frozen(rooms))
+
+    def reset_room(self, room_id: str) -> int:
+        """Drop a room's own overrides (it falls back to its cohort and the defaults)"""
+        with self._write_lock:
+            rooms = dict(self._state.rooms)
+            rooms.pop(room_id, None)
+            return self._commit(rooms=_frozen(rooms))
+
+    def assign_cohort(self, room_ids: Iterable[str], cohort: Optional[str]) -> int:
+        """Put rooms in a cohort (None removes them from theirs)"""
+        with self._write_lock:
+            room_cohorts = dict(self._state.room_cohorts)
+            for room_id in room_ids:
+                if cohort:
+                    room_cohorts[room_id] = cohort
+                else:
+                    room_cohorts.pop(room_id, None)
+            return self._commit(room_cohorts=_frozen(room_cohorts))
+
+    def rooms_in_scope(self, room_ids: Iterable[str], rooms: Iterable[str] = None, cohort: str = None) -> Set[str]:
+        """Which of room_ids a change to some rooms / a cohort / the defaults (neither given) can affect"""
+        if rooms is not None:
+            rooms = set(rooms)
+            return {r for r in room_ids if r in rooms or base_room_id(r) in rooms}
+        if cohort:
+            state = self._state
+            return {r for r in room_ids
+                    if (state.room_cohorts.get(r) or state.room_cohorts.get(base_room_id(r))) == cohort}
+        return set(room_ids)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """All profiles, for the settings API"""
+        state = self._state
+        return {
+            'version': state.version,
+            'defaults': state.defaults.to_dict(),
+            'cohorts': {name: dict(values) for name, values in state.cohorts.items()},
+            'rooms': {room: dict(values) for room, values in state.rooms.items()},
+            'room_cohorts': dict(state.room_cohorts),
+        }
+
+
+def default_settings_from_env() -> InterventionSettings:
+    """Global defaults (SPECULATIVE_INTERVENTION is the only one read from the environment)"""
+    return InterventionSettings(
+        speculative_intervention_enabled=os.environ.get('SPECULATIVE_INTERVENTION', 'false').lower() == 'true'
+    )
@@ -0,0 +1,68 @@
+"""
+LLM Provider - Builds the OpenAI-compatible clients used by every AI service
+
+LLM_PROVIDER selects the backend:
+    openai  (default) api.openai.com, or any compatible endpoint via OPENAI_BASE_URL; needs OPENAI_API_KEY
+    mock    the bundled mock server (mock_openai_server.py): started in-process on first use, or the
+            one at MOCK_LLM_URL; scripted by MOCK_LLM_SCRIPT and MOCK_LLM_SEED; no key or network needed
+"""
+
+import os
+import threading
+from typing import Optional
+
+from openai import OpenAI, AsyncOpenAI
+
+PROVIDERS = ('openai', 'mock')
+
+
+def get_llm_provider() -> str:
+    """Configured provider name"""
+    provider = os.environ.get('LLM_PROVIDER', 'openai').lower()
+    if provider not in PROVIDERS:
+        print(f"⚠️  Unknown LLM_PROVIDER '{provider}' - using openai")
+        return 'openai'
+    return provider
+
+
+# Global in-process mock server
+mock_server = None
+_mock_server_lock = threading.Lock()
+
+def get_mock_server_url() -> str:
+    """Base URL of the mock server, starting the bundled one if MOCK_LLM_URL is not set"""
+    global mock_server
+    url = os.environ.get('MOCK_LLM_URL')
+    if url:
+        return url.rstrip('/')
+    if mock_server is None:
+        with _mock_server_lock:
+            if mock_server is None:
+                from .mock_openai_server import MockScript, start_mock_server
+                script_path = os.environ.get('MOCK_LLM_SCRIPT')
+                seed = int(os.environ['MOCK_LLM_SEED']) if os.environ.get('MOCK_LLM_SEED') else None
+                script = MockScript.from_file(script_path, seed) if script_path else MockScript(seed=seed)
+                mock_server = start_mock_server(0, script)
+                print(f"🧪 Mock LLM server started on http://127.0.0.1:{mock_server.server_port}/v1")
+    return f"http://127.0.0.1:{mock_server.server_port}/v1"
+
+
+def create_openai_client(service_name: str) -> Optional[OpenAI]:
+    """Client for the configured provider, or None (service disabled) when it is not configured"""
+    try:
+        if get_llm_provider() == 'mock':
+            return OpenAI(api_key='mock', base_url=get_mock_server_url())
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print(f"⚠️  Warning: No OpenAI API key found. {service_name} will be disabled.")
+            return None
+        return OpenAI(api_key=api_key)  # honours OPENAI_BASE_URL
+    except Exception as e:
+        print(f"❌ Error initializing OpenAI client: {e}")
+        return None
+
+
+def create_async_openai_client(client: OpenAI, **kwargs) -> AsyncOpenAI:
+    """Async client talking to the same provider as client (same key and base URL)"""
+    return AsyncOpenAI(api_key=client.api_key, base_url=str(client.base_url), **kwargs)
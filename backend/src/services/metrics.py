@@ -0,0 +1,310 @@
+"""
+Metrics - in-process counters, gauges and histograms exposed at /metrics
+
+A small thread-safe registry rendering the Prometheus text exposition format (no client
+library needed). The metrics the backend records are defined at the bottom of this module;
+instrumentation helpers cover Socket.IO handlers and LLM calls.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .cancellation import current_token, cancellable_completion, OperationCancelled
+from .tracing import get_tracer
+from .usage_governor import get_usage_governor
+
+# Latency buckets in seconds (socket handlers are ms-scale, LLM/TTS calls are seconds-scale)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback: Callable[[], float] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback: Callable[[], float]):
+        """Read the (unlabelled) value from callback on every scrape"""
+        self.callback = callback
+
+    def value(self, **labels) -> float:
+        if self.callback is not None:
+            return self.callback()
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        if self.callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self.callback())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry
+registry = MetricsRegistry()
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Get the global metrics registry"""
+    return registry
+
+
+# Socket.IO
+SOCKET_EVENTS = registry.counter('socket_events_total', 'Socket.IO events handled', ['event'])
+SOCKET_EVENT_ERRORS = registry.counter('socket_event_errors_total', 'Socket.IO handlers that raised', ['event'])
+SOCKET_EVENT_SECONDS = registry.histogram('socket_event_seconds', 'Socket.IO handler duration', ['event'])
+
+# LLM calls, by call site
+LLM_REQUEST_SECONDS = registry.histogram('llm_request_seconds', 'Chat completion latency', ['site'])
+LLM_TOKENS = registry.counter('llm_tokens_total', 'Chat completion tokens', ['site', 'kind'])
+LLM_ERRORS = registry.counter('llm_errors_total', 'Chat completion calls that raised', ['site'])
+
+# Text to speech
+TTS_FIRST_CHUNK_SECONDS = registry.histogram('tts_first_chunk_seconds', 'Time from TTS request to first audio chunk', ['format'])
+TTS_BYTES = registry.counter('tts_bytes_total', 'Audio bytes generated', ['format'])
+TTS_STREAMS = registry.counter('tts_streams_total', 'TTS generations by outcome', ['format', 'outcome'])
+
+# Code execution
+EXECUTION_SECONDS = registry.histogram('code_execution_seconds', 'Code execution run time (compile + run)', ['language', 'outcome'])
+EXECUTIONS_IN_FLIGHT = registry.gauge('code_executions_in_flight', 'Code executions currently running')
+
+# Database writer
+DB_WRITER_QUEUE_DEPTH = registry.gauge('db_writer_queue_depth', 'Chat messages waiting for the background writer')
+DB_WRITER_BATCH_SECONDS = registry.histogram('db_writer_batch_seconds', 'Time to write one message batch')
+DB_WRITER_BATCH_SIZE = registry.histogram('db_writer_batch_size', 'Messages per written batch', buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+# Process / room state (callbacks are wired up in app.py)
+ACTIVE_ROOMS = registry.gauge('active_rooms', 'Rooms with at least one connected user')
+PENDING_TIMERS = registry.gauge('pending_intervention_timers', 'Idle and progress timers waiting to fire')
+CANCELLED_CALLS = registry.counter('cancelled_calls_total', 'LLM/TTS calls dropped because their intervention was cancelled (stage=before is a call avoided; in_flight/completed were paid for)', ['kind', 'stage'])
+CODE_CONTEXT_TOKENS = registry.counter('code_context_tokens_total', 'Estimated tokens of code too large for prompts (original) and what was embedded instead (selected)', ['kind'])
+USAGE_DEGRADATIONS = registry.counter('usage_degradations_total', 'AI work reduced because a room or the deployment is near its usage budget', ['action'])
+SEMANTIC_CACHE_LOOKUPS = registry.counter('semantic_cache_lookups_total', 'Direct-mention answer cache lookups, by outcome (repeat = hit already said in the room)', ['outcome'])
+SEMANTIC_CACHE_SAVED_SECONDS = registry.counter('semantic_cache_saved_seconds_total', 'LLM latency avoided by answering from the semantic cache')
+SUMMARY_REFRESHES = registry.counter('conversation_summary_refreshes_total', 'Background conversation summary refreshes, by outcome', ['outcome'])
+PROGRESS_SWEEP_ROOMS = registry.counter('progress_sweep_rooms_total', 'Due progress checks by sweep outcome (unchanged = skipped without an LLM call, deferred = over the per-sweep limit)', ['outcome'])
+UNCHANGED_STATE_DECISIONS = registry.counter('unchanged_state_decisions_total', 'LLM calls avoided because the room state matched the last decision of that kind (reused it, or no_response when it was already said)', ['kind', 'outcome'])
+SPECULATIVE_DECISIONS = registry.counter('speculative_decisions_total', 'Idle decisions computed during the idle window, by outcome', ['outcome'])
+LIVE_THREADS = registry.gauge('live_threads', 'Live Python threads', callback=threading.active_count)
+
+
+def timed_socket_handler(event: str):
+    """Decorator counting and timing a Socket.IO handler"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            SOCKET_EVENTS.inc(event=event)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                SOCKET_EVENT_ERRORS.inc(event=event)
+                raise
+            finally:
+                SOCKET_EVENT_SECONDS.observe(time.perf_counter() - start, event=event)
+        return wrapper
+    return decorator
+
+
+def chat_completion(client, site: str, room_id: str = None, **kwargs):
+    """client.chat.completions.create(**kwargs) recording latency, tokens and errors for the call site
+    (abortable through the current cancellation token, raising OperationCancelled). Token usage is
+    accounted to room_id, or the current usage scope / trace room."""
+    with get_tracer().span(f"llm.{site}", model=kwargs.get('model')) as span:
+        start = time.perf_counter()
+        token = current_token()
+        try:
+            if token is None:
+                response = client.chat.completions.create(**kwargs)
+            else:
+                if token.cancelled:
+                    CANCELLED_CALLS.inc(kind='llm', stage='before')
+                response = cancellable_completion(
+                    client, token, lambda stage: CANCELLED_CALLS.inc(kind='llm', stage=stage), **kwargs)
+        except OperationCancelled:
+            if span is not None:
+                span.set(cancelled=token.reason)
+            raise
+        except Exception:
+            LLM_ERRORS.inc(site=site)
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, site=site)
+
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+            LLM_TOKENS.inc(prompt_tokens, site=site, kind='prompt')
+            LLM_TOKENS.inc(completion_tokens, site=site, kind='completion')
+            get_usage_governor().record_completion(site, prompt_tokens, completion_tokens, room_id)
+            if span is not None:
+                span.set(prompt_tokens=getattr(usage, 'prompt_tokens', 0), completion_tokens=getattr(usage, 'completion_tokens', 0))
+        return response
@@ -0,0 +1,331 @@
+"""
+Mock OpenAI Server - scripted chat completions and streamed speech over the OpenAI HTTP API
+
+A local stand-in for api.openai.com so the whole AI pipeline (agent decisions, progress checks,
+code analysis, scaffolding, TODO reveal, reflection and TTS) runs without a key or network.
+Used by LLM_PROVIDER=mock (see llm_provider.py) and by the benchmarks.
+
+Endpoints:
+    POST /v1/chat/completions  first matching script rule answers (stream=true is supported)
+    POST /v1/audio/speech      pcm streamed in chunks sized to the spoken text, or a small mp3
+    GET  /v1/models            model list
+    GET  /mock/stats           requests per endpoint and per rule
+
+A script is JSON (see DEFAULT_SCRIPT):
+    latency: {chat | tts_first_byte | tts_chunk_interval: distribution}
+    rules:   [{name, match | regex, responses, mode, latency}], matched against all message text
+    default: responses when no rule matches
+Responses are strings or {"text": ..., "weight": ...}; mode "random" (default, weighted and
+seeded) or "cycle" (deterministic round robin). Distributions:
+    {"distribution": "fixed", "ms"}              {"distribution": "normal", "mean_ms", "stddev_ms"}
+    {"distribution": "lognormal", "median_ms", "sigma"}
+    {"distribution": "uniform", "min_ms", "max_ms"}  {"distribution": "exponential", "mean_ms"}
+
+Usage (from backend/src):
+    python -m services.mock_openai_server --port 8099 --seed 1 [--script script.json]
+    python -m services.mock_openai_server --print-default-script > script.json
+"""
+
+import argparse
+import copy
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+PCM_BYTES_PER_SECOND = 24000 * 2  # 24 kHz, 16-bit mono
+SPOKEN_CHARS_PER_SECOND = 15
+PCM_CHUNK_SIZE = 4096
+
+HINTS = [
+    "Have you checked what happens when the input list is empty?",
+    "A dictionary could turn that inner loop into a single lookup.",
+    "Try printing the intermediate values to see where it diverges.",
+]
+
+DEFAULT_SCRIPT = {
+    "latency": {
+        "chat": {"distribution": "lognormal", "median_ms": 400, "sigma": 0.3},
+        "tts_first_byte": {"distribution": "normal", "mean_ms": 250, "stddev_ms": 75},
+        "tts_chunk_interval": {"distribution": "fixed", "ms": 2},
+    },
+    "rules": [
+        {"name": "summary", "match": "running summary of a pair programming session",
+         "responses": ["The students are solving the problem with a dictionary of seen values; Bob suggested checking the empty-list case."]},
+        {"name": "code_analysis", "match": "Analyze this",
+         "responses": ['{"issue": {"title": "Code looks good!", "description": "Correct and efficient.", "hint": "Well done!"}}']},
+        {"name": "panel_analysis", "match": "Code execution analysis", "responses": ["correct"]},
+        {"name": "scaffolding", "match": "NO_SCAFFOLDING",
+         "responses": [{"text": "NO_SCAFFOLDING", "weight": 0.5},
+                       {"text": "# TODO: handle the empty input\n# TODO: loop over the items\n# TODO: return the result", "weight": 0.5}]},
+        {"name": "todo_reveal", "match": "replace a TODO comment", "responses": ["return result"]},
+        {"name": "reflection", "match": "supportive programming tutor",
+         "responses": ["What was the trickiest part of this problem for you?", "What would you try first next time?"]},
+        {"name": "progress_check", "match": "PROGRESS CHECK",
+         "responses": [{"text": f"YES|HINT|{HINTS[0]}", "weight": 0.3}, {"text": "NO", "weight": 0.7}]},
+    ],
+    "default": [{"text": "NO_RESPONSE", "weight": 0.7}] + [{"text": hint, "weight": 0.1} for hint in HINTS],
+}
+
+
+def default_script(llm_latency_ms: float = None, tts_latency_ms: float = None, respond_ratio: float = None) -> dict:
+    """DEFAULT_SCRIPT with the common knobs overridden"""
+    script = copy.deepcopy(DEFAULT_SCRIPT)
+    if llm_latency_ms is not None:
+        script["latency"]["chat"] = {"distribution": "lognormal", "median_ms": llm_latency_ms, "sigma": 0.3}
+    if tts_latency_ms is not None:
+        script["latency"]["tts_first_byte"] = {"distribution": "normal", "mean_ms": tts_latency_ms, "stddev_ms": tts_latency_ms * 0.3}
+    if respond_ratio is not None:
+        progress = next(rule for rule in script["rules"] if rule["name"] == "progress_check")
+        progress["responses"][0]["weight"] = respond_ratio
+        progress["responses"][1]["weight"] = 1 - respond_ratio
+        script["default"] = [{"text": "NO_RESPONSE", "weight": 1 - respond_ratio}] + [
+            {"text": hint, "weight": respond_ratio / len(HINTS)} for hint in HINTS
+        ]
+    return script
+
+
+class LatencyDistribution:
+    """Samples delays in seconds from a script distribution"""
+
+    def __init__(self, spec: Optional[Dict[str, Any]]):
+        spec = spec or {"distribution": "fixed", "ms": 0}
+        self.kind = spec.get("distribution", "fixed")
+        self.spec = spec
+        if self.kind not in ("fixed", "normal", "lognormal", "uniform", "exponential"):
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+    def sample(self, rng: random.Random) -> float:
+        spec = self.spec
+        if self.kind == "fixed":
+            ms = spec.get("ms", 0)
+        elif self.kind == "normal":
+            ms = rng.gauss(spec["mean_ms"], spec.get("stddev_ms", 0))
+        elif self.kind == "lognormal":
+            ms = rng.lognormvariate(math.log(max(spec["median_ms"], 1e-3)), spec.get("sigma", 0.3))
+        elif self.kind == "uniform":
+            ms = rng.uniform(spec["min_ms"], spec["max_ms"])
+        else:
+            ms = rng.expovariate(1 / spec["mean_ms"]) if spec["mean_ms"] else 0
+        return max(0.0, ms) / 1000
+
+
+class ResponseRule:
+    """A scripted answer for prompts containing a substring or matching a regex"""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.name = spec.get("name") or spec.get("match") or spec.get("regex") or "default"
+        self.match = spec.get("match")
+        self.regex = re.compile(spec["regex"], re.DOTALL) if spec.get("regex") else None
+        self.mode = spec.get("mode", "random")
+        self.latency = LatencyDistribution(spec["latency"]) if spec.get("latency") else None
+        responses = spec.get("responses") or [""]
+        self.texts = [r["text"] if isinstance(r, dict) else r for r in responses]
+        self.weights = [r.get("weight", 1) if isinstance(r, dict) else 1 for r in responses]
+        self._next = 0
+
+    def matches(self, text: str) -> bool:
+        if self.regex is not None:
+            return bool(self.regex.search(text))
+        return self.match is None or self.match in text
+
+    def pick(self, rng: random.Random) -> str:
+        if self.mode == "cycle":
+            text = self.texts[self._next % len(self.texts)]
+            self._next += 1
+            return text
+        return rng.choices(self.texts, self.weights)[0]
+
+
+class MockScript:
+    """Parsed script: rules, default answers and latency distributions (thread-safe, seeded)"""
+
+    def __init__(self, script: Dict[str, Any] = None, seed: int = None):
+        script = script or DEFAULT_SCRIPT
+        latency = script.get("latency", {})
+        self.chat_latency = LatencyDistribution(latency.get("chat"))
+        self.tts_first_byte = LatencyDistribution(latency.get("tts_first_byte"))
+        self.tts_chunk_interval = LatencyDistribution(latency.get("tts_chunk_interval"))
+        self.rules = [ResponseRule(rule) for rule in script.get("rules", [])]
+        self.default = ResponseRule({"name": "default", "responses": script.get("default") or ["NO_RESPONSE"]})
+        self.random = random.Random(seed)
+        self.stats = {"chat": 0, "speech": 0, "rules": {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, seed: int = None) -> 'MockScript':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), seed)
+
+    def answer(self, messages: List[Dict[str, Any]]) -> tuple:
+        """(text, delay seconds) for a chat completion request"""
+        text = "\n".join(str(message.get("content") or "") for message in messages)
+        rule = next((rule for rule in self.rules if rule.matches(text)), self.default)
+        with self._lock:
+            self.stats["chat"] += 1
+            self.stats["rules"][rule.name] = self.stats["rules"].get(rule.name, 0) + 1
+            return rule.pick(self.random), (rule.latency or self.chat_latency).sample(self.random)
+
+    def speech_delays(self) -> tuple:
+        """(first byte delay, per-chunk interval) in seconds for a speech request"""
+        with self._lock:
+            self.stats["speech"] += 1
+            return self.tts_first_byte.sample(self.random), self.tts_chunk_interval.sample(self.random)
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {"chat": self.stats["chat"], "speech": self.stats["speech"], "rules": dict(self.stats["rules"])}
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    script: MockScript = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'gpt-4.1-mini', 'object': 'model', 'owned_by': 'mock'},
+                                                              {'id': 'tts-1', 'object': 'model', 'owned_by': 'mock'}]})
+        elif path == '/mock/stats':
+            self._send_json(200, self.script.snapshot_stats())
+        else:
+            self._send_json(404, {'error': {'message': f'No mock for {self.path}', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        try:
+            if path.endswith('/chat/completions'):
+                self._chat_completion(self._read_json())
+            elif path.endswith('/audio/speech'):
+                self._speech(self._read_json())
+            else:
+                self._send_json(404, {'error': {'message': f'No mock for {self.path}', 'type': 'invalid_request_error'}})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client aborted a streamed response (cancelled intervention)
+
+    def _chat_completion(self, body: dict):
+        messages = body.get('messages') or []
+        content, delay = self.script.answer(messages)
+
+        completion_id = f"chatcmpl-mock-{time.time_ns()}"
+        model = body.get('model', 'mock')
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            # Like the real API, stream headers go out at once and the latency is spent before the first token
+            self.wfile.flush()
+            time.sleep(delay)
+            for index, piece in enumerate(re.findall(r'\S+\s*', content) or ['']):
+                delta = {'role': 'assistant', 'content': piece} if index == 0 else {'content': piece}
+                event = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                         'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            final = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                     'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode())
+            if (body.get('stream_options') or {}).get('include_usage'):
+                usage = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [],
+                         'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                   'total_tokens': prompt_tokens + completion_tokens}}
+                self._write_chunk(f"data: {json.dumps(usage)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(delay)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        })
+
+    def _speech(self, body: dict):
+        text = body.get('input', '')
+        first_byte, chunk_interval = self.script.speech_delays()
+        time.sleep(first_byte)
+        if body.get('response_format') != 'pcm':
+            audio = b'\xff\xfb' + bytes(1022)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+            return
+
+        total = int(len(text) / SPOKEN_CHARS_PER_SECOND * PCM_BYTES_PER_SECOND) or PCM_CHUNK_SIZE
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/pcm')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        sent = 0
+        while sent < total:
+            chunk = bytes(min(PCM_CHUNK_SIZE, total - sent))
+            self._write_chunk(chunk)
+            sent += len(chunk)
+            time.sleep(chunk_interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_mock_server(port: int = 0, script: MockScript = None, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve the mock on a daemon thread; the base URL is http://host:server.server_port/v1"""
+    handler = type('ScriptedMockOpenAIHandler', (MockOpenAIHandler,), {'script': script or MockScript()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--script', help="JSON script (defaults to DEFAULT_SCRIPT)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--print-default-script', action='store_true')
+    args = parser.parse_args()
+
+    if args.print_default_script:
+        print(json.dumps(DEFAULT_SCRIPT, indent=2))
+        return
+
+    script = MockScript.from_file(args.script, args.seed) if args.script else MockScript(seed=args.seed)
+    server = start_mock_server(args.port, script, args.host)
+    print(f"🧪 Mock OpenAI server on http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Progress Sweep - One scheduler for the progress checks of all rooms
+
+A user message enrolls its room for a progress check progress_check_interval seconds later (later
+messages do not push a scheduled check back). Instead of a timer thread per room, a single sweep
+thread wakes every PROGRESS_SWEEP_INTERVAL seconds and collects the rooms that are due. A room
+whose activity mark (latest user message, code revision, last run) is unchanged since its previous
+check is dropped without an LLM call. The rest are dispatched to a bounded worker pool, at most
+PROGRESS_SWEEP_MAX_PER_SWEEP per sweep; the others stay due for the next sweep, oldest first.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ai_models import ConversationContext
+from .metrics import PROGRESS_SWEEP_ROOMS
+from .tracing import propagate
+from config.logging_config import get_logger
+
+log = get_logger(__name__)
+
+PROGRESS_SWEEP_INTERVAL = float(os.environ.get('PROGRESS_SWEEP_INTERVAL', '5'))
+PROGRESS_SWEEP_WORKERS = int(os.environ.get('PROGRESS_SWEEP_WORKERS', '4'))
+PROGRESS_SWEEP_MAX_PER_SWEEP = int(os.environ.get('PROGRESS_SWEEP_MAX_PER_SWEEP', '20'))
+
+
+def activity_mark(context: ConversationContext) -> Tuple:
+    """Cheap marker of user activity in a room: changes with user messages, code and runs, not AI messages"""
+    with context.lock:
+        last_user_message = next(((message.id, message.timestamp) for message in reversed(context.messages)
+                                  if message.userId != 'ai_agent_bob'), None)
+        return last_user_message, context.code_revision, context.last_execution_time
+
+
+class ProgressSweep:
+    """Due times of rooms' progress checks, swept and dispatched by one background thread"""
+
+    def __init__(self, check_room: Callable[[str], None], get_context: Callable[[str], Optional[ConversationContext]],
+                 interval: float = PROGRESS_SWEEP_INTERVAL, workers: int = PROGRESS_SWEEP_WORKERS,
+                 max_per_sweep: int = PROGRESS_SWEEP_MAX_PER_SWEEP):
+        self.check_room = check_room
+        self.get_context = get_context
+        self.interval = interval
+        self.max_per_sweep = max_per_sweep
+        self.due: Dict[str, float] = {}        # room_id -> monotonic time its check is due
+        self.checked: Dict[str, Tuple] = {}    # room_id -> activity mark its last check saw
+        self.running = set()                   # rooms whose check is being made
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="progress-check")
+        self._thread = None
+
+    def schedule(self, room_id: str, delay: float, now: float = None) -> bool:
+        """Make the room due delay seconds from now; False if a check is already scheduled"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if room_id in self.due:
+                return False
+            self.due[room_id] = now + delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-sweep", daemon=True)
+                self._thread.start()
+        return True
+
+    def cancel(self, room_id: str) -> bool:
+        """Drop the room's scheduled check; False if none was scheduled"""
+        with self._lock:
+            return self.due.pop(room_id, None) is not None
+
+    def forget(self, room_id: str):
+        """Drop everything kept for a room (room cleanup)"""
+        with self._lock:
+            self.due.pop(room_id, None)
+            self.checked.pop(room_id, None)
+
+    def is_scheduled(self, room_id: str) -> bool:
+        return room_id in self.due
+
+    def scheduled_rooms(self) -> List[str]:
+        with self._lock:
+            return list(self.due)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                log.exception("❌ Progress sweep failed: %s", e)
+
+    def sweep(self, now: float = None) -> List[str]:
+        """Dispatch the checks of the rooms due by now; returns the dispatched rooms"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = sorted((at, room_id) for room_id, at in self.due.items() if at <= now and room_id not in self.running)
+
+        batch = []
+        for at, room_id in due:
+            context = self.get_context(room_id)
+            mark = activity_mark(context) if context is not None else None
+            if mark is not None and mark != self.checked.get(room_id) and len(batch) >= self.max_per_sweep:
+                PROGRESS_SWEEP_ROOMS.inc(outcome='deferred')
+                continue
+            with self._lock:
+                if self.due.get(room_id) != at:
+                    continue  # cancelled or rescheduled meanwhile
+                del self.due[room_id]
+                if mark is None or mark == self.checked.get(room_id):
+                    PROGRESS_SWEEP_ROOMS.inc(outcome='unchanged')
+                    log.debug("📊 Progress check skipped for room %s: no activity since the last check", room_id)
+                    continue
+                self.checked[room_id] = mark
+                self.running.add(room_id)
+            batch.append(room_id)
+
+        for room_id in batch:
+            PROGRESS_SWEEP_ROOMS.inc(outcome='dispatched')
+            self._pool.submit(propagate(self._check), room_id)
+        if batch:
+            log.debug("📊 Progress sweep dispatched %d of %d due rooms", len(batch), len(due))
+        return batch
+
+    def _check(self, room_id: str):
+        try:
+            self.check_room(room_id)
+        except Exception as e:
+            log.exception("❌ Error in progress check for room %s: %s", room_id, e)
+        finally:
+            with self._lock:
+                self.running.discard(room_id)
@@ -0,0 +1,183 @@
+"""
+Response Cache - Opt-in semantic cache of direct-mention answers per problem
+
+Students in different rooms working on the same problem ask near-identical questions ("@bob how
+do I start two sum?"). Answers to direct mentions are cached per problem title; a new question is
+vectorized with hashed TF-IDF (word unigrams and bigrams, IDF over the problem's cached questions)
+and compared by cosine similarity to the cached ones that share a term. A hit above the threshold
+is answered without an LLM call. Sparse vectors in plain dicts keep it dependency-free and fast for
+the small partitions involved (at most SEMANTIC_CACHE_MAX_ENTRIES questions per problem).
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+MAX_PARTITIONS = 200         # problems with cached answers (least recently used dropped)
+HASH_BUCKETS = 1 << 20       # feature hashing space
+MIN_QUESTION_TERMS = 3       # two content words and their bigram; "@bob help?" is never matched
+
+_WORD = re.compile(r"[a-z0-9_]+")
+# Words that carry no meaning for matching questions (including ways of addressing the AI)
+_STOPWORDS = frozenset("""
+a an the is are was were be been am i you we it this that these those to of in on for with and or but
+my our your me us do does did can could should would will how what why when where which who please
+hey hi hello bob ai just so if im its there here some any about
+""".split())
+
+
+def normalize_problem(title: str) -> str:
+    return ' '.join(_WORD.findall(title.lower()))
+
+
+def question_terms(text: str) -> Dict[int, int]:
+    """Hashed term frequencies of a question (unigrams and bigrams of non-stopwords, mentions removed)"""
+    words = [word for word in _WORD.findall(re.sub(r'@\w+', ' ', text.lower())) if word not in _STOPWORDS]
+    terms: Dict[int, int] = {}
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        key = zlib.crc32(token.encode()) % HASH_BUCKETS
+        terms[key] = terms.get(key, 0) + 1
+    return terms
+
+
+@dataclass(slots=True)
+class CachedAnswer:
+    question: str
+    answer: str
+    terms: Dict[int, int]
+    created: float
+    latency: float  # seconds the LLM took to produce the answer (saved on every hit)
+    hits: int = 0
+
+
+@dataclass(slots=True)
+class _Partition:
+    """Cached answers for one problem with an inverted index term -> answers"""
+    entries: "OrderedDict[int, CachedAnswer]" = field(default_factory=OrderedDict)
+    postings: Dict[int, Set[int]] = field(default_factory=dict)
+    next_id: int = 0
+
+    def add(self, entry: CachedAnswer, max_entries: int):
+        entry_id, self.next_id = self.next_id, self.next_id + 1
+        self.entries[entry_id] = entry
+        for term in entry.terms:
+            self.postings.setdefault(term, set()).add(entry_id)
+        while len(self.entries) > max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        for term in entry.terms:
+            ids = self.postings.get(term)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.postings[term]
+
+    def expire(self, cutoff: float):
+        while self.entries:
+            entry_id, entry = next(iter(self.entries.items()))
+            if entry.created >= cutoff:
+                break
+            self.remove(entry_id)
+
+    def idf(self, term: int) -> float:
+        return math.log((1 + len(self.entries)) / (1 + len(self.postings.get(term, ())))) + 1
+
+
+def _weights(terms: Dict[int, int], partition: _Partition) -> Dict[int, float]:
+    return {term: count * partition.idf(term) for term, count in terms.items()}
+
+
+def _norm(weights: Dict[int, float]) -> float:
+    return math.sqrt(sum(weight * weight for weight in weights.values()))
+
+
+@dataclass(frozen=True, slots=True)
+class CacheHit:
+    answer: str
+    similarity: float
+    question: str
+    saved_seconds: float
+
+
+class SemanticResponseCache:
+    """Per-problem cache of answers to direct questions, matched by TF-IDF cosine similarity"""
+
+    def __init__(self, threshold: float = 0.85, ttl_seconds: float = 3600, max_entries: int = 200):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, problem_title: str, question: str) -> Optional[CacheHit]:
+        """Best cached answer for a question at or above the similarity threshold"""
+        problem = normalize_problem(problem_title or '')
+        terms = question_terms(question)
+        if not problem or len(terms) < MIN_QUESTION_TERMS:
+            return None
+        with self._lock:
+            partition = self._partitions.get(problem)
+            if partition is None:
+                return None
+            self._partitions.move_to_end(problem)
+            partition.expire(time.time() - self.ttl_seconds)
+
+            candidates = set()
+            for term in terms:
+                candidates.update(partition.postings.get(term, ()))
+            if not candidates:
+                return None
+            query = _weights(terms, partition)
+            query_norm = _norm(query)
+            best, best_similarity = None, 0.0
+            for entry_id in candidates:
+                entry = partition.entries[entry_id]
+                weights = _weights(entry.terms, partition)
+                dot = sum(weight * weights.get(term, 0.0) for term, weight in query.items())
+                similarity = dot / (query_norm * _norm(weights) or 1.0)
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+            if best is None or best_similarity < self.threshold:
+                return None
+            best.hits += 1
+            return CacheHit(best.answer, best_similarity, best.question, best.latency)
+
+    def store(self, problem_title: str, question: str, answer: str, latency: float = 0.0):
+        """Cache the answer to a direct question"""
+        problem = normalize_problem(problem_title or '')
+        terms = question_terms(question)
+        if not problem or len(terms) < MIN_QUESTION_TERMS or not answer:
+            return
+        with self._lock:
+            partition = self._partitions.get(problem)
+            if partition is None:
+                partition = self._partitions[problem] = _Partition()
+                while len(self._partitions) > MAX_PARTITIONS:
+                    self._partitions.popitem(last=False)
+            else:
+                self._partitions.move_to_end(problem)
+            partition.add(CachedAnswer(question, answer, terms, time.time(), latency), self.max_entries)
+
+
+def is_semantic_cache_enabled() -> bool:
+    """Check if direct-mention answers are served from the semantic cache"""
+    return os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+
+
+def semantic_cache_from_env() -> Optional[SemanticResponseCache]:
+    """The configured cache, or None when it is disabled"""
+    if not is_semantic_cache_enabled():
+        return None
+    return SemanticResponseCache(
+        threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.85)),
+        ttl_seconds=float(os.environ.get('SEMANTIC_CACHE_TTL_SECONDS', 3600)),
+        max_entries=int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 200)),
+    )
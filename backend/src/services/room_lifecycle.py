@@ -0,0 +1,318 @@
+"""
+Room Lifecycle - Bounded per-room AI state with idle eviction
+
+Every per-room dictionary held by the AI services is a RoomStateStore registered with the
+global RoomLifecycleManager. State is evicted when:
+  - the last user leaves a room and it stays empty for the grace period
+  - an entry of an empty room has not been touched for the TTL
+  - a store exceeds its size bound (least recently used empty room first)
+Rooms with connected users are never evicted.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+def base_room_id(room_id: str) -> str:
+    """Map a personal room (room_personal_user) back to the shared room it belongs to"""
+    return room_id.split('_personal_')[0] if room_id else room_id
+
+
+def approximate_size(obj: Any, _seen: set = None) -> int:
+    """Approximate deep size in bytes of containers, dataclasses and plain objects"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approximate_size(k, seen) + approximate_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(approximate_size(item, seen) for item in obj)
+    if is_dataclass(obj):
+        return size + sum(approximate_size(getattr(obj, f.name, None), seen) for f in fields(obj))
+    if hasattr(obj, '__dict__'):
+        return size + approximate_size(vars(obj), seen)
+    return size
+
+
+class RoomStateStore(MutableMapping):
+    """
+    Thread-safe dict replacement holding per-room state, ordered by last access.
+
+    Args:
+        name: Store name used in metrics and logs
+        room_of: Maps (key, value) to the owning room id (defaults to the key itself)
+        on_evict: Called as on_evict(key, value, reason) after an entry is evicted
+    """
+
+    def __init__(self, name: str, max_entries: int = None, ttl_seconds: float = None,
+                 room_of: Callable[[str, Any], str] = None,
+                 on_evict: Callable[[str, Any, str], None] = None, lifecycle=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.room_of = room_of or (lambda key, value: key)
+        self.on_evict = on_evict
+        self.lifecycle = lifecycle or get_room_lifecycle()
+
+        self._data = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+        self.lifecycle.register_store(self)
+
+    # MutableMapping interface
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._data[key]
+            self._data.move_to_end(key)
+            self._last_access[key] = time.monotonic()
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._last_access[key] = time.monotonic()
+        self._enforce_limit()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            self._last_access.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        # Iterate over a snapshot so other threads can mutate the store meanwhile
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"RoomStateStore(name={self.name}, entries={len(self._data)})"
+
+    def get_or_create(self, key, factory: Callable[[], Any]):
+        """Atomically return the entry for key, creating it with factory() if missing"""
+        with self._lock:
+            if key in self._data:
+                return self[key]
+            value = factory()
+            self._data[key] = value
+            self._last_access[key] = time.monotonic()
+        self._enforce_limit()
+        return value
+
+    def _room(self, key, value) -> str:
+        return base_room_id(self.room_of(key, value))
+
+    def _evict(self, keys: List[str], reason: str) -> int:
+        evicted = []
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    evicted.append((key, self._data.pop(key)))
+                    self._last_access.pop(key, None)
+            self.evictions += len(evicted)
+        for key, value in evicted:
+            if self.on_evict:
+                try:
+                    self.on_evict(key, value, reason)
+                except Exception as e:
+                    print(f"❌ Error in {self.name} eviction callback for {key}: {e}")
+        return len(evicted)
+
+    def evict_room(self, room_id: str, reason: str) -> int:
+        """Evict every entry belonging to a room (including its personal rooms)"""
+        with self._lock:
+            keys = [key for key, value in self._data.items() if self._room(key, value) == room_id]
+        return self._evict(keys, reason)
+
+    def expire_idle(self) -> int:
+        """Evict entries of empty rooms that have been idle longer than the TTL"""
+        if not self.ttl_seconds:
+            return 0
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            keys = [
+                key for key, value in self._data.items()
+                if self._last_access.get(key, 0) < cutoff and not self.lifecycle.is_occupied(self._room(key, value))
+            ]
+        return self._evict(keys, "idle TTL")
+
+    def _enforce_limit(self):
+        if not self.max_entries or len(self._data) <= self.max_entries:
+            return
+        with self._lock:
+            overflow = len(self._data) - self.max_entries
+            # Oldest first; occupied rooms are skipped so active sessions never lose state
+            keys = [
+                key for key, value in self._data.items()
+                if not self.lifecycle.is_occupied(self._room(key, value))
+            ][:overflow]
+        if self._evict(keys, "size limit") < overflow:
+            print(f"⚠️  {self.name} holds {len(self._data)} entries for occupied rooms (limit {self.max_entries})")
+
+    def memory_by_room(self) -> Dict[str, int]:
+        """Approximate bytes held per room"""
+        with self._lock:
+            items = list(self._data.items())
+        usage: Dict[str, int] = {}
+        for key, value in items:
+            room = self._room(key, value)
+            usage[room] = usage.get(room, 0) + approximate_size(key) + approximate_size(value)
+        return usage
+
+
+class RoomLifecycleManager:
+    """Tracks room occupancy and evicts per-room state from all registered stores"""
+
+    def __init__(self, grace_seconds: float = 300, sweep_interval: float = 60):
+        self.grace_seconds = grace_seconds
+        self.sweep_interval = sweep_interval
+
+        self._stores: List[RoomStateStore] = []
+        self._rehydrators: List[Callable[[str], None]] = []
+        self._occupied = set()
+        self._eviction_timers: Dict[str, threading.Timer] = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def register_store(self, store: RoomStateStore):
+        """Register a store for room eviction, TTL sweeps and metrics"""
+        with self._lock:
+            self._stores.append(store)
+            if self._sweeper is None and self.sweep_interval:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="room-lifecycle-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def add_rehydrator(self, callback: Callable[[str], None]):
+        """Register a callback run when a room becomes occupied (e.g. to restore spilled state)"""
+        self._rehydrators.append(callback)
+
+    def is_occupied(self, room_id: str) -> bool:
+        return base_room_id(room_id) in self._occupied
+
+    def room_joined(self, room_id: str):
+        """First user joined a room - cancel pending eviction and restore spilled state"""
+        with self._lock:
+            self._occupied.add(room_id)
+            timer = self._eviction_timers.pop(room_id, None)
+        if timer:
+            timer.cancel()
+            print(f"♻️  Room {room_id} re-occupied - eviction cancelled")
+        for rehydrate in self._rehydrators:
+            try:
+                rehydrate(room_id)
+            except Exception as e:
+                print(f"❌ Error rehydrating room {room_id}: {e}")
+
+    def room_emptied(self, room_id: str):
+        """Last user left a room - evict its state after the grace period"""
+        timer = threading.Timer(self.grace_seconds, self._evict_if_empty, args=(room_id,))
+        timer.daemon = True
+        with self._lock:
+            self._occupied.discard(room_id)
+            previous = self._eviction_timers.pop(room_id, None)
+            self._eviction_timers[room_id] = timer
+        if previous:
+            previous.cancel()
+        timer.start()
+        print(f"⏳ Room {room_id} is empty - evicting AI state in {self.grace_seconds:.0f}s")
+
+    def _evict_if_empty(self, room_id: str):
+        with self._lock:
+            self._eviction_timers.pop(room_id, None)
+            if room_id in self._occupied:
+                return
+        self.evict_room(room_id, "room empty")
+
+    def evict_room(self, room_id: str, reason: str = "manual") -> int:
+        """Evict a room's state from every registered store"""
+        evicted = sum(store.evict_room(room_id, reason) for store in list(self._stores))
+        if evicted:
+            print(f"🧹 Evicted {evicted} state entries for room {room_id} ({reason})")
+        return evicted
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            for store in list(self._stores):
+                try:
+                    expired = store.expire_idle()
+                    if expired:
+                        print(f"🧹 Expired {expired} idle entries from {store.name}")
+                except Exception as e:
+                    print(f"❌ Error sweeping {store.name}: {e}")
+
+    def memory_stats(self, room_id: str = None) -> Dict[str, Any]:
+        """Per-room and per-store entry counts and approximate memory"""
+        rooms: Dict[str, Dict[str, int]] = {}
+        stores = {}
+        for store in list(self._stores):
+            usage = store.memory_by_room()
+            stores[store.name] = {
+                'entries': len(store),
+                'bytes': sum(usage.values()),
+                'evictions': store.evictions,
+                'max_entries': store.max_entries,
+                'ttl_seconds': store.ttl_seconds
+            }
+            for room, size in usage.items():
+                if room_id is None or room == room_id:
+                    rooms.setdefault(room, {})[store.name] = size
+
+        return {
+            'occupied_rooms': len(self._occupied),
+            'pending_evictions': len(self._eviction_timers),
+            'grace_seconds': self.grace_seconds,
+            'stores': stores,
+            'rooms': {
+                room: {'total_bytes': sum(sizes.values()), 'occupied': room in self._occupied, 'stores': sizes}
+                for room, sizes in sorted(rooms.items(), key=lambda item: -sum(item[1].values()))
+            }
+        }
+
+
+def is_room_spill_enabled():
+    """Check if evicted conversation contexts should be spilled to MongoDB for rehydration"""
+    return os.environ.get('ROOM_STATE_SPILL', 'false').lower() == 'true'
+
+
+def room_state_limits() -> Dict[str, Optional[float]]:
+    """Store bounds from the environment"""
+    return {
+        'max_entries': int(os.environ.get('ROOM_STATE_MAX_ROOMS', 2000)),
+        'ttl_seconds': float(os.environ.get('ROOM_STATE_TTL_SECONDS', 6 * 3600))
+    }
+
+
+# Global lifecycle manager instance
+room_lifecycle = None
+_lifecycle_lock = threading.Lock()
+
+def get_room_lifecycle() -> RoomLifecycleManager:
+    """Get the global room lifecycle manager"""
+    global room_lifecycle
+    if room_lifecycle is None:
+        with _lifecycle_lock:
+            if room_lifecycle is None:
+                room_lifecycle = RoomLifecycleManager(
+                    grace_seconds=float(os.environ.get('ROOM_EVICTION_GRACE_SECONDS', 300)),
+                    sweep_interval=float(os.environ.get('ROOM_STATE_SWEEP_INTERVAL', 60))
+                )
+    return room_lifecycle
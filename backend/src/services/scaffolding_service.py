@@ -3,26 +3,20 @@ Scaffolding Service - Uses LLM to generate code scaffolding from user comments
 Simple approach: detect comment, ask LLM if scaffolding is needed, generate if yes
 """
 
-import os
-from openai import OpenAI
 from typing import Optional, Dict
 
+from .llm_provider import create_openai_client
+from .metrics import chat_completion
+from .code_context import select_code_context
+
 class ScaffoldingService:
     def __init__(self):
         # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("⚠️  Warning: No OpenAI API key found. Scaffolding will be disabled.")
-            self.client = None
-        else:
-            try:
-                self.client = OpenAI(api_key=api_key)
-                print("✅ Scaffolding Service initialized successfully!")
-            except Exception as e:
-                print(f"❌ Error initializing OpenAI client: {e}")
-                self.client = None
+        self.client = create_openai_client("Scaffolding")
+        if self.client:
+            print("✅ Scaffolding Service initialized successfully!")
     
-    def generate_scaffolding(self, comment_line: str, language: str, full_code: str = "") -> Optional[Dict]:
+    def generate_scaffolding(self, comment_line: str, language: str, full_code: str = "", cursor_line: int = None) -> Optional[Dict]:
         """
         Send comment to LLM to check if scaffolding is needed and generate it
         Returns dict with scaffolding info or None if no scaffolding needed
@@ -31,6 +25,9 @@ class ScaffoldingService:
             return None
             
         try:
+            # Large files: the comment's scope and what it references, within the token budget
+            full_code = select_code_context(full_code, language, () if cursor_line is None else (cursor_line,), comment_line)
+
             # Create prompt for LLM
             prompt = f"""You are a coding tutor that creates minimal scaffolding to help students learn by doing.
 
@@ -83,7 +80,8 @@ class ScaffoldingService:
                         - Specific values or algorithms
                         """
 
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'scaffolding',
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "You are a coding tutor that creates minimal scaffolding. Never provide complete solutions - only structure with blanks for students to fill in."},
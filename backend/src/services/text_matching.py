@@ -0,0 +1,68 @@
+"""
+Text Matching - Compiled keyword matchers for chat message classification
+
+Each pattern set is compiled once into a single alternation regex over lowercased text, so a message
+is scanned in one pass instead of once per pattern. Matches respect word boundaries:
+    boundary='word'    whole words/phrases only ('bob' matches "bob," but not "bobby")
+    boundary='prefix'  start of a word only, so stems keep matching inflections ('loop' matches "looping")
+Results can be cached by message id, so each message is classified once per matcher however often
+timers and checks look at it.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+MATCH_CACHE_SIZE = 4096
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class KeywordMatcher:
+    """One compiled regex per pattern set, with an optional per-message-id result cache"""
+
+    def __init__(self, patterns: Iterable[str], boundary: str = 'word', cache_size: int = MATCH_CACHE_SIZE):
+        self.patterns = tuple(dict.fromkeys(p.lower() for p in patterns))
+        # Longest first so overlapping phrases ('hey bob' / 'bob') report the longest match
+        alternation = '|'.join(re.escape(p) for p in sorted(self.patterns, key=len, reverse=True))
+        suffix = r'(?!\w)' if boundary == 'word' else ''
+        # No leading lookbehind and no IGNORECASE: both disable the regex engine's literal prefix scan,
+        # which makes matching several times slower. The start-of-word check is done in search().
+        self._regex = re.compile(rf'(?:{alternation}){suffix}')
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def search(self, text: str) -> Optional[str]:
+        """First matching pattern in text, or None"""
+        if not text:
+            return None
+        text = text.lower()
+        position = 0
+        while True:
+            match = self._regex.search(text, position)
+            if not match:
+                return None
+            start = match.start()
+            if start == 0 or not _is_word_char(text[start - 1]):
+                return match.group(0)
+            position = start + 1
+
+    def matches(self, text: str, key: Optional[str] = None) -> bool:
+        """True if any pattern occurs in text; key (a message id) caches the result"""
+        if not key:
+            return self.search(text) is not None
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and (cached[0] is text or cached[0] == text):
+                self._cache.move_to_end(key)
+                return cached[1]
+        result = self.search(text) is not None
+        with self._lock:
+            self._cache[key] = (text, result)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
@@ -3,26 +3,20 @@ TODO Reveal Service - Uses LLM to generate specific code implementations for TOD
 This service analyzes the entire function context and TODO comment to generate targeted code
 """
 
-import os
-from openai import OpenAI
 from typing import Optional, Dict
 
+from .llm_provider import create_openai_client
+from .metrics import chat_completion
+from .code_context import select_code_context
+
 class TodoRevealService:
     def __init__(self):
         # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("⚠️  Warning: No OpenAI API key found. TODO reveal will be disabled.")
-            self.client = None
-        else:
-            try:
-                self.client = OpenAI(api_key=api_key)
-                print("✅ TODO Reveal Service initialized successfully!")
-            except Exception as e:
-                print(f"❌ Error initializing OpenAI client: {e}")
-                self.client = None
+        self.client = create_openai_client("TODO reveal")
+        if self.client:
+            print("✅ TODO Reveal Service initialized successfully!")
     
-    def generate_todo_code(self, todo_line: str, language: str, full_code: str = "", problem_context: str = "") -> Optional[Dict]:
+    def generate_todo_code(self, todo_line: str, language: str, full_code: str = "", problem_context: str = "", cursor_line: int = None) -> Optional[Dict]:
         """
         Send TODO comment to LLM to generate specific code implementation
         Returns dict with generated code or None if not applicable
@@ -37,6 +31,9 @@ class TodoRevealService:
             return None
             
         try:
+            # Large files: the function around the TODO and what it references, within the token budget
+            full_code = select_code_context(full_code, language, () if cursor_line is None else (cursor_line,), todo_text)
+
             # Create prompt for LLM
             prompt = f"""You are a coding assistant that helps implement specific TODO items within existing functions.
 
@@ -101,7 +98,8 @@ Response:
 arr.sort()
 """
 
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client, 'todo_reveal',
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "You are a precise coding assistant. Generate only ONE LINE of code needed to replace a TODO comment, with no extra explanations or formatting."},
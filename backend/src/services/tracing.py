@@ -0,0 +1,334 @@
+"""
+Tracing - lightweight end-to-end latency spans from user message to AI reply and audio
+
+A trace starts at socket ingress (start_trace) and follows the work through background
+threads and timers (propagate) via contextvars. Stages record spans (span); stages that
+finish on a later event, like client audio playback, use open_span/finish_pending.
+
+Recent traces are kept per room for /api/debug/traces/<room_id> and, optionally, exported
+as JSON lines to a file and/or as OTLP/HTTP JSON to a collector.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .room_lifecycle import RoomStateStore, base_room_id, room_state_limits
+
+MAX_SPANS_PER_TRACE = 200
+MAX_PENDING_SPANS = 1000
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+def is_tracing_enabled():
+    """Check if request tracing is enabled"""
+    return os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    room_id: str
+    start: float  # epoch seconds
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = 'ok'
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return (self.end - self.start) * 1000 if self.end is not None else None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'room_id': self.room_id,
+            'start': self.start,
+            'end': self.end,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'status': self.status
+        }
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    room_id: str
+    started: float
+    spans: List[Span] = field(default_factory=list)
+
+    def waterfall(self) -> dict:
+        """Spans ordered by start with offsets relative to the trace start"""
+        spans = sorted(list(self.spans), key=lambda s: s.start)
+        ends = [s.end for s in spans if s.end is not None]
+        return {
+            'trace_id': self.trace_id,
+            'room_id': self.room_id,
+            'started': self.started,
+            'total_ms': round((max(ends) - self.started) * 1000, 2) if ends else None,
+            'spans': [
+                {
+                    'name': s.name,
+                    'span_id': s.span_id,
+                    'parent_id': s.parent_id,
+                    'offset_ms': round((s.start - self.started) * 1000, 2),
+                    'duration_ms': round(s.duration_ms, 2) if s.duration_ms is not None else None,
+                    'status': s.status,
+                    'attributes': s.attributes
+                }
+                for s in spans
+            ]
+        }
+
+
+class SpanExporter:
+    """Background exporter writing finished spans as JSON lines and/or OTLP/HTTP JSON"""
+
+    def __init__(self, file_path: str = None, otlp_endpoint: str = None, batch_size: int = 100):
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            try:
+                if self.file_path:
+                    with open(self.file_path, 'a', encoding='utf-8') as f:
+                        for span in batch:
+                            f.write(json.dumps(span.to_dict(), default=str) + '\n')
+                if self.otlp_endpoint:
+                    self._post_otlp(batch)
+            except Exception as e:
+                print(f"❌ Error exporting {len(batch)} spans: {e}")
+
+    def _post_otlp(self, batch: List[Span]):
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {'key': key, 'value': {'boolValue': value}}
+            if isinstance(value, int):
+                return {'key': key, 'value': {'intValue': str(value)}}
+            if isinstance(value, float):
+                return {'key': key, 'value': {'doubleValue': value}}
+            return {'key': key, 'value': {'stringValue': str(value)}}
+
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', 'pair-programming-backend')]},
+            'scopeSpans': [{
+                'scope': {'name': 'services.tracing'},
+                'spans': [{
+                    'traceId': span.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'kind': 1,
+                    'startTimeUnixNano': str(int(span.start * 1e9)),
+                    'endTimeUnixNano': str(int((span.end or span.start) * 1e9)),
+                    'attributes': [attribute('room_id', span.room_id)] + [attribute(k, v) for k, v in span.attributes.items()],
+                    'status': {'code': 2 if span.status == 'error' else 1}
+                } for span in batch]
+            }]
+        }]}
+        request = urllib.request.Request(
+            self.otlp_endpoint, data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+class Tracer:
+    """Creates spans, keeps recent traces per room and hands finished spans to the exporter"""
+
+    def __init__(self, traces_per_room: int = 20, sample_rate: float = 1.0, exporter: SpanExporter = None):
+        self.traces_per_room = traces_per_room
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self._traces: Dict[str, Trace] = {}  # trace_id -> Trace (only traces still held by a room)
+        self._recent = RoomStateStore(  # base room id -> deque of recent traces
+            'recent_traces', on_evict=self._on_room_evicted, **room_state_limits()
+        )
+        self._pending: Dict[str, Span] = OrderedDict()  # key -> span finished by a later event (oldest first)
+        self._lock = threading.Lock()
+
+    def _on_room_evicted(self, room_id: str, traces, reason: str):
+        with self._lock:
+            for trace in traces:
+                self._traces.pop(trace.trace_id, None)
+
+    def _new_span(self, name: str, parent: Optional[Span], room_id: str = None, **attributes) -> Span:
+        if parent is not None:
+            return Span(parent.trace_id, secrets.token_hex(8), parent.span_id, name,
+                        room_id or parent.room_id, time.time(), attributes=attributes)
+        return Span(secrets.token_hex(16), secrets.token_hex(8), None, name, room_id, time.time(), attributes=attributes)
+
+    def _record(self, span: Span):
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+        if trace is not None and len(trace.spans) < MAX_SPANS_PER_TRACE:
+            trace.spans.append(span)
+
+    def _finish(self, span: Span, status: str = None):
+        span.end = time.time()
+        if status:
+            span.status = status
+        if self.exporter:
+            self.exporter.export(span)
+
+    @contextmanager
+    def start_trace(self, name: str, room_id: str, **attributes):
+        """Root span for one unit of work entering the system (e.g. a chat message)"""
+        if not room_id or random.random() >= self.sample_rate:
+            yield None
+            return
+        span = self._new_span(name, None, room_id, **attributes)
+        trace = Trace(span.trace_id, room_id, span.start, [span])
+        room = base_room_id(room_id)
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+        recent = self._recent.get_or_create(room, lambda: deque(maxlen=self.traces_per_room))
+        if len(recent) == recent.maxlen:
+            with self._lock:
+                self._traces.pop(recent[0].trace_id, None)
+        recent.append(trace)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception:
+            self._finish(span, 'error')
+            raise
+        else:
+            self._finish(span)
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Child span of the current span (no-op outside a trace)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = self._new_span(name, parent, **attributes)
+        self._record(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception:
+            self._finish(span, 'error')
+            raise
+        else:
+            self._finish(span)
+        finally:
+            _current_span.reset(token)
+
+    def open_span(self, name: str, key: str = None, **attributes) -> Optional[Span]:
+        """Start a child span finished later by finish_span/finish_pending (e.g. timer waits, playback)"""
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        span = self._new_span(name, parent, **attributes)
+        self._record(span)
+        if key:
+            with self._lock:
+                self._pending[key] = span
+                # Clients that never report back must not leak spans
+                while len(self._pending) > MAX_PENDING_SPANS:
+                    self._pending.popitem(last=False)
+        return span
+
+    def finish_span(self, span: Optional[Span], **attributes):
+        if span is not None and span.end is None:
+            span.set(**attributes)
+            self._finish(span)
+
+    def finish_pending(self, key: str, **attributes) -> bool:
+        """Finish a span opened with a key (from any thread or request)"""
+        with self._lock:
+            span = self._pending.pop(key, None)
+        self.finish_span(span, **attributes)
+        return span is not None
+
+    def recent_traces(self, room_id: str, limit: int = None) -> List[dict]:
+        """Waterfalls of a room's recent traces, newest first"""
+        recent = self._recent.get(base_room_id(room_id))
+        traces = list(reversed(recent)) if recent else []
+        if room_id != base_room_id(room_id):
+            traces = [t for t in traces if t.room_id == room_id]
+        return [trace.waterfall() for trace in traces[:limit]]
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Set attributes on the current span (no-op outside a trace)"""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Bind fn to the caller's trace context so it can run on another thread or a timer"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+# Global tracer instance
+tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """Get the global tracer"""
+    global tracer
+    if tracer is None:
+        with _tracer_lock:
+            if tracer is None:
+                file_path = os.environ.get('TRACE_EXPORT_FILE')
+                otlp_endpoint = os.environ.get('TRACE_OTLP_ENDPOINT')
+                tracer = Tracer(
+                    traces_per_room=int(os.environ.get('TRACES_PER_ROOM', 20)),
+                    sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 1.0)) if is_tracing_enabled() else 0.0,
+                    exporter=SpanExporter(file_path, otlp_endpoint) if (file_path or otlp_endpoint) else None
+                )
+    return tracer
@@ -0,0 +1,223 @@
+"""
+Usage Governor - Token and TTS accounting per room and per deployment, with degradation tiers
+
+Every chat completion reports the token usage from its API response, and every TTS request its
+input characters, attributed to the room the work runs for (usage_scope, falling back to the
+room of the current trace). Usage is kept in per-minute buckets over a rolling window.
+
+When a room or the whole deployment approaches its budget the AI degrades instead of stopping:
+automatic progress checks are skipped first, then prompts are shortened, then replies are sent as
+text without voice. A budget of 0 is unlimited; accounting always runs and is reported at
+/api/usage.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, Optional, Tuple
+
+from .room_lifecycle import base_room_id, room_state_limits
+from .tracing import current_span
+
+BUCKET_SECONDS = 60
+COMPACT_PROMPT_SCALE = 0.5  # prompt budgets (code, conversation) at COMPACT_PROMPTS and above
+UNATTRIBUTED = '(none)'     # usage outside any room (e.g. a request without room id)
+
+_usage_room: ContextVar[Optional[str]] = ContextVar('usage_room', default=None)
+
+
+class UsageTier(IntEnum):
+    """Degradation steps, each including the ones before it"""
+    NORMAL = 0
+    NO_PROGRESS_CHECKS = 1
+    COMPACT_PROMPTS = 2
+    TEXT_ONLY = 3
+
+
+# Budget utilization at which each tier starts, highest first
+TIER_THRESHOLDS = ((1.0, UsageTier.TEXT_ONLY), (0.85, UsageTier.COMPACT_PROMPTS), (0.7, UsageTier.NO_PROGRESS_CHECKS))
+
+
+@contextmanager
+def usage_scope(room_id: str):
+    """Attribute LLM and TTS usage of the enclosed work (and threads it propagates to) to room_id"""
+    reset = _usage_room.set(room_id)
+    try:
+        yield
+    finally:
+        _usage_room.reset(reset)
+
+
+def current_usage_room() -> Optional[str]:
+    room_id = _usage_room.get()
+    if room_id is None:
+        span = current_span()
+        room_id = span.room_id if span is not None else None
+    return room_id
+
+
+class RollingUsage:
+    """Tokens and TTS characters over the last window seconds, in per-minute buckets"""
+    __slots__ = ('window', 'buckets')
+
+    def __init__(self, window: float):
+        self.window = window
+        self.buckets = deque()  # [bucket start, tokens, tts characters]
+
+    def add(self, now: float, tokens: int = 0, tts_chars: int = 0):
+        start = now - now % BUCKET_SECONDS
+        if self.buckets and self.buckets[-1][0] == start:
+            bucket = self.buckets[-1]
+        else:
+            bucket = [start, 0, 0]
+            self.buckets.append(bucket)
+        bucket[1] += tokens
+        bucket[2] += tts_chars
+
+    def totals(self, now: float) -> Tuple[int, int]:
+        while self.buckets and self.buckets[0][0] + BUCKET_SECONDS <= now - self.window:
+            self.buckets.popleft()
+        return sum(bucket[1] for bucket in self.buckets), sum(bucket[2] for bucket in self.buckets)
+
+
+class UsageAccount:
+    """Rolling and lifetime usage of a room or the deployment"""
+
+    def __init__(self, window: float):
+        self.rolling = RollingUsage(window)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tts_chars = 0
+        self.calls: Dict[str, int] = {}
+        self.last_used = 0.0
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        tokens, tts_chars = self.rolling.totals(now)
+        return {
+            'window_tokens': tokens,
+            'window_tts_chars': tts_chars,
+            'prompt_tokens_total': self.prompt_tokens,
+            'completion_tokens_total': self.completion_tokens,
+            'tts_chars_total': self.tts_chars,
+            'calls': dict(self.calls),
+        }
+
+
+class UsageGovernor:
+    """Per-room and global usage accounting against rolling budgets"""
+
+    def __init__(self, window_seconds: float = 3600, room_token_budget: int = 0, global_token_budget: int = 0,
+                 room_tts_budget: int = 0, global_tts_budget: int = 0):
+        self.window_seconds = window_seconds
+        self.budgets = {
+            'room_tokens': room_token_budget,
+            'global_tokens': global_token_budget,
+            'room_tts_chars': room_tts_budget,
+            'global_tts_chars': global_tts_budget,
+        }
+        # base room_id -> UsageAccount, least recently used first. Not tied to room eviction: an account
+        # outlives its room by at least the window, so emptying and rejoining a room does not reset it
+        limits = room_state_limits()
+        self.max_rooms = limits['max_entries']
+        self.account_ttl = max(window_seconds, limits['ttl_seconds'] or 0)
+        self.rooms: "OrderedDict[str, UsageAccount]" = OrderedDict()
+        self.total = UsageAccount(window_seconds)
+        self._lock = threading.Lock()
+
+    def _accounts(self, room_id: Optional[str], now: float):
+        """The room's account (created or refreshed) and the deployment's; call with the lock held"""
+        room = base_room_id(room_id) if room_id else UNATTRIBUTED
+        account = self.rooms.get(room)
+        if account is None:
+            account = self.rooms[room] = UsageAccount(self.window_seconds)
+        else:
+            self.rooms.move_to_end(room)
+        account.last_used = now
+        while len(self.rooms) > 1 and (len(self.rooms) > self.max_rooms
+                                       or next(iter(self.rooms.values())).last_used < now - self.account_ttl):
+            self.rooms.popitem(last=False)
+        return account, self.total
+
+    def record_completion(self, site: str, prompt_tokens: int, completion_tokens: int, room_id: str = None):
+        """Account one chat completion (room defaults to the current usage scope)"""
+        now = time.time()
+        with self._lock:
+            for account in self._accounts(room_id or current_usage_room(), now):
+                account.rolling.add(now, tokens=prompt_tokens + completion_tokens)
+                account.prompt_tokens += prompt_tokens
+                account.completion_tokens += completion_tokens
+                account.calls[site] = account.calls.get(site, 0) + 1
+
+    def record_tts(self, chars: int, room_id: str = None):
+        """Account one TTS request by its input length"""
+        now = time.time()
+        with self._lock:
+            for account in self._accounts(room_id or current_usage_room(), now):
+                account.rolling.add(now, tts_chars=chars)
+                account.tts_chars += chars
+                account.calls['tts'] = account.calls.get('tts', 0) + 1
+
+    def utilization(self, room_id: str) -> float:
+        """Highest fraction of any configured budget used in the window (0 when all are unlimited)"""
+        now = time.time()
+        with self._lock:
+            account = self.rooms.get(base_room_id(room_id)) if room_id else None
+            room_tokens, room_tts = account.rolling.totals(now) if account else (0, 0)
+            global_tokens, global_tts = self.total.rolling.totals(now)
+        used = ((room_tokens, 'room_tokens'), (global_tokens, 'global_tokens'),
+                (room_tts, 'room_tts_chars'), (global_tts, 'global_tts_chars'))
+        return max((value / self.budgets[name] for value, name in used if self.budgets[name]), default=0.0)
+
+    def tier(self, room_id: str) -> UsageTier:
+        utilization = self.utilization(room_id)
+        for threshold, tier in TIER_THRESHOLDS:
+            if utilization >= threshold:
+                return tier
+        return UsageTier.NORMAL
+
+    def prompt_scale(self, room_id: str) -> float:
+        """Factor for a room's prompt token budgets"""
+        return COMPACT_PROMPT_SCALE if self.tier(room_id) >= UsageTier.COMPACT_PROMPTS else 1.0
+
+    def report(self, room_id: str = None, limit: int = 50) -> Dict[str, Any]:
+        """Usage for /api/usage: deployment totals and the heaviest rooms (or one room)"""
+        now = time.time()
+        with self._lock:
+            if room_id:
+                account = self.rooms.get(base_room_id(room_id))
+                rooms = [(base_room_id(room_id), account.to_dict(now))] if account else []
+            else:
+                rooms = [(room, account.to_dict(now)) for room, account in self.rooms.items()]
+            deployment = self.total.to_dict(now)
+        rooms.sort(key=lambda item: item[1]['window_tokens'], reverse=True)
+        deployment['tier'] = self.tier(None).name
+        return {
+            'window_seconds': self.window_seconds,
+            'budgets': dict(self.budgets),
+            'deployment': deployment,
+            'rooms': [{'room_id': room, 'tier': self.tier(room).name, **usage} for room, usage in rooms[:limit]],
+        }
+
+
+# Global usage governor instance
+usage_governor = None
+_governor_lock = threading.Lock()
+
+def get_usage_governor() -> UsageGovernor:
+    """Get the global usage governor"""
+    global usage_governor
+    if usage_governor is None:
+        with _governor_lock:
+            if usage_governor is None:
+                usage_governor = UsageGovernor(
+                    window_seconds=float(os.environ.get('USAGE_WINDOW_SECONDS', 3600)),
+                    room_token_budget=int(os.environ.get('USAGE_ROOM_TOKEN_BUDGET', 0)),
+                    global_token_budget=int(os.environ.get('USAGE_GLOBAL_TOKEN_BUDGET', 0)),
+                    room_tts_budget=int(os.environ.get('USAGE_ROOM_TTS_CHAR_BUDGET', 0)),
+                    global_tts_budget=int(os.environ.get('USAGE_GLOBAL_TTS_CHAR_BUDGET', 0)),
+                )
+    return usage_governor